@@ -1,19 +1,85 @@
-from flask import Flask
-from flask_pymongo import PyMongo
-from config import Config
-
-mongo = PyMongo()
-
-def create_app():
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    
-    mongo.init_app(app)
-    
-    from app.routes import main
-    from app.auth import auth
-    
-    app.register_blueprint(main)
-    app.register_blueprint(auth)
-    
-    return app
\ No newline at end of file
+import os
+from flask import Flask, current_app
+from flask_pymongo import PyMongo
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from config import Config
+from app.events import EventBroker
+from app.hashing import password_hasher, login_limiter
+from app.instrumentation import Instrumentation
+from app.ingest import SessionIngestor
+from app.timers import TimerTracker
+from app.jobs import JobRunner
+from app.assets import AssetPipeline
+from app.models import subject_cache, period_cache
+
+mongo = PyMongo()
+events = EventBroker()
+ingestor = SessionIngestor()
+timers = TimerTracker()
+jobs = JobRunner()
+assets = AssetPipeline()
+instrumentation = Instrumentation()
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    
+    # Instrumentation first: its listeners are handed to the MongoClient
+    instrumentation.init_app(app)
+    connect_mongo(app)
+    reconnect_after_fork(app)
+    events.init_app(app, mongo)
+    ingestor.init_app(app, mongo)
+    timers.init_app(app, mongo)
+    jobs.init_app(app, mongo)
+    subject_cache.init_app(app)
+    period_cache.init_app(app)
+    password_hasher.init_app(app)
+    login_limiter.init_app(app)
+    assets.init_app(app)
+    
+    from app.routes import main
+    from app.auth import auth
+    
+    app.register_blueprint(main)
+    app.register_blueprint(auth)
+    
+    return app
+
+def mongo_client_options(config):
+    options = {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'readPreference': config['MONGO_READ_PREFERENCE'],
+        'appname': 'studymate',
+        # No sockets or monitor threads until first use, so nothing is
+        # opened in a preforking server's master process
+        'connect': False
+    }
+    if config.get('MONGO_SOCKET_TIMEOUT_MS'):
+        options['socketTimeoutMS'] = config['MONGO_SOCKET_TIMEOUT_MS']
+    if config.get('MONGO_COMPRESSORS'):
+        options['compressors'] = config['MONGO_COMPRESSORS']
+    return options
+
+def connect_mongo(app):
+    instrumentation.pool_monitor.reset()
+    mongo.init_app(app, event_listeners=instrumentation.event_listeners, **mongo_client_options(app.config))
+
+_fork_app = None
+
+def reconnect_after_fork(app):
+    # MongoClient is not fork-safe: give every forked worker its own client
+    global _fork_app
+    if _fork_app is None and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: connect_mongo(_fork_app))
+    _fork_app = app
+
+def analytics_db():
+    # Handle for read-only analytics (progress, dashboard stats) that may be
+    # served by a secondary; writes always go through mongo.db
+    mode = read_pref_mode_from_name(current_app.config['MONGO_ANALYTICS_READ_PREFERENCE'])
+    return mongo.db.with_options(read_preference=make_read_preference(mode, None))
@@ -0,0 +1,124 @@
+import json
+from datetime import date, datetime, timedelta
+from app.models import DailyRollup, period_cache, utc_day
+
+BUCKETS = ('day', 'week', 'month')
+
+def bucket_start(day, unit):
+    # Same boundaries as $dateTrunc in UTC (weeks start on Monday); day keys
+    # are local midnights stored as naive datetimes, so UTC maths is right
+    day = utc_day(day)
+    if unit == 'week':
+        return day - timedelta(days=day.weekday())
+    if unit == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(start, unit):
+    if unit == 'week':
+        return start + timedelta(days=7)
+    if unit == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+def bucket_periods(start, end, unit):
+    """Start of every bucket in [start, end)"""
+    periods = []
+    while start < end:
+        periods.append(start)
+        start = next_bucket(start, unit)
+    return periods
+
+def parse_range(args, max_periods, today):
+    """Whole buckets covering ?from=&to= (YYYY-MM-DD, inclusive, in the
+    user's calendar, whose current day key is `today`); without `from`, the
+    ?days= (default 30) days ending on `to`; raises ValueError"""
+    unit = args.get('bucket', 'day')
+    if unit not in BUCKETS:
+        raise ValueError('bucket must be day, week or month')
+
+    try:
+        days = int(args.get('days', 30))
+    except ValueError:
+        raise ValueError('days must be a whole number')
+    if days < 1:
+        raise ValueError('days must be at least 1')
+
+    try:
+        last = datetime.combine(date.fromisoformat(args['to']), datetime.min.time()) if args.get('to') else today
+        first = datetime.combine(date.fromisoformat(args['from']), datetime.min.time()) if args.get('from') \
+            else last - timedelta(days=days - 1)
+    except ValueError:
+        raise ValueError('from and to must be YYYY-MM-DD dates')
+    if first > last:
+        raise ValueError('from must not be after to')
+
+    start = bucket_start(first, unit)
+    end = next_bucket(bucket_start(last, unit), unit)
+    periods = bucket_periods(start, end, unit)
+    if len(periods) > max_periods:
+        raise ValueError(f'range covers {len(periods)} {unit}s; the limit is {max_periods}')
+    return unit, periods, end
+
+def stream_series(mongo, user_id, subjects, unit, periods, end, today, batch_size=500):
+    """Yield a columnar JSON document in chunks, one subject series at a time.
+
+    Output: {"bucket", "from", "to", "periods": [...], "series": [{"subject_id",
+    "name", "color", "minutes": [...]}], "totals": [...]} with every array
+    aligned to "periods". Periods ending by `today` (the user's day key) are
+    closed and come from period_cache when present; memory holds one series
+    plus the totals, however long the range.
+    """
+    index = {period: i for i, period in enumerate(periods)}
+    closed = {period for period in periods if next_bucket(period, unit) <= today}
+
+    # Query from the first period that is still open or not cached yet
+    cached = period_cache.get(user_id, unit)
+    query_from = next((p for p in periods if p not in closed or p not in cached), None)
+    rows = iter(DailyRollup.get_period_totals(mongo, user_id, query_from, end, unit, batch_size)
+                if query_from is not None else ())
+    from_cache = [p for p in periods if query_from is None or p < query_from]
+    fresh = {p: {} for p in closed if query_from is not None and p >= query_from}
+
+    def record(row):
+        period = row['_id']['period']
+        if period in fresh:
+            fresh[period][row['_id']['subject_id']] = row['minutes']
+
+    yield json.dumps({
+        'bucket': unit,
+        'from': periods[0].strftime('%Y-%m-%d'),
+        'to': (end - timedelta(days=1)).strftime('%Y-%m-%d'),
+        'periods': [p.strftime('%Y-%m-%d') for p in periods]
+    })[:-1] + ', "series": ['
+
+    totals = [0] * len(periods)
+    row = next(rows, None)
+    # Rows arrive ordered by subject_id; ObjectIds sort by creation time
+    for n, subject in enumerate(sorted(subjects, key=lambda s: s['_id'])):
+        minutes = [0] * len(periods)
+        for period in from_cache:
+            minutes[index[period]] = cached[period].get(subject['_id'], 0)
+
+        # Rows of other subjects (filtered out or deleted) are only cached
+        while row is not None and row['_id']['subject_id'] <= subject['_id']:
+            record(row)
+            if row['_id']['subject_id'] == subject['_id'] and row['_id']['period'] in index:
+                minutes[index[row['_id']['period']]] = row['minutes']
+            row = next(rows, None)
+
+        for i, value in enumerate(minutes):
+            totals[i] += value
+        yield (', ' if n else '') + json.dumps({
+            'subject_id': str(subject['_id']),
+            'name': subject['name'],
+            'color': subject['color'],
+            'minutes': minutes
+        })
+
+    while row is not None:
+        record(row)
+        row = next(rows, None)
+    period_cache.update(user_id, unit, fresh)
+
+    yield '], "totals": ' + json.dumps(totals) + '}'
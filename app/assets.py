@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from flask import Blueprint, current_app, request, send_file, abort, url_for
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Bundle name -> sources under app/static, concatenated in order. One
+# stylesheet for every page and one script per page, so a page costs two
+# asset requests, and none once they are cached.
+BUNDLES = {
+    'app.css': ['css/style.css', 'css/dashboard.css'],
+    'base.js': ['js/main.js'],
+    'dashboard.js': ['js/main.js', 'js/dashboard.js'],
+    'progress.js': ['js/main.js', 'js/charts.js'],
+    'timer.js': ['js/main.js', 'js/timer.js']
+}
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+# Most preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+def minify_js(text):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        pass
+    # Without rjsmin: drop indentation, blank lines and whole-line //
+    # comments, leaving template literals exactly as written
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines)
+
+def minify(name, text):
+    return minify_css(text) if name.endswith('.css') else minify_js(text)
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def compressed_variants(data, brotli=None):
+    """(suffix, bytes) for each precompressed variant; .br needs the brotli module"""
+    # mtime=0 keeps the .gz byte-identical across builds
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    return variants
+
+def build(static_folder, bundles=BUNDLES):
+    """Bundle, minify and fingerprint every bundle into static/dist and
+    write the manifest; returns {bundle name: path under static}"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        logger.warning('brotli is not installed; building .gz variants only')
+
+    manifest = {}
+    for name, sources in bundles.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+                parts.append(minify(name, f.read()))
+        # Scripts are joined with ';' in case one does not end a statement
+        data = (';\n' if name.endswith('.js') else '\n').join(parts).encode('utf-8')
+
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist, filename)
+        # Same content, same name: earlier builds' files are left alone so
+        # pages rendered before a deploy keep working
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+            for suffix, compressed in compressed_variants(data, brotli):
+                _write_atomic(path + suffix, compressed)
+        manifest[name] = f'{DIST_DIR}/{filename}'
+
+    _write_atomic(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def is_stale(static_folder, bundles=BUNDLES):
+    # Missing manifest, or a source edited after the last build
+    manifest_path = os.path.join(static_folder, DIST_DIR, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return True
+    built_at = os.path.getmtime(manifest_path)
+    sources = {source for names in bundles.values() for source in names}
+    return any(os.path.getmtime(os.path.join(static_folder, source)) > built_at for source in sources)
+
+assets_bp = Blueprint('assets', __name__)
+
+@assets_bp.route('/static/dist/<path:filename>')
+def dist_file(filename):
+    # Only for when no proxy or CDN sits in front (see ASSETS_URL): the
+    # fingerprinted files never change, so browsers keep them for a year
+    # without revalidating, and the precompressed variant is sent as is
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    path = safe_join(dist, filename)
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+    if path is None or mimetype is None or not os.path.isfile(path):
+        abort(404)
+
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config.get('ASSETS_MAX_AGE', 31536000)}, immutable"
+    return response
+
+class AssetPipeline:
+    # Fingerprinted bundles for the templates: asset_url() takes the same
+    # arguments as url_for() and swaps a bundle name for its hashed file.
+
+    def __init__(self):
+        self.manifest = {}
+        self.base_url = None
+
+    def init_app(self, app):
+        self.base_url = (app.config.get('ASSETS_URL') or '').rstrip('/') or None
+        if is_stale(app.static_folder) and (
+                app.config.get('ASSETS_BUILD_ON_START', True)
+                or not os.path.exists(os.path.join(app.static_folder, DIST_DIR, MANIFEST))):
+            self.manifest = build(app.static_folder)
+        else:
+            with open(os.path.join(app.static_folder, DIST_DIR, MANIFEST), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        app.register_blueprint(assets_bp)
+        app.add_template_global(self.url, 'asset_url')
+
+    def url(self, endpoint, **values):
+        filename = values.get('filename')
+        if endpoint != 'static' or filename not in self.manifest:
+            return url_for(endpoint, **values)
+        if self.base_url:
+            return f'{self.base_url}/{self.manifest[filename]}'
+        return url_for('static', **dict(values, filename=self.manifest[filename]))
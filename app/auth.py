@@ -1,46 +1,65 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
-from app.forms import LoginForm, RegisterForm
-from app.models import User
-from app import mongo
-
-auth = Blueprint('auth', __name__)
-
-@auth.route('/login', methods=['GET', 'POST'])
-def login():
-    if 'user_id' in session:
-        return redirect(url_for('main.dashboard'))
-    
-    form = LoginForm()
-    if form.validate_on_submit():
-        user = User.find_by_email(mongo.db, form.email.data)
-        if user and User.verify_password(user['password_hash'], form.password.data):
-            session['user_id'] = str(user['_id'])
-            session['user_name'] = user['name']
-            flash('Login successful!', 'success')
-            return redirect(url_for('main.dashboard'))
-        else:
-            flash('Invalid email or password', 'error')
-    
-    return render_template('login.html', form=form)
-
-@auth.route('/register', methods=['GET', 'POST'])
-def register():
-    if 'user_id' in session:
-        return redirect(url_for('main.dashboard'))
-    
-    form = RegisterForm()
-    if form.validate_on_submit():
-        if User.find_by_email(mongo.db, form.email.data):
-            flash('Email already registered', 'error')
-        else:
-            User.create_user(mongo.db, form.email.data, form.password.data, form.name.data)
-            flash('Registration successful! Please login.', 'success')
-            return redirect(url_for('auth.login'))
-    
-    return render_template('register.html', form=form)
-
-@auth.route('/logout')
-def logout():
-    session.clear()
-    flash('You have been logged out.', 'info')
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from app.forms import LoginForm, RegisterForm, TIMEZONES
+from app.models import User, DEFAULT_TIMEZONE
+from app.hashing import password_hasher, login_limiter, HashingBusy
+from app import mongo
+
+auth = Blueprint('auth', __name__)
+
+@auth.route('/login', methods=['GET', 'POST'])
+def login():
+    if 'user_id' in session:
+        return redirect(url_for('main.dashboard'))
+    
+    form = LoginForm()
+    if form.validate_on_submit():
+        with login_limiter.acquire(request.remote_addr, form.email.data) as allowed:
+            try:
+                if not allowed:
+                    raise HashingBusy()
+                
+                user = User.find_credentials(mongo.db, form.email.data)
+                if user and User.verify_password(user['password_hash'], form.password.data):
+                    # Upgrade hashes made with an older cost factor
+                    if password_hasher.needs_rehash(user['password_hash']):
+                        User.update_password_hash(mongo.db, user['_id'], password_hasher.hash(form.password.data))
+                    
+                    session['user_id'] = str(user['_id'])
+                    session['user_name'] = user['name']
+                    session['timezone'] = user.get('timezone', DEFAULT_TIMEZONE)
+                    flash('Login successful!', 'success')
+                    return redirect(url_for('main.dashboard'))
+                else:
+                    flash('Invalid email or password', 'error')
+            except HashingBusy:
+                flash('Too many login attempts right now. Please try again in a moment.', 'error')
+                return render_template('login.html', form=form), 429
+    
+    return render_template('login.html', form=form)
+
+@auth.route('/register', methods=['GET', 'POST'])
+def register():
+    if 'user_id' in session:
+        return redirect(url_for('main.dashboard'))
+    
+    form = RegisterForm()
+    if form.validate_on_submit():
+        if User.email_exists(mongo.db, form.email.data):
+            flash('Email already registered', 'error')
+        else:
+            try:
+                tz_name = form.timezone.data if form.timezone.data in TIMEZONES else DEFAULT_TIMEZONE
+                User.create_user(mongo.db, form.email.data, form.password.data, form.name.data, tz_name)
+            except HashingBusy:
+                flash('We are busy right now. Please try again in a moment.', 'error')
+                return render_template('register.html', form=form), 429
+            flash('Registration successful! Please login.', 'success')
+            return redirect(url_for('auth.login'))
+    
+    return render_template('register.html', form=form)
+
+@auth.route('/logout')
+def logout():
+    session.clear()
+    flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
\ No newline at end of file
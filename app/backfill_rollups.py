@@ -0,0 +1,31 @@
+from app import create_app, mongo
+from app.models import DailyRollup
+import sys
+
+def backfill_rollups(batch_size=1000):
+    """Rebuild the daily_rollups collection from existing study sessions"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("Rebuilding daily rollups from study sessions...")
+            written = DailyRollup.rebuild(mongo.db, batch_size=batch_size)
+            print(f"✓ Wrote {written} rollup document(s)")
+            
+            print("\n" + "="*50)
+            print("✅ Rollup backfill completed successfully!")
+            print("="*50)
+            return True
+        except Exception as e:
+            print(f"❌ Error during rollup backfill: {e}")
+            print("Please check your MongoDB connection and try again.")
+            return False
+
+if __name__ == '__main__':
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    
+    print("Starting StudyMate Rollup Backfill...")
+    print("="*50)
+    
+    if not backfill_rollups(batch_size):
+        sys.exit(1)
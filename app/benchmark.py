@@ -0,0 +1,501 @@
+from app import create_app, mongo, timers
+from app.init_db import init_database, mock_database, resolve_collection
+from app.models import Leaderboard, User
+from app.seed_data import seed_database, SEED_PASSWORD
+from app.timers import MongoTimerStore
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import monitoring
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ENDPOINTS = ['dashboard', 'progress', 'dashboard_stats', 'stop_timer', 'login']
+
+# How long each stopped timer has run, so every stop saves a session
+STOP_TIMER_MINUTES = 25
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COUNTED_OPERATIONS = {
+    'find', 'find_one', 'aggregate', 'count_documents', 'insert_one', 'insert_many',
+    'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many', 'bulk_write',
+    'find_one_and_update', 'find_one_and_delete'
+}
+
+class RoundTripCounter(monitoring.CommandListener):
+    # Mongo commands issued by the current thread; the test client serves each
+    # request on the calling thread, so this is the per-request count
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def increment(self):
+        self._local.count = self.count + 1
+
+    def started(self, event):
+        self.increment()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class CountingHandle:
+    # mongomock emits no command events, so count calls on the handle instead
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in COUNTED_OPERATIONS:
+            def counted(*args, **kwargs):
+                self._counter.increment()
+                return attr(*args, **kwargs)
+            return counted
+        if name == 'with_options':
+            return lambda *args, **kwargs: CountingHandle(attr(*args, **kwargs), self._counter)
+        if type(attr).__module__.startswith('mongomock') and hasattr(attr, 'find'):
+            return CountingHandle(attr, self._counter)
+        return attr
+
+    def __getitem__(self, name):
+        return CountingHandle(self._target[name], self._counter)
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path, headers=None):
+        response = self.client.get(path, headers=headers)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post_form(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+    def post_json(self, path, payload):
+        response = self.client.post(path, json=payload)
+        return response.status_code, response.get_data(as_text=True)
+
+    def login_form(self, email):
+        return {'email': email, 'password': SEED_PASSWORD}
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace')
+
+    def get(self, path, headers=None):
+        return self._open(urllib.request.Request(self.base_url + path, headers=headers or {}))
+
+    def post_form(self, path, data):
+        body = urllib.parse.urlencode(data).encode('utf-8')
+        return self._open(urllib.request.Request(self.base_url + path, data=body))
+
+    def post_json(self, path, payload):
+        return self._open(urllib.request.Request(
+            self.base_url + path, data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        ))
+
+    def login_form(self, email):
+        # The login form is CSRF protected when served for real
+        _, page = self.get('/login')
+        match = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        form = {'email': email, 'password': SEED_PASSWORD}
+        if match:
+            form['csrf_token'] = match.group(1)
+        return form
+
+def start_server(mode, port, timeout=30):
+    """Run run.py in SERVER_MODE `mode` on `port`; returns the process once it listens"""
+    env = dict(os.environ, SERVER_MODE=mode, SERVER_HOST='127.0.0.1', SERVER_PORT=str(port))
+    process = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{mode} server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start listening on port {port}')
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def percentile(ordered, q):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summarize(latencies, errors, elapsed, round_trips):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': _ms(percentile(ordered, 50)),
+        'p95_ms': _ms(percentile(ordered, 95)),
+        'p99_ms': _ms(percentile(ordered, 99)),
+        'mean_ms': _ms(sum(ordered) / len(ordered)) if ordered else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mongo_round_trips': round(sum(round_trips) / len(round_trips), 2) if round_trips else None
+    }
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+class Benchmark:
+    def __init__(self, make_session, emails, counter=None, requests=200, concurrency=4, warmup=5,
+                 timer_store=None, user_ids=None):
+        self.make_session = make_session
+        self.emails = emails
+        self.counter = counter
+        # The server's timer store and {email: user_id}, to backdate timers
+        self.timer_store = timer_store
+        self.user_ids = user_ids or {}
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+
+    def logged_in(self, index):
+        session = self.make_session()
+        email = self.emails[index % len(self.emails)]
+        session.post_form('/login', session.login_form(email))
+        _, page = session.get('/timer')
+        subject_ids = re.findall(r'<option value="([0-9a-f]{24})"', page)
+        return session, subject_ids
+
+    def request_for(self, endpoint, index):
+        # Returns (prepare, send): prepare runs untimed, send is measured
+        if endpoint == 'login':
+            def prepare():
+                session = self.make_session()
+                return session, session.login_form(self.emails[index % len(self.emails)])
+            return prepare, lambda state: state[0].post_form('/login', state[1])
+
+        session, subject_ids = self.logged_in(index)
+        if endpoint == 'stop_timer':
+            # Stopping needs a running server-side timer: start a fresh one
+            # untimed, then time the stop, as timer.js does. The timer is
+            # backdated so the stop saves a real session (insert, rollups,
+            # leaderboards, goals) instead of a 0-minute no-op.
+            user_id = self.user_ids.get(self.emails[index % len(self.emails)])
+            def start():
+                timer_id = str(ObjectId())
+                session.post_json('/api/start_timer', {
+                    'timer_id': timer_id,
+                    'subject_id': subject_ids[0] if subject_ids else None,
+                    'duration': STOP_TIMER_MINUTES
+                })
+                if self.timer_store is not None and user_id is not None:
+                    started = datetime.utcnow() - timedelta(minutes=STOP_TIMER_MINUTES)
+                    self.timer_store.update(user_id, {'timer_id': timer_id},
+                                            {'started_at': started, 'running_since': started})
+                return timer_id
+            return start, lambda timer_id: session.post_json('/api/stop_timer', {'timer_id': timer_id})
+        path = {'dashboard': '/dashboard', 'progress': '/progress',
+                'dashboard_stats': '/api/dashboard_stats'}[endpoint]
+        return lambda: None, lambda _: session.get(path)
+
+    def open_streams(self, count):
+        # Idle dashboard streams held open while the endpoints are measured,
+        # the way open dashboards sit on a server; only HttpSession can do this
+        streams = []
+        for index in range(count):
+            session, _ = self.logged_in(index)
+            streams.append(session.opener.open(session.base_url + '/api/stream/dashboard', timeout=60))
+        return streams
+
+    def run_endpoint(self, endpoint):
+        latencies = []
+        round_trips = []
+        errors = [0]
+        lock = threading.Lock()
+        per_worker = [self.requests // self.concurrency + (1 if i < self.requests % self.concurrency else 0)
+                      for i in range(self.concurrency)]
+
+        def worker(index, count):
+            prepare, send = self.request_for(endpoint, index)
+            for _ in range(self.warmup):
+                send(prepare())
+            for _ in range(count):
+                state = prepare()
+                if self.counter:
+                    self.counter.reset()
+                started = time.perf_counter()
+                status, _ = send(state)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if self.counter:
+                        round_trips.append(self.counter.count)
+                    if status >= 400:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_worker) if n]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, errors[0], time.perf_counter() - started, round_trips)
+
+    def run(self, endpoints=ENDPOINTS):
+        results = {}
+        for endpoint in endpoints:
+            results[endpoint] = self.run_endpoint(endpoint)
+            print(format_row(endpoint, results[endpoint]))
+        return results
+
+def benchmark_leaderboard(db, sizes, lookups=200, batch_size=10000, seed=42):
+    """Rank lookup latency on synthetic weekly boards of each size.
+
+    Compares Leaderboard.count_above (histogram, cost independent of the
+    user count) with counting higher scores directly (grows with the rank).
+    """
+    rng = random.Random(seed)
+    scores = resolve_collection(db, 'leaderboard_scores')
+    width = Leaderboard.BUCKETS['weekly']
+    results = {}
+    for size in sizes:
+        board = f'weekly:bench-{size}'
+        scores.delete_many({'board': board})
+        print(f"  Filling {board} with {size} entries...")
+        # Skewed like real weekly minutes: most users study a little
+        for start in range(0, size, batch_size):
+            scores.insert_many([{
+                'board': board, 'user_id': ObjectId(), 'day': None,
+                'score': min(int(rng.expovariate(1 / 300)) + 1, 7 * 24 * 60), 'writes': 1
+            } for _ in range(min(batch_size, size - start))])
+        Leaderboard.rebuild_counts(db, board, {'board': board}, width)
+
+        probes = [min(int(rng.expovariate(1 / 300)) + 1, 7 * 24 * 60) for _ in range(lookups)]
+        timings = {'histogram': [], 'count_documents': []}
+        for score in probes:
+            started = time.perf_counter()
+            Leaderboard.count_above(db, [board], width, score)
+            timings['histogram'].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            scores.count_documents({'board': board, 'score': {'$gt': score}})
+            timings['count_documents'].append(time.perf_counter() - started)
+
+        results[size] = {}
+        for method, latencies in timings.items():
+            ordered = sorted(latencies)
+            results[size][method] = {'p50_ms': _ms(percentile(ordered, 50)), 'p95_ms': _ms(percentile(ordered, 95))}
+        print(f"  {size:>10} users  histogram p50 {results[size]['histogram']['p50_ms']:>8} ms "
+              f"p95 {results[size]['histogram']['p95_ms']:>8} ms  |  count_documents "
+              f"p50 {results[size]['count_documents']['p50_ms']:>8} ms p95 {results[size]['count_documents']['p95_ms']:>8} ms")
+
+        scores.delete_many({'board': board})
+        resolve_collection(db, 'leaderboard_counts').delete_many({'board': board})
+    return results
+
+def format_row(endpoint, result):
+    trips = result['mongo_round_trips']
+    return (f"  {endpoint:<16} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+            f"p99 {result['p99_ms']:>8} ms  {result['throughput_rps']:>8} req/s  "
+            f"mongo {trips if trips is not None else '-':>6}  errors {result['errors']}")
+
+def compare(previous, current, tolerance):
+    """Print regressions against an earlier results file; True if none"""
+    ok = True
+    for endpoint, now in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            print(f"❌ {endpoint}: p95 {before['p95_ms']} ms -> {now['p95_ms']} ms")
+            ok = False
+        if before['mongo_round_trips'] is not None and now['mongo_round_trips'] is not None \
+                and now['mongo_round_trips'] > before['mongo_round_trips']:
+            print(f"❌ {endpoint}: mongo round trips {before['mongo_round_trips']} -> {now['mongo_round_trips']}")
+            ok = False
+    if ok:
+        print("✓ No regressions against the previous run")
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark StudyMate routes')
+    parser.add_argument('--url', help='benchmark a running server over HTTP instead of the test client')
+    parser.add_argument('--mock', action='store_true', help='use an in-memory mongomock database')
+    parser.add_argument('--seed', action='store_true', help='seed synthetic data before running')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--subjects', type=int, default=4)
+    parser.add_argument('--sessions', type=int, default=200, help='sessions per user')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown (0.2 = 20%%)')
+    parser.add_argument('--serve-modes', help='start run.py in each SERVER_MODE (e.g. threaded,gevent) and compare')
+    parser.add_argument('--port', type=int, default=5055, help='port for --serve-modes servers')
+    parser.add_argument('--streams', type=int, default=0, help='dashboard streams held open during an HTTP run')
+    parser.add_argument('--leaderboard', help='only time rank lookups on boards of these sizes (e.g. 1000,100000,1000000)')
+    args = parser.parse_args()
+
+    if (args.url or args.serve_modes) and args.mock:
+        parser.error('--mock only works with the in-process test client')
+    if args.url and args.serve_modes:
+        parser.error('--url and --serve-modes are mutually exclusive')
+    if args.streams and not (args.url or args.serve_modes):
+        parser.error('--streams needs an HTTP server (--url or --serve-modes)')
+    if 'stop_timer' in args.endpoints.split(',') and args.concurrency > args.users:
+        # A user has one timer: workers sharing a user would stop each other's
+        parser.error('stop_timer needs at least as many --users as --concurrency')
+
+    if args.leaderboard:
+        app = create_app()
+        with app.app_context():
+            db = mock_database() if args.mock else mongo.db
+            init_database(db)
+            print(f"\nBenchmarking leaderboard rank lookups ({args.requests} per size)")
+            print("="*50)
+            sizes = [int(size) for size in args.leaderboard.split(',') if size]
+            results = {'meta': {'timestamp': datetime.utcnow().isoformat(), 'mock': args.mock},
+                       'leaderboard': benchmark_leaderboard(db, sizes, args.requests)}
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+        sys.exit(0)
+
+    counter = RoundTripCounter()
+    if not args.url and not args.mock:
+        # Must be registered before create_app builds the MongoClient
+        monitoring.register(counter)
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        if args.mock:
+            db = mock_database()
+            init_database(db)
+            mongo.db = CountingHandle(db, counter)
+        else:
+            db = mongo.db
+
+        emails = [f'bench-user-{i}@example.com' for i in range(args.users)]
+        if args.seed or args.mock:
+            print(f"Seeding {args.users} user(s) x {args.subjects} subject(s) x {args.sessions} session(s)...")
+            emails = seed_database(db, args.users, args.subjects, args.sessions)
+        user_ids = {}
+        for email in emails:
+            user = User.find_by_email(db, email, {'_id': 1})
+            if user is not None:
+                user_ids[email] = user['_id']
+
+    endpoints = [e for e in args.endpoints.split(',') if e]
+
+    def run_http(url, label):
+        print(f"\nBenchmarking {label} ({args.requests} requests, concurrency {args.concurrency}, "
+              f"{args.streams} open stream(s))")
+        print("="*50)
+        # A server with TIMER_STORE = 'local' keeps its timers out of reach, so
+        # its stop_timer requests save nothing
+        timer_store = MongoTimerStore(mongo) if app.config['TIMER_STORE'] != 'local' else None
+        benchmark = Benchmark(lambda: HttpSession(url), emails, None, args.requests, args.concurrency, args.warmup,
+                              timer_store, user_ids)
+        streams = benchmark.open_streams(args.streams)
+        try:
+            return benchmark.run(endpoints)
+        finally:
+            for stream in streams:
+                stream.close()
+
+    modes = {}
+    if args.serve_modes:
+        for mode in [m for m in args.serve_modes.split(',') if m]:
+            process = start_server(mode, args.port)
+            try:
+                modes[mode] = run_http(f'http://127.0.0.1:{args.port}', f'run.py in {mode} mode')
+            finally:
+                stop_server(process)
+        # The first mode is the baseline the others are compared with
+        endpoint_results = next(iter(modes.values()), {})
+    elif args.url:
+        endpoint_results = run_http(args.url, args.url)
+    else:
+        print(f"\nBenchmarking test client ({args.requests} requests, concurrency {args.concurrency})")
+        print("="*50)
+        benchmark = Benchmark(lambda: TestClientSession(app), emails, counter,
+                              args.requests, args.concurrency, args.warmup, timers.store, user_ids)
+        endpoint_results = benchmark.run(endpoints)
+
+    results = {
+        'meta': {
+            'target': args.url or args.serve_modes or ('test client (mongomock)' if args.mock else 'test client'),
+            'timestamp': datetime.utcnow().isoformat(),
+            'users': args.users,
+            'subjects': args.subjects,
+            'sessions': args.sessions,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'streams': args.streams
+        },
+        'endpoints': endpoint_results
+    }
+    if modes:
+        results['modes'] = modes
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+    if len(modes) > 1:
+        baseline, *others = modes
+        for mode in others:
+            print(f"\n{mode} vs {baseline}:")
+            compare({'endpoints': modes[baseline]}, {'endpoints': modes[mode]}, args.tolerance)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(json.load(f), results, args.tolerance):
+                sys.exit(1)
@@ -0,0 +1,28 @@
+from app.assets import build, BUNDLES
+import logging
+import os
+import sys
+
+def build_assets():
+    """Bundle, minify and fingerprint the static assets into app/static/dist"""
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    try:
+        manifest = build(static_folder)
+    except OSError as e:
+        print(f"❌ Error building assets: {e}")
+        return False
+    
+    for name in sorted(BUNDLES):
+        path = os.path.join(static_folder, manifest[name])
+        variants = ', '.join(f"{suffix} {os.path.getsize(path + suffix)} bytes"
+                             for suffix in ('.br', '.gz') if os.path.exists(path + suffix))
+        print(f"✓ {name} -> {manifest[name]} ({os.path.getsize(path)} bytes; {variants})")
+    return True
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s')
+    
+    print("Starting StudyMate Asset Build...")
+    print("="*50)
+    
+    sys.exit(0 if build_assets() else 1)
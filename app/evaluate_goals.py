@@ -0,0 +1,40 @@
+from app import create_app, mongo
+from app.models import Goal
+import argparse
+import sys
+import time
+
+def evaluate_goals(horizon_days=3, grace_days=1, batch_size=1000):
+    """Recount the progress of goals due soon from the daily rollups; runs
+    in an app context"""
+    try:
+        print(f"Re-evaluating goals due from {grace_days} day(s) ago to {horizon_days} day(s) ahead...")
+        checked, changed = Goal.reevaluate(mongo.db, horizon_days=horizon_days,
+                                           grace_days=grace_days, batch_size=batch_size)
+        print(f"✓ Checked {checked} goal(s), corrected {changed}")
+        return True
+    except Exception as e:
+        print(f"❌ Error during goal evaluation: {e}")
+        print("Please check your MongoDB connection and try again.")
+        return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Correct drift in the incrementally kept goal progress')
+    parser.add_argument('--horizon-days', type=int, default=3, help='goals due up to N days ahead')
+    parser.add_argument('--grace-days', type=int, default=1,
+                        help='goals due up to N days ago, for sessions uploaded late')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--every', type=int, help='keep running, evaluating every N seconds')
+    args = parser.parse_args()
+    
+    print("Starting StudyMate Goal Evaluation...")
+    print("="*50)
+    
+    # One app (and so one MongoClient) for every pass
+    app = create_app()
+    with app.app_context():
+        while True:
+            ok = evaluate_goals(args.horizon_days, args.grace_days, args.batch_size)
+            if not args.every:
+                sys.exit(0 if ok else 1)
+            time.sleep(args.every)
@@ -0,0 +1,105 @@
+import queue
+import threading
+from datetime import datetime
+
+class LocalBroker:
+    # In-process pub/sub: fans events out to every subscriber in this worker.
+    # Good enough for a single process and for tests.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.setdefault(str(user_id), set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(str(user_id))
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[str(user_id)]
+
+    def publish(self, user_id, payload):
+        self._deliver(str(user_id), payload)
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(str(user_id), ()))
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def _deliver(self, user_id, payload):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(payload)
+            except queue.Full:
+                # A stalled client only misses intermediate updates
+                pass
+
+class MongoBroker(LocalBroker):
+    # Cross-process pub/sub: events are inserted into a Mongo collection and
+    # every worker tails it with a change stream (requires a replica set).
+
+    def __init__(self, mongo):
+        super().__init__()
+        self.mongo = mongo
+        self._watcher = None
+
+    @property
+    def collection(self):
+        # Looked up on use: a forked worker reconnects with a new client
+        return self.mongo.db.dashboard_events
+
+    def subscribe(self, user_id):
+        # Start lazily so the thread is created after a preforking server forks
+        self._ensure_watcher()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, payload):
+        self.collection.insert_one({
+            'user_id': str(user_id),
+            'payload': payload,
+            'created_at': datetime.utcnow()
+        })
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name='dashboard-events', daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.collection.watch(pipeline) as stream:
+            for change in stream:
+                event = change['fullDocument']
+                self._deliver(event['user_id'], event['payload'])
+
+class EventBroker:
+    # Flask extension wrapper, configured like PyMongo through init_app
+
+    def __init__(self):
+        self.backend = LocalBroker()
+
+    def init_app(self, app, mongo=None):
+        if app.config.get('EVENT_BROKER', 'local') == 'mongo':
+            self.backend = MongoBroker(mongo)
+        else:
+            self.backend = LocalBroker()
+
+    def subscribe(self, user_id):
+        return self.backend.subscribe(user_id)
+
+    def unsubscribe(self, user_id, subscription):
+        self.backend.unsubscribe(user_id, subscription)
+
+    def publish(self, user_id, payload):
+        self.backend.publish(user_id, payload)
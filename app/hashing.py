@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+import bcrypt
+
+class HashingBusy(Exception):
+    # Raised when the hashing pool is saturated; callers answer 429
+    pass
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+def _gevent_threadpool():
+    # Under gevent the process pool's helper threads become greenlets and can
+    # stall the hub; bcrypt releases the GIL, so gevent's OS thread pool is
+    # used instead
+    try:
+        from gevent import monkey, get_hub
+    except ImportError:
+        return None
+    return get_hub().threadpool if monkey.is_module_patched('threading') else None
+
+def _pool_context():
+    # Never fork the pool processes straight from a web worker: it has
+    # threads by then, and a child can inherit a lock one of them held
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+class PasswordHasher:
+    # bcrypt off the request threads: jobs run in a small process pool and
+    # at most BCRYPT_MAX_PENDING may be queued or running at once, so a burst
+    # of logins cannot take every CPU away from the rest of the app.
+
+    def __init__(self):
+        self.rounds = 12
+        self.pool_size = 0
+        self.max_pending = 16
+        self.timeout = 10
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.pool_size = app.config.get('BCRYPT_POOL_SIZE', 0)
+        self.max_pending = app.config.get('BCRYPT_MAX_PENDING', 16)
+        self.timeout = app.config.get('BCRYPT_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds)
+
+    def verify(self, hashed, password):
+        return self._run(_checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<rounds>$<salt+digest>
+        try:
+            return int(hashed.split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            if not self.pool_size:
+                return func(*args)
+            threadpool = _gevent_threadpool()
+            if threadpool is not None:
+                return threadpool.apply(func, args)
+            future = self._get_pool().submit(func, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise HashingBusy()
+        finally:
+            self._slots.release()
+
+    def _get_pool(self):
+        # One pool per process; a forked worker must not reuse its parent's
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size, mp_context=_pool_context())
+                self._pool_pid = pid
+            return self._pool
+
+class ConcurrencyLimiter:
+    # Caps simultaneous operations per key (client IP, email address, ...)
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key):
+        with self._lock:
+            if self._active.get(key, 0) >= self.limit:
+                return False
+            self._active[key] = self._active.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            remaining = self._active.get(key, 0) - 1
+            if remaining > 0:
+                self._active[key] = remaining
+            else:
+                self._active.pop(key, None)
+
+class LoginLimiter:
+    # Per-IP and per-email limits on logins being checked at the same time
+
+    def __init__(self):
+        self.by_ip = ConcurrencyLimiter(4)
+        self.by_email = ConcurrencyLimiter(1)
+
+    def init_app(self, app):
+        self.by_ip = ConcurrencyLimiter(app.config.get('LOGIN_MAX_CONCURRENT_PER_IP', 4))
+        self.by_email = ConcurrencyLimiter(app.config.get('LOGIN_MAX_CONCURRENT_PER_EMAIL', 1))
+
+    @contextmanager
+    def acquire(self, ip, email):
+        email = (email or '').strip().lower()
+        if not self.by_ip.try_acquire(ip):
+            yield False
+            return
+        if not self.by_email.try_acquire(email):
+            self.by_ip.release(ip)
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.by_email.release(email)
+            self.by_ip.release(ip)
+
+password_hasher = PasswordHasher()
+login_limiter = LoginLimiter()
@@ -0,0 +1,361 @@
+import atexit
+import glob
+import logging
+import os
+import re
+import threading
+import time
+from bson import json_util
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from app.models import StudySession, DEFAULT_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# Round-trip ObjectIds and naive UTC datetimes through the spool unchanged
+SPOOL_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+# sessions-<pid>-<segment>.jsonl (or sessions-<pid>.jsonl from older builds)
+SPOOL_NAME = re.compile(r'sessions-(\d+)(?:-\d+)?\.jsonl$')
+
+def lock_path(spool_dir, pid):
+    return os.path.join(spool_dir, f'sessions-{pid}.lock')
+
+class SessionIngestor:
+    # Write path for completed study sessions.
+    #
+    # In 'sync' mode every session is inserted on the request thread. In
+    # 'batched' mode a session is appended to a local spool file (so it
+    # survives a crash once acknowledged) and a background flusher writes
+    # the queue with insert_many/bulk_write whenever INGEST_BATCH_SIZE
+    # sessions are waiting or INGEST_FLUSH_INTERVAL seconds have passed.
+    #
+    # The spool has its own lock, and the fsync runs outside it as a group
+    # commit: requests that append while one fsync is under way share the
+    # next. Before each flush the spool moves on to a new segment file, and
+    # a segment is deleted once every session in it is flushed, so the spool
+    # is never rewritten.
+
+    def __init__(self):
+        self.app = None
+        self.mongo = None
+        self.mode = 'sync'
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.spool_dir = None
+        self.spool_fsync = True
+        self._listeners = []
+        self._lock = threading.Condition()
+        self._pending = []
+        self._pid = None
+        self._flusher = None
+        self._spool_lock = threading.Condition()
+        self._spool_file = None
+        self._spool_path = None
+        self._spool_seq = 0
+        self._segment_ids = set()
+        self._segments = []
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._owner_lock = None
+        self._stopping = False
+        self._reset_metrics()
+
+    def init_app(self, app, mongo):
+        self.app = app
+        self.mongo = mongo
+        self.mode = app.config.get('INGEST_MODE', 'sync')
+        self.batch_size = app.config.get('INGEST_BATCH_SIZE', 500)
+        self.flush_interval = app.config.get('INGEST_FLUSH_INTERVAL', 1.0)
+        self.spool_dir = app.config.get('INGEST_SPOOL_DIR') or os.path.join(app.instance_path, 'spool')
+        self.spool_fsync = app.config.get('INGEST_SPOOL_FSYNC', True)
+
+    def on_flush(self, func):
+        # Register func(user_ids), called in an app context after sessions land
+        self._listeners.append(func)
+        return func
+
+    def submit(self, user_id, subject_id, duration_minutes, client_id=None, tz_name=DEFAULT_TIMEZONE):
+        # client_id makes the write idempotent: a repeat is dropped as a duplicate
+        if self.mode != 'batched':
+            if StudySession.create_session(self.mongo.db, user_id, subject_id, duration_minutes,
+                                           client_id=client_id, tz_name=tz_name) is not None:
+                self._notify({str(user_id)})
+            return
+
+        session = StudySession.build_session(user_id, subject_id, duration_minutes, client_id=client_id,
+                                             tz_name=tz_name)
+        self._ensure_started()
+        # Durable before it is queued, and so before the request is answered
+        self._sync_spool(self._append_spool([session]))
+        with self._lock:
+            self._pending.append(session)
+            if len(self._pending) >= self.batch_size:
+                self._lock.notify()
+
+    def flush(self):
+        # Write everything queued so far on the calling thread
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+            if not batch or not self._flush(batch):
+                return
+
+    def stats(self):
+        with self._lock:
+            batches = self._metrics['batches']
+            return {
+                'mode': self.mode,
+                'pending': len(self._pending),
+                'batches': batches,
+                'sessions': self._metrics['sessions'],
+                'failures': self._metrics['failures'],
+                'last_batch_size': self._metrics['last_batch_size'],
+                'avg_batch_size': round(self._metrics['sessions'] / batches, 1) if batches else 0,
+                'last_flush_ms': round(self._metrics['last_flush_seconds'] * 1000, 2),
+                'avg_flush_ms': round(self._metrics['flush_seconds'] / batches * 1000, 2) if batches else 0,
+                'max_flush_ms': round(self._metrics['max_flush_seconds'] * 1000, 2)
+            }
+
+    def _reset_metrics(self):
+        self._metrics = {
+            'batches': 0,
+            'sessions': 0,
+            'failures': 0,
+            'last_batch_size': 0,
+            'last_flush_seconds': 0.0,
+            'flush_seconds': 0.0,
+            'max_flush_seconds': 0.0
+        }
+
+    def _ensure_started(self):
+        # Started lazily (and again in a forked child) so every worker
+        # process gets its own spool file and flusher thread
+        pid = os.getpid()
+        if self._pid == pid and self._flusher and self._flusher.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == pid and self._flusher and self._flusher.is_alive():
+                return
+
+            self._pid = pid
+            self._pending = []
+            self._stopping = False
+            self._reset_metrics()
+            os.makedirs(self.spool_dir, exist_ok=True)
+            # Locked before any segment exists, so no one sees one unowned
+            if self._owner_lock is None or self._owner_lock.name != lock_path(self.spool_dir, pid):
+                self._owner_lock = self._lock_owner(self.spool_dir, pid)
+            sessions, claimed = self._recover_spools()
+            with self._spool_lock:
+                self._segments = []
+                self._written = self._synced = 0
+                self._syncing = False
+                self._open_segment()
+            if sessions:
+                self._sync_spool(self._append_spool(sessions))
+                self._pending.extend(sessions)
+            for path in claimed:
+                os.remove(path)
+
+            self._flusher = threading.Thread(target=self._run, name='session-ingest', daemon=True)
+            self._flusher.start()
+            atexit.register(self._shutdown)
+
+    @staticmethod
+    def _lock_owner(spool_dir, pid):
+        # Exclusive flock on the pid's .lock file, held by the owning process
+        # for its lifetime and dropped by the OS when it dies; None if
+        # another process holds it (or there is no flock)
+        if fcntl is None:
+            return None
+        lock_file = open(lock_path(spool_dir, pid), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _recover_spools(self):
+        # Sessions acknowledged by workers that died before flushing, and the
+        # claimed files holding them (removed once re-spooled). A spool whose
+        # owner lock can be taken belongs to a dead process, however recently
+        # it was written; a live one, however idle, keeps its lock. Segments
+        # already here under this pid were left by an earlier process (or
+        # flusher) with the same pid. Files are claimed with an atomic rename
+        # so only one worker gets them.
+        if fcntl is None:
+            logger.warning('No flock on this platform; leaving other workers\' spools in %s alone',
+                           self.spool_dir)
+            return [], []
+        owners = {}
+        for path in glob.glob(os.path.join(self.spool_dir, 'sessions-*.jsonl')):
+            match = SPOOL_NAME.search(path)
+            if match:
+                owners.setdefault(int(match.group(1)), []).append(path)
+
+        sessions = []
+        claimed = []
+        for pid, paths in owners.items():
+            owner_lock = None
+            if pid != self._pid:
+                owner_lock = self._lock_owner(self.spool_dir, pid)
+                if owner_lock is None:
+                    continue
+            for path in paths:
+                claimed_path = f'{path}.recovering'
+                try:
+                    os.rename(path, claimed_path)
+                except OSError:
+                    continue
+                with open(claimed_path, encoding='utf-8') as f:
+                    recovered = [json_util.loads(line, json_options=SPOOL_JSON_OPTIONS) for line in f if line.strip()]
+                sessions.extend(recovered)
+                claimed.append(claimed_path)
+                logger.info('Recovered %d spooled session(s) from %s', len(recovered), path)
+            if owner_lock is not None:
+                os.remove(owner_lock.name)
+                owner_lock.close()
+        return sessions, claimed
+
+    def _open_segment(self):
+        # Caller holds _spool_lock
+        self._spool_seq += 1
+        self._spool_path = os.path.join(self.spool_dir, f'sessions-{self._pid}-{self._spool_seq}.jsonl')
+        self._spool_file = open(self._spool_path, 'a', encoding='utf-8')
+        self._segment_ids = set()
+
+    def _append_spool(self, sessions):
+        # Buffered append; returns the write's sequence number, durable once
+        # _sync_spool has been called with it
+        lines = ''.join(json_util.dumps(s, json_options=SPOOL_JSON_OPTIONS) + '\n' for s in sessions)
+        with self._spool_lock:
+            self._spool_file.write(lines)
+            self._segment_ids.update(s['_id'] for s in sessions)
+            self._written += 1
+            return self._written
+
+    def _sync_spool(self, seq):
+        # Group commit: the fsync runs without the lock and covers every
+        # write made before it started; writers arriving meanwhile wait for
+        # it or the next one instead of each doing their own
+        with self._spool_lock:
+            while self._synced < seq:
+                if self._syncing:
+                    self._spool_lock.wait()
+                    continue
+                target = self._written
+                self._spool_file.flush()
+                if not self.spool_fsync:
+                    self._synced = target
+                    break
+                self._syncing = True
+                fileno = self._spool_file.fileno()
+                self._spool_lock.release()
+                try:
+                    os.fsync(fileno)
+                finally:
+                    self._spool_lock.acquire()
+                    self._syncing = False
+                    self._spool_lock.notify_all()
+                self._synced = max(self._synced, target)
+
+    def _rotate_spool(self):
+        # Start a new segment so everything queued so far sits in closed ones
+        with self._spool_lock:
+            while self._syncing:
+                self._spool_lock.wait()
+            if not self._segment_ids:
+                return
+            self._spool_file.flush()
+            if self.spool_fsync and self._synced < self._written:
+                os.fsync(self._spool_file.fileno())
+            self._synced = self._written
+            self._spool_file.close()
+            self._segments.append((self._spool_path, self._segment_ids))
+            self._open_segment()
+            self._spool_lock.notify_all()
+
+    def _release_spool(self, flushed):
+        # Delete the segments whose sessions have all been flushed
+        done = []
+        with self._spool_lock:
+            self._segment_ids -= flushed
+            for path, ids in self._segments:
+                ids -= flushed
+                if not ids:
+                    done.append(path)
+            self._segments = [(path, ids) for path, ids in self._segments if ids]
+        for path in done:
+            os.remove(path)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                stopping = self._stopping
+
+            if batch and not self._flush(batch):
+                # Mongo unavailable: back off, the spool still holds the batch
+                time.sleep(self.flush_interval)
+            elif stopping:
+                return
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        self._rotate_spool()
+        try:
+            with self.app.app_context():
+                StudySession.insert_sessions(self.mongo.db, batch)
+        except Exception:
+            with self._lock:
+                self._metrics['failures'] += 1
+            logger.exception('Failed to flush %d study session(s)', len(batch))
+            return False
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            # Match by _id: flush() and the flusher thread may race on a batch
+            flushed = {s['_id'] for s in batch}
+            self._pending = [s for s in self._pending if s['_id'] not in flushed]
+            self._metrics['batches'] += 1
+            self._metrics['sessions'] += len(batch)
+            self._metrics['last_batch_size'] = len(batch)
+            self._metrics['last_flush_seconds'] = elapsed
+            self._metrics['flush_seconds'] += elapsed
+            self._metrics['max_flush_seconds'] = max(self._metrics['max_flush_seconds'], elapsed)
+
+        self._release_spool(flushed)
+        logger.debug('Flushed %d study session(s) in %.1f ms', len(batch), elapsed * 1000)
+        self._notify({str(s['user_id']) for s in batch})
+        return True
+
+    def _notify(self, user_ids):
+        if not self._listeners:
+            return
+        try:
+            with self.app.app_context():
+                for listener in self._listeners:
+                    listener(user_ids)
+        except Exception:
+            logger.exception('Session flush listener failed')
+
+    def _shutdown(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
+        if self._flusher:
+            self._flusher.join(timeout=self.flush_interval + 5)
@@ -1,122 +1,378 @@
-from app import create_app, mongo
-from bson import ObjectId
-from datetime import datetime
-
-def init_database():
-    app = create_app()
-    
-    with app.app_context():
-        try:
-            # Get database instance
-            db = mongo.db
-            
-            print("Connected to database:", db.name)
-            
-            # List of required collections
-            collections = ['users', 'subjects', 'study_sessions', 'goals']
-            
-            print("\nChecking collections...")
-            existing_collections = db.list_collection_names()
-            print("Existing collections:", existing_collections)
-            
-            # Create collections if they don't exist
-            for collection_name in collections:
-                if collection_name not in existing_collections:
-                    print(f"Creating collection: {collection_name}")
-                    db.create_collection(collection_name)
-                else:
-                    print(f"Collection {collection_name} already exists")
-            
-            print("\nCreating indexes...")
-            
-            # Create indexes for better performance
-            try:
-                db.users.create_index('email', unique=True)
-                print("✓ Created unique index on users.email")
-            except Exception as e:
-                print(f"✓ Index on users.email already exists: {e}")
-            
-            try:
-                db.subjects.create_index('user_id')
-                print("✓ Created index on subjects.user_id")
-            except Exception as e:
-                print(f"✓ Index on subjects.user_id already exists: {e}")
-            
-            try:
-                db.study_sessions.create_index('user_id')
-                print("✓ Created index on study_sessions.user_id")
-            except Exception as e:
-                print(f"✓ Index on study_sessions.user_id already exists: {e}")
-            
-            try:
-                db.study_sessions.create_index('session_date')
-                print("✓ Created index on study_sessions.session_date")
-            except Exception as e:
-                print(f"✓ Index on study_sessions.session_date already exists: {e}")
-            
-            try:
-                db.study_sessions.create_index([('user_id', 1), ('start_time', -1)])
-                print("✓ Created compound index on study_sessions")
-            except Exception as e:
-                print(f"✓ Compound index on study_sessions already exists: {e}")
-            
-            try:
-                db.goals.create_index('user_id')
-                print("✓ Created index on goals.user_id")
-            except Exception as e:
-                print(f"✓ Index on goals.user_id already exists: {e}")
-            
-            # Insert sample data for testing (optional)
-            print("\nChecking for sample data...")
-            
-            # Check if we have any users
-            user_count = db.users.count_documents({})
-            if user_count == 0:
-                print("No users found. You can register a new user through the web interface.")
-            else:
-                print(f"Found {user_count} user(s) in the database")
-            
-            # Count documents in each collection
-            print("\nDocument counts:")
-            for collection_name in collections:
-                count = db[collection_name].count_documents({})
-                print(f"  {collection_name}: {count} documents")
-            
-            print("\n" + "="*50)
-            print("✅ Database initialization completed successfully!")
-            print("="*50)
-            
-        except Exception as e:
-            print(f"❌ Error during database initialization: {e}")
-            print("Please check your MongoDB connection and try again.")
-
-def check_database_connection():
-    """Simple function to test database connection"""
-    app = create_app()
-    
-    with app.app_context():
-        try:
-            # Test the connection
-            db = mongo.db
-            # This will raise an exception if not connected
-            db.command('ping')
-            print("✅ MongoDB connection successful!")
-            return True
-        except Exception as e:
-            print(f"❌ MongoDB connection failed: {e}")
-            return False
-
-if __name__ == '__main__':
-    print("Starting StudyMate Database Initialization...")
-    print("="*50)
-    
-    # First check connection
-    if check_database_connection():
-        # Then initialize database
-        init_database()
-    else:
-        print("\n❌ Cannot initialize database. Please check:")
-        print("1. Is MongoDB running?")
-        print("2. Is the MONGODB_URI correct in config.py?")
-        print("3. For local MongoDB: run 'mongod' in terminal")
-        print("4. For MongoDB Atlas: check your connection string")
\ No newline at end of file
+from app import create_app, mongo
+from app.models import User, Subject, StudySession, DailyRollup, Leaderboard, ActiveTimer, Goal, Job, subject_cache, utc_day
+from bson import ObjectId
+from datetime import datetime, timedelta
+import argparse
+import sys
+
+# Declarative index set: sync_indexes creates what is missing and drops any
+# other index on these collections (apart from _id_). Keys are listed
+# equality fields first, then sort/range fields, then fields that only
+# exist to cover projections.
+INDEXES = {
+    'users': [
+        {'keys': [('email', 1)], 'unique': True}
+    ],
+    'subjects': [
+        # get_user_subjects; delete_subject and purge are served by _id
+        {'keys': [('user_id', 1)]}
+    ],
+    'study_sessions': [
+        # get_today_sessions / get_weekly_sessions, covered by the projection
+        {'keys': [('user_id', 1), ('session_date', 1), ('subject_id', 1), ('duration_minutes', 1)]},
+        # get_recent_sessions / iter_sessions (export)
+        {'keys': [('user_id', 1), ('start_time', -1)]},
+        # Idempotency keys from /api/sessions/bulk
+        {'keys': [('user_id', 1), ('client_id', 1)], 'unique': True,
+         'partialFilterExpression': {'client_id': {'$exists': True}}},
+        # apply_pending: only sessions whose totals are still to be applied
+        {'keys': [('pending_until', 1)], 'partialFilterExpression': {'pending_until': {'$exists': True}}}
+    ],
+    'daily_rollups': [
+        {'keys': [('user_id', 1), ('day', 1), ('subject_id', 1)], 'unique': True},
+        # Leaderboard.rebuild: every user's rollups for this week / live days
+        {'keys': [('day', 1), ('user_id', 1)]}
+    ],
+    'leaderboard_scores': [
+        {'keys': [('board', 1), ('user_id', 1)], 'unique': True},
+        # get_top: highest scores of a board (and streak day) first
+        {'keys': [('board', 1), ('day', 1), ('score', -1)]}
+    ],
+    'leaderboard_counts': [
+        # Score histograms; get_rank sums a range of buckets
+        {'keys': [('board', 1), ('level', 1), ('bucket', 1)], 'unique': True}
+    ],
+    'active_timers': [
+        # Keyed by user_id; abandoned timers are removed at expires_at
+        {'keys': [('expires_at', 1)], 'expireAfterSeconds': 0}
+    ],
+    'goals': [
+        # The goals page, and the goals a new session counts towards
+        {'keys': [('user_id', 1), ('target_date', 1)]},
+        # evaluate_goals.py: goals due in the next few days
+        {'keys': [('target_date', 1)]}
+    ],
+    'jobs': [
+        # Job.claim: runnable jobs, oldest lease first
+        {'keys': [('status', 1), ('lease_until', 1)]},
+        # Finished jobs are kept a week for their progress reports
+        {'keys': [('finished_at', 1)], 'expireAfterSeconds': 7 * 24 * 3600}
+    ],
+    'dashboard_events': [
+        {'keys': [('created_at', 1)], 'expireAfterSeconds': 3600}
+    ]
+}
+
+# Written through the PyMongo extension directly rather than by the models
+TOP_LEVEL_COLLECTIONS = {'dashboard_events'}
+
+INDEX_OPTIONS = ('unique', 'partialFilterExpression', 'expireAfterSeconds')
+
+def resolve_collection(db, name):
+    # Routes hand the models `mongo.db` and the models query `mongo.db.<name>`,
+    # so model data lives in the `db.<name>` collections of the database
+    if name in TOP_LEVEL_COLLECTIONS:
+        return db[name]
+    return db.db[name]
+
+def index_name(keys):
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+def same_index(info, spec):
+    if [(field, int(direction)) for field, direction in info['key']] != spec['keys']:
+        return False
+    return all(info.get(option) == spec.get(option) for option in INDEX_OPTIONS
+               if info.get(option) or spec.get(option))
+
+def sync_indexes(db):
+    """Make the indexes on every managed collection match INDEXES"""
+    for collection_name, specs in INDEXES.items():
+        collection = resolve_collection(db, collection_name)
+        wanted = {index_name(spec['keys']): spec for spec in specs}
+        existing = collection.index_information()
+        
+        for name, info in existing.items():
+            if name == '_id_':
+                continue
+            if name not in wanted or not same_index(info, wanted[name]):
+                collection.drop_index(name)
+                print(f"✓ Dropped index {collection.name}.{name}")
+        
+        existing = collection.index_information()
+        for name, spec in wanted.items():
+            if name in existing:
+                print(f"✓ Index {collection.name}.{name} is up to date")
+                continue
+            options = {option: spec[option] for option in INDEX_OPTIONS if option in spec}
+            collection.create_index(spec['keys'], name=name, **options)
+            print(f"✓ Created index {collection.name}.{name}")
+
+def init_database(db=None):
+    if db is None:
+        app = create_app()
+        with app.app_context():
+            return init_database(mongo.db)
+    
+    try:
+        print("Connected to database:", db.name)
+        
+        print("\nChecking collections...")
+        existing_collections = db.list_collection_names()
+        print("Existing collections:", existing_collections)
+        
+        # Create collections if they don't exist
+        for collection_name in INDEXES:
+            collection = resolve_collection(db, collection_name)
+            if collection.name not in existing_collections:
+                print(f"Creating collection: {collection.name}")
+                db.create_collection(collection.name)
+            else:
+                print(f"Collection {collection.name} already exists")
+        
+        print("\nSyncing indexes...")
+        sync_indexes(db)
+        
+        # Insert sample data for testing (optional)
+        print("\nChecking for sample data...")
+        
+        # Check if we have any users
+        user_count = resolve_collection(db, 'users').count_documents({})
+        if user_count == 0:
+            print("No users found. You can register a new user through the web interface.")
+        else:
+            print(f"Found {user_count} user(s) in the database")
+        
+        # Count documents in each collection
+        print("\nDocument counts:")
+        for collection_name in INDEXES:
+            count = resolve_collection(db, collection_name).count_documents({})
+            print(f"  {collection_name}: {count} documents")
+        
+        print("\n" + "="*50)
+        print("✅ Database initialization completed successfully!")
+        print("="*50)
+        return True
+        
+    except Exception as e:
+        print(f"❌ Error during database initialization: {e}")
+        print("Please check your MongoDB connection and try again.")
+        return False
+
+class QueryRecorder:
+    # Stands in for the handle routes pass to the models and records every
+    # query the models issue, so their plans can be explained afterwards
+    
+    def __init__(self, db):
+        self.queries = []
+        self.db = self._Collections(db, self.queries)
+    
+    class _Collections:
+        def __init__(self, db, queries):
+            self._db = db
+            self._queries = queries
+        
+        def __getattr__(self, name):
+            return QueryRecorder._Collection(self._db.db[name], self._queries)
+        
+        __getitem__ = __getattr__
+    
+    class _Collection:
+        def __init__(self, collection, queries):
+            self._collection = collection
+            self._queries = queries
+        
+        def _record(self, filter, cursor=None, pipeline=None):
+            self._queries.append({
+                'collection': self._collection,
+                'filter': filter or {},
+                'cursor': cursor,
+                'pipeline': pipeline
+            })
+        
+        def find(self, filter=None, *args, **kwargs):
+            cursor = self._collection.find(filter, *args, **kwargs)
+            self._record(filter, cursor=cursor)
+            return cursor
+        
+        def find_one(self, filter=None, *args, **kwargs):
+            self._record(filter, cursor=self._collection.find(filter).limit(1))
+            return self._collection.find_one(filter, *args, **kwargs)
+        
+        def aggregate(self, pipeline, *args, **kwargs):
+            first = pipeline[0] if pipeline else {}
+            self._record(first.get('$match'), pipeline=pipeline)
+            return self._collection.aggregate(pipeline, *args, **kwargs)
+        
+        def update_one(self, filter, *args, **kwargs):
+            self._record(filter, cursor=self._collection.find(filter).limit(1))
+            return self._collection.update_one(filter, *args, **kwargs)
+        
+        def delete_one(self, filter, *args, **kwargs):
+            self._record(filter, cursor=self._collection.find(filter).limit(1))
+            return self._collection.delete_one(filter, *args, **kwargs)
+        
+        def __getattr__(self, name):
+            return getattr(self._collection, name)
+
+def model_queries():
+    # Every read path in app/models.py, with throwaway ids (nothing matches)
+    user_id = ObjectId()
+    subject_id = ObjectId()
+    today = utc_day()
+    return [
+        ('User.find_by_email', lambda h: User.find_by_email(h, 'plan-check@example.com')),
+        ('User.find_credentials', lambda h: User.find_credentials(h, 'plan-check@example.com')),
+        ('User.email_exists', lambda h: User.email_exists(h, 'plan-check@example.com')),
+        ('User.get_stats_version', lambda h: User.get_stats_version(h, user_id)),
+        ('Subject.get_user_subjects', lambda h: Subject.get_user_subjects(h, user_id)),
+        ('Subject.delete_subject', lambda h: Subject.delete_subject(h, subject_id, user_id)),
+        ('StudySession.get_today_sessions', lambda h: StudySession.get_today_sessions(h, user_id)),
+        ('StudySession.get_weekly_sessions', lambda h: StudySession.get_weekly_sessions(h, user_id)),
+        ('StudySession.get_recent_sessions', lambda h: StudySession.get_recent_sessions(h, user_id)),
+        ('StudySession.iter_sessions', lambda h: list(StudySession.iter_sessions(h, user_id))),
+        ('StudySession.existing_ids', lambda h: StudySession.existing_ids(h, user_id, [ObjectId()])),
+        ('StudySession.apply_pending', lambda h: StudySession.apply_pending(h)),
+        ('DailyRollup.get_minutes_by_subject',
+         lambda h: DailyRollup.get_minutes_by_subject(h, user_id, today, today - timedelta(days=7))),
+        ('DailyRollup.get_study_days', lambda h: DailyRollup.get_study_days(h, user_id, until=today)),
+        ('DailyRollup.get_period_totals',
+         lambda h: DailyRollup.get_period_totals(h, user_id, today - timedelta(days=365), today, 'week')),
+        ('Leaderboard.get_rank weekly', lambda h: Leaderboard.get_rank(h, 'weekly', user_id, today)),
+        ('Leaderboard.get_rank streak', lambda h: Leaderboard.get_rank(h, 'streak', user_id, today)),
+        ('Leaderboard.get_top weekly', lambda h: Leaderboard.get_top(h, 'weekly', 10, today)),
+        ('Leaderboard.get_top streak', lambda h: Leaderboard.get_top(h, 'streak', 10, today)),
+        ('Leaderboard.count_above',
+         lambda h: Leaderboard.count_above(h, [Leaderboard.weekly_board(today)], 60, 120)),
+        ('ActiveTimer.get', lambda h: ActiveTimer.get(h, user_id)),
+        ('DailyRollup.sum_minutes', lambda h: DailyRollup.sum_minutes(h, user_id, today, today, subject_id)),
+        ('Goal.get_user_goals', lambda h: Goal.get_user_goals(h, user_id)),
+        ('Goal.iter_due', lambda h: list(Goal.iter_due(h, today, today + timedelta(days=3)))),
+        ('Goal.recount_user', lambda h: Goal.recount_user(h, user_id)),
+        ('StudySession.purge_subject', lambda h: StudySession.purge_subject(h, user_id, subject_id)),
+        ('DailyRollup.purge_subject', lambda h: DailyRollup.purge_subject(h, user_id, subject_id)),
+        ('Goal.purge_subject', lambda h: Goal.purge_subject(h, user_id, subject_id)),
+        ('Leaderboard.recount_user', lambda h: Leaderboard.recount_user(h, user_id)),
+        ('Leaderboard.rebuild', lambda h: Leaderboard.rebuild(h, today)),
+        ('Job.get', lambda h: Job.get(h, ObjectId(), user_id))
+    ]
+
+def plan_stages(plan):
+    # All 'stage' names anywhere in an explain() document
+    if isinstance(plan, dict):
+        stages = [plan['stage']] if isinstance(plan.get('stage'), str) else []
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for value in plan for stage in plan_stages(value)]
+    return []
+
+def explain_query(query):
+    # None when there is no query planner to ask (mongomock)
+    collection = query['collection']
+    if type(collection).__module__.startswith('mongomock'):
+        return None
+    if query['pipeline'] is not None:
+        return collection.database.command('aggregate', collection.name,
+                                           pipeline=query['pipeline'], explain=True)
+    return query['cursor'].explain()
+
+def uses_index_prefix(query):
+    # Fallback without a planner: some index must lead with a filtered field
+    fields = set(query['filter'])
+    if '_id' in fields:
+        return True
+    indexes = query['collection'].index_information().values()
+    return any(info['key'][0][0] in fields for info in indexes)
+
+def check_query_plans(db=None):
+    """Explain every model query and fail if any of them is a COLLSCAN"""
+    if db is None:
+        app = create_app()
+        with app.app_context():
+            return check_query_plans(mongo.db)
+    
+    failures = []
+    cache_enabled = subject_cache.enabled
+    subject_cache.enabled = False  # Cached reads would never reach Mongo
+    try:
+        for label, run in model_queries():
+            recorder = QueryRecorder(db)
+            run(recorder)
+            for query in recorder.queries:
+                target = f"{label} on {query['collection'].name}"
+                plan = explain_query(query)
+                if plan is None:
+                    indexed = uses_index_prefix(query)
+                    detail = 'index prefix' if indexed else 'no usable index'
+                else:
+                    stages = plan_stages(plan)
+                    indexed = 'COLLSCAN' not in stages
+                    detail = ', '.join(dict.fromkeys(stages))
+                
+                if indexed:
+                    print(f"✓ {target}: {detail}")
+                else:
+                    print(f"❌ {target}: {detail}")
+                    failures.append(target)
+    finally:
+        subject_cache.enabled = cache_enabled
+    
+    if failures:
+        print(f"\n❌ {len(failures)} model quer{'y' if len(failures) == 1 else 'ies'} fell back to COLLSCAN")
+        return False
+    print("\n✅ All model queries use an index")
+    return True
+
+def check_database_connection():
+    """Simple function to test database connection"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            # Test the connection
+            db = mongo.db
+            # This will raise an exception if not connected
+            db.command('ping')
+            print("✅ MongoDB connection successful!")
+            return True
+        except Exception as e:
+            print(f"❌ MongoDB connection failed: {e}")
+            return False
+
+def mock_database():
+    import mongomock
+    return mongomock.MongoClient().studymate
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Initialize the StudyMate database')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='explain every model query and exit non-zero on a COLLSCAN')
+    parser.add_argument('--mock', action='store_true',
+                        help='run against an in-memory mongomock database')
+    args = parser.parse_args()
+    
+    print("Starting StudyMate Database Initialization...")
+    print("="*50)
+    
+    if args.mock:
+        db = mock_database()
+        ok = init_database(db)
+        if ok and args.check_plans:
+            ok = check_query_plans(db)
+        sys.exit(0 if ok else 1)
+    
+    # First check connection
+    if check_database_connection():
+        # Then initialize database
+        ok = init_database()
+        if ok and args.check_plans:
+            ok = check_query_plans()
+        sys.exit(0 if ok else 1)
+    else:
+        print("\n❌ Cannot initialize database. Please check:")
+        print("1. Is MongoDB running?")
+        print("2. Is the MONGODB_URI correct in config.py?")
+        print("3. For local MongoDB: run 'mongod' in terminal")
+        print("4. For MongoDB Atlas: check your connection string")
+        sys.exit(1)
\ No newline at end of file
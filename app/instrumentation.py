@@ -0,0 +1,303 @@
+import threading
+import time
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response, current_app, abort
+from bson import json_util
+from pymongo import monitoring
+from app.models import subject_cache
+
+METRICS = [
+    ('requests_total', 'counter', 'Requests handled'),
+    ('slow_requests_total', 'counter', 'Requests slower than the slow-request threshold'),
+    ('request_seconds_total', 'counter', 'Wall time spent handling requests'),
+    ('mongo_seconds_total', 'counter', 'Time spent waiting on MongoDB'),
+    ('template_seconds_total', 'counter', 'Time spent rendering templates'),
+    ('python_seconds_total', 'counter', 'Remaining time spent in Python'),
+    ('mongo_commands_total', 'counter', 'MongoDB commands issued'),
+    ('mongo_documents_total', 'counter', 'Documents returned by MongoDB')
+]
+
+# Fields worth logging for a slow command; everything else is noise
+COMMAND_FIELDS = ('filter', 'projection', 'sort', 'limit', 'pipeline', 'updates', 'deletes')
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+def _documents_returned(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if 'value' in reply:
+        return 1 if reply['value'] else 0
+    return 0
+
+def _summarize_command(event):
+    command = event.command
+    summary = {field: command[field] for field in COMMAND_FIELDS if field in command}
+    # Inserted documents may hold password hashes; log the count only
+    if 'documents' in command:
+        summary['documents'] = len(command['documents'])
+    text = json_util.dumps(summary)
+    return text if len(text) <= 500 else text[:497] + '...'
+
+class _CommandListener(monitoring.CommandListener):
+    # PyMongo calls these on the thread that runs the command, i.e. inside
+    # the request that issued it
+
+    def started(self, event):
+        state = g.get('_instrumentation') if has_request_context() else None
+        if state is not None:
+            state['pending'][event.request_id] = (event.command_name, _summarize_command(event))
+
+    def succeeded(self, event):
+        self._finish(event, _documents_returned(event.reply), 'ok')
+
+    def failed(self, event):
+        self._finish(event, 0, 'failed')
+
+    def _finish(self, event, documents, outcome):
+        state = g.get('_instrumentation') if has_request_context() else None
+        if state is None:
+            return
+        name, summary = state['pending'].pop(event.request_id, (event.command_name, ''))
+        state['commands'].append({
+            'command': name,
+            'seconds': event.duration_micros / 1e6,
+            'documents': documents,
+            'outcome': outcome,
+            'detail': summary
+        })
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    # Connection pool occupancy and checkout waits, across all servers
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open_connections = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_timeouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkout_timeouts': self.checkout_timeouts,
+                'avg_wait_ms': round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 3)
+            }
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(self.open_connections - 1, 0)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+class Instrumentation:
+    # Opt-in (INSTRUMENTATION_ENABLED) per-request profiling: Mongo commands,
+    # Mongo/template/Python time and documents returned, per endpoint. Served
+    # as Prometheus text on /metrics and as a Server-Timing header. Counters
+    # are per worker process.
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_request_seconds = 0.5
+        self.listener = _CommandListener()
+        self.pool_monitor = PoolMonitor()
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    @property
+    def event_listeners(self):
+        # Passed to the MongoClient; pool stats are always collected, command
+        # monitoring only when enabled
+        return [self.listener, self.pool_monitor] if self.enabled else [self.pool_monitor]
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', False)
+        if not self.enabled:
+            return
+
+        self.slow_request_seconds = app.config.get('INSTRUMENTATION_SLOW_REQUEST_MS', 500) / 1000
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _before_request(self):
+        g._instrumentation = {
+            'started': time.perf_counter(),
+            'pending': {},
+            'commands': [],
+            'template_started': None,
+            'template_seconds': 0.0
+        }
+
+    def _template_started(self, sender, template, context, **extra):
+        state = g.get('_instrumentation')
+        if state is not None:
+            state['template_started'] = time.perf_counter()
+
+    def _template_finished(self, sender, template, context, **extra):
+        state = g.get('_instrumentation')
+        if state is not None and state['template_started'] is not None:
+            state['template_seconds'] += time.perf_counter() - state['template_started']
+            state['template_started'] = None
+
+    def _after_request(self, response):
+        state = g.pop('_instrumentation', None)
+        if state is None:
+            return response
+
+        total = time.perf_counter() - state['started']
+        commands = state['commands']
+        mongo_seconds = sum(c['seconds'] for c in commands)
+        template_seconds = state['template_seconds']
+        python_seconds = max(total - mongo_seconds - template_seconds, 0.0)
+        documents = sum(c['documents'] for c in commands)
+        endpoint = request.endpoint or 'unmatched'
+        slow = total >= self.slow_request_seconds
+
+        self._record(endpoint, {
+            'requests_total': 1,
+            'slow_requests_total': 1 if slow else 0,
+            'request_seconds_total': total,
+            'mongo_seconds_total': mongo_seconds,
+            'template_seconds_total': template_seconds,
+            'python_seconds_total': python_seconds,
+            'mongo_commands_total': len(commands),
+            'mongo_documents_total': documents
+        })
+
+        response.headers.add('Server-Timing', ', '.join([
+            f'mongo;dur={mongo_seconds * 1000:.1f};desc="{len(commands)} commands, {documents} docs"',
+            f'tpl;dur={template_seconds * 1000:.1f}',
+            f'app;dur={python_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}'
+        ]))
+
+        if slow:
+            lines = [f"  {c['command']} {c['seconds'] * 1000:.1f} ms {c['documents']} docs {c['outcome']} {c['detail']}"
+                     for c in commands]
+            current_app.logger.warning(
+                'Slow request %s %s (%s): %.1f ms total, %.1f ms in %d Mongo command(s), %.1f ms templates\n%s',
+                request.method, request.path, endpoint, total * 1000, mongo_seconds * 1000,
+                len(commands), template_seconds * 1000, '\n'.join(lines)
+            )
+
+        return response
+
+    def _record(self, endpoint, values):
+        with self._lock:
+            metrics = self._metrics.setdefault(endpoint, dict.fromkeys(values, 0))
+            for name, value in values.items():
+                metrics[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(values) for endpoint, values in self._metrics.items()}
+
+    def render_prometheus(self, extra_gauges=None):
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, description in METRICS:
+            lines.append(f'# HELP studymate_{name} {description}')
+            lines.append(f'# TYPE studymate_{name} {kind}')
+            for endpoint in sorted(snapshot):
+                lines.append(f'studymate_{name}{{endpoint="{endpoint}"}} {snapshot[endpoint][name]:g}')
+
+        for name, description, value in extra_gauges or []:
+            lines.append(f'# HELP studymate_{name} {description}')
+            lines.append(f'# TYPE studymate_{name} gauge')
+            lines.append(f'studymate_{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        token = current_app.config.get('INSTRUMENTATION_METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(401)
+        elif request.remote_addr not in LOOPBACK_ADDRS or 'X-Forwarded-For' in request.headers:
+            # Without a token only a local scraper may read it; a request
+            # relayed by a proxy on this host is not local
+            abort(404)
+        
+        # Imported here to avoid a circular import with app/__init__
+        from app import ingestor, timers, jobs
+
+        cache = subject_cache.stats()
+        ingest = ingestor.stats()
+        timer = timers.stats()
+        job = jobs.stats()
+        pool = self.pool_monitor.stats()
+        gauges = [
+            ('mongo_pool_open_connections', 'Open connections in the Mongo pool', pool['open_connections']),
+            ('mongo_pool_checked_out', 'Connections currently checked out', pool['checked_out']),
+            ('mongo_pool_max_checked_out', 'Most connections checked out at once', pool['max_checked_out']),
+            ('mongo_pool_checkout_timeouts', 'Checkouts that hit waitQueueTimeoutMS', pool['checkout_timeouts']),
+            ('mongo_pool_avg_wait_ms', 'Average wait for a pooled connection', pool['avg_wait_ms']),
+            ('mongo_pool_max_wait_ms', 'Longest wait for a pooled connection', pool['max_wait_ms']),
+            ('subject_cache_hits', 'Subject cache hits', cache['hits']),
+            ('subject_cache_misses', 'Subject cache misses', cache['misses']),
+            ('subject_cache_size', 'Entries in the subject cache', cache['size']),
+            ('ingest_pending_sessions', 'Study sessions waiting to be flushed', ingest['pending']),
+            ('ingest_batches', 'Session batches flushed', ingest['batches']),
+            ('ingest_avg_flush_ms', 'Average session batch flush latency', ingest['avg_flush_ms']),
+            ('timer_heartbeats', 'Timer heartbeats received', timer['heartbeats']),
+            ('timer_heartbeat_writes', 'Timer heartbeats written to the store', timer['writes']),
+            ('timer_pending_heartbeats', 'Timer heartbeats waiting to be written', timer['pending']),
+            ('jobs_finished', 'Background jobs finished', job['jobs']),
+            ('job_batches', 'Background job batches run', job['batches']),
+            ('job_failures', 'Background job attempts that failed', job['failures'])
+        ]
+        return Response(self.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,222 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.models import User, Subject, StudySession, DailyRollup, Leaderboard, Goal, Job, period_cache
+
+logger = logging.getLogger(__name__)
+
+# kind -> handler(mongo, job, batch_size): a generator that does one bounded
+# batch of work per step and yields (phase, documents touched)
+HANDLERS = {}
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+@handler('delete_subject')
+def delete_subject(mongo, job, batch_size):
+    """Remove (or archive) what hangs off a soft-deleted subject, then set
+    the leaderboards and goals that counted it straight"""
+    user_id = job['user_id']
+    subject_id = job['params']['subject_id']
+    archive = job['params'].get('archive', False)
+
+    phases = [
+        ('study_sessions', lambda after: StudySession.purge_subject(
+            mongo, user_id, subject_id, after, batch_size, archive)),
+        ('daily_rollups', lambda after: DailyRollup.purge_subject(
+            mongo, user_id, subject_id, after, batch_size)),
+        ('goals', lambda after: Goal.purge_subject(
+            mongo, user_id, subject_id, after, batch_size, archive))
+    ]
+    for phase, purge in phases:
+        after = None
+        while True:
+            removed, after = purge(after)
+            yield phase, removed
+            if removed < batch_size:
+                break
+
+    # The rollups are gone, so these recounts leave the subject out
+    Leaderboard.recount_user(mongo, user_id)
+    Goal.recount_user(mongo, user_id)
+    if not archive:
+        Subject.purge(mongo, subject_id, user_id)
+    period_cache.invalidate(user_id)
+    User.bump_stats_version(mongo, user_id)
+    yield 'done', 0
+
+class JobRunner:
+    # Background jobs (see the Job model) run one bounded batch at a time,
+    # with JOBS_BATCH_PAUSE_SECONDS between batches so a large cleanup
+    # trickles through the cluster instead of arriving as one huge write.
+    #
+    # With JOBS_WORKER = 'thread' every web worker process runs a daemon
+    # thread, from its first request on, that picks up jobs as they are
+    # queued and polls every JOBS_POLL_SECONDS for jobs left by other
+    # processes (or by a crashed worker); with 'none' jobs only run in
+    # `python -m app.run_jobs`. Each pass also applies the totals of study
+    # sessions a crashed writer stored but never applied.
+
+    def __init__(self):
+        self.app = None
+        self.mongo = None
+        self.mode = 'thread'
+        self.batch_size = 500
+        self.batch_pause = 0.05
+        self.poll_interval = 5
+        self.lease = timedelta(seconds=60)
+        self.max_attempts = 5
+        self._lock = threading.Condition()
+        self._pid = None
+        self._thread = None
+        self._stopping = False
+        self._metrics = {'jobs': 0, 'batches': 0, 'failures': 0}
+
+    def init_app(self, app, mongo):
+        self.app = app
+        self.mongo = mongo
+        self.mode = app.config.get('JOBS_WORKER', 'thread')
+        self.batch_size = app.config.get('JOBS_BATCH_SIZE', 500)
+        self.batch_pause = app.config.get('JOBS_BATCH_PAUSE_SECONDS', 0.05)
+        self.poll_interval = app.config.get('JOBS_POLL_SECONDS', 5)
+        self.lease = timedelta(seconds=app.config.get('JOBS_LEASE_SECONDS', 60))
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', 5)
+        app.before_request(self._before_request)
+
+    @property
+    def worker_id(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def enqueue(self, kind, user_id, **params):
+        if kind not in HANDLERS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job_id = Job.enqueue(self.mongo.db, kind, user_id, params).inserted_id
+        if self.mode == 'thread':
+            self._ensure_started()
+            with self._lock:
+                self._lock.notify()
+        return job_id
+
+    def get(self, job_id, user_id):
+        if not ObjectId.is_valid(job_id):
+            return None
+        return Job.get(self.mongo.db, job_id, user_id)
+
+    def describe(self, job):
+        """JSON-ready view of a job for its owner"""
+        return {
+            'job_id': str(job['_id']),
+            'kind': job['kind'],
+            'status': job['status'],
+            'phase': job['phase'],
+            'progress': job['progress'],
+            'error': job['error'],
+            'created_at': job['created_at'].isoformat() + 'Z',
+            'finished_at': job['finished_at'].isoformat() + 'Z' if job.get('finished_at') else None
+        }
+
+    def run_pending(self, limit=None):
+        # Claim and run jobs on the calling thread until none are runnable;
+        # returns how many were run
+        ran = 0
+        while limit is None or ran < limit:
+            with self.app.app_context():
+                job = Job.claim(self.mongo.db, self.worker_id, self.lease)
+                if job is None:
+                    return ran
+                self.run_job(job)
+            ran += 1
+        return ran
+
+    def apply_pending_sessions(self):
+        # Cheap when there are none: only pending sessions are in the index
+        with self.app.app_context():
+            return StudySession.apply_pending(self.mongo.db, self.batch_size)
+
+    def run_job(self, job):
+        db = self.mongo.db
+        worker = self.worker_id
+        if job['attempts'] > self.max_attempts:
+            Job.finish(db, job['_id'], worker, 'failed', error=job.get('error') or 'Too many attempts')
+            return
+
+        started = time.monotonic()
+        try:
+            for phase, touched in HANDLERS[job['kind']](db, job, self.batch_size):
+                with self._lock:
+                    self._metrics['batches'] += 1
+                if not Job.record_progress(db, job['_id'], worker, phase,
+                                           {phase: touched} if touched else None, self.lease):
+                    logger.warning('Lost the lease on job %s; another worker took it over', job['_id'])
+                    return
+                if self.batch_pause:
+                    time.sleep(self.batch_pause)
+        except Exception as e:
+            with self._lock:
+                self._metrics['failures'] += 1
+            logger.exception('Job %s (%s) failed', job['_id'], job['kind'])
+            # Back off, then run again from the start; handlers are restartable
+            retry_at = datetime.utcnow() + timedelta(seconds=min(2 ** job['attempts'], 300))
+            Job.finish(db, job['_id'], worker, 'queued', error=str(e), retry_at=retry_at)
+            return
+
+        Job.finish(db, job['_id'], worker, 'done')
+        with self._lock:
+            self._metrics['jobs'] += 1
+        logger.info('Job %s (%s) finished in %.1f s', job['_id'], job['kind'], time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def _before_request(self):
+        if self.mode == 'thread':
+            self._ensure_started()
+
+    def _ensure_started(self):
+        # Started lazily in each worker rather than in init_app, so a
+        # preloading master never starts (and forks) the thread
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+            self._thread.start()
+            atexit.register(self._shutdown)
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception('Job runner failed to claim a job')
+            try:
+                self.apply_pending_sessions()
+            except Exception:
+                logger.exception('Failed to apply pending study sessions')
+            with self._lock:
+                if self._stopping:
+                    return
+                self._lock.wait(self.poll_interval)
+                if self._stopping:
+                    return
+
+    def _shutdown(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
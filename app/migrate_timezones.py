@@ -0,0 +1,56 @@
+from app import create_app, mongo
+from app.models import StudySession, DailyRollup, Leaderboard
+import argparse
+import sys
+
+def migrate_timezones(batch_size=1000, rekey_all=False, user_ids=None):
+    """Move study sessions onto their users' local day keys and rebuild the
+    rollups and leaderboards that depend on them"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("Re-keying study sessions to each user's local day...")
+            
+            def report(scanned, updated):
+                print(f"  {scanned} session(s) scanned, {updated} updated")
+            
+            moved = StudySession.rekey_session_dates(mongo.db, batch_size=batch_size, user_ids=user_ids,
+                                                     rekey_all=rekey_all, on_batch=report)
+            print(f"✓ Sessions of {len(moved)} user(s) changed day")
+            
+            if moved:
+                print("\nRebuilding their daily rollups...")
+                moved = list(moved)
+                written = 0
+                for start in range(0, len(moved), batch_size):
+                    written += DailyRollup.rebuild(mongo.db, batch_size=batch_size,
+                                                   user_ids=moved[start:start + batch_size])
+                print(f"✓ Wrote {written} rollup document(s)")
+                
+                print("\nReconciling leaderboards...")
+                written = Leaderboard.rebuild(mongo.db, batch_size=batch_size)
+                print(f"✓ Rewrote {written} leaderboard entr{'y' if written == 1 else 'ies'}")
+            
+            print("\n" + "="*50)
+            print("✅ Timezone migration completed successfully!")
+            print("="*50)
+            return True
+        except Exception as e:
+            print(f"❌ Error during timezone migration: {e}")
+            print("Please check your MongoDB connection and try again.")
+            return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Store session days in each user's timezone")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--all', action='store_true', dest='rekey_all',
+                        help='also move sessions recorded under an older timezone of the user')
+    parser.add_argument('--user', action='append', dest='user_ids', help='only this user id (repeatable)')
+    args = parser.parse_args()
+    
+    print("Starting StudyMate Timezone Migration...")
+    print("="*50)
+    
+    if not migrate_timezones(args.batch_size, args.rekey_all, args.user_ids):
+        sys.exit(1)
@@ -1,102 +1,1438 @@
-from flask_pymongo import PyMongo
-from bson import ObjectId
-from datetime import datetime, date, timedelta
-import bcrypt
-
-class User:
-    @staticmethod
-    def create_user(mongo, email, password, name):
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        user = {
-            'email': email,
-            'password_hash': hashed_password,
-            'name': name,
-            'daily_goal_hours': 2,
-            'preferred_timer_duration': 25,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
-        return mongo.db.users.insert_one(user)
-    
-    @staticmethod
-    def find_by_email(mongo, email):
-        return mongo.db.users.find_one({'email': email})
-    
-    @staticmethod
-    def verify_password(stored_password, provided_password):
-        return bcrypt.checkpw(provided_password.encode('utf-8'), stored_password)
-
-class Subject:
-    @staticmethod
-    def create_subject(mongo, user_id, name, color, icon, weekly_goal_hours):
-        subject = {
-            'user_id': ObjectId(user_id),
-            'name': name,
-            'color': color,
-            'icon': icon,
-            'weekly_goal_hours': weekly_goal_hours,
-            'created_at': datetime.utcnow()
-        }
-        return mongo.db.subjects.insert_one(subject)
-    
-    @staticmethod
-    def get_user_subjects(mongo, user_id):
-        return list(mongo.db.subjects.find({'user_id': ObjectId(user_id)}))
-    
-    @staticmethod
-    def delete_subject(mongo, subject_id, user_id):
-        return mongo.db.subjects.delete_one({'_id': ObjectId(subject_id), 'user_id': ObjectId(user_id)})
-
-class StudySession:
-    @staticmethod
-    def create_session(mongo, user_id, subject_id, duration_minutes):
-        # Convert date to datetime for MongoDB compatibility
-        session_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        session = {
-            'user_id': ObjectId(user_id),
-            'subject_id': ObjectId(subject_id),
-            'start_time': datetime.utcnow(),
-            'duration_minutes': duration_minutes,
-            'session_date': session_date,  # Use datetime instead of date
-            'created_at': datetime.utcnow()
-        }
-        return mongo.db.study_sessions.insert_one(session)
-    
-    @staticmethod
-    def get_today_sessions(mongo, user_id):
-        # Use datetime for today's date
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        return list(mongo.db.study_sessions.find({
-            'user_id': ObjectId(user_id),
-            'session_date': today
-        }))
-    
-    @staticmethod
-    def get_weekly_sessions(mongo, user_id):
-        week_ago = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=7)
-        return list(mongo.db.study_sessions.find({
-            'user_id': ObjectId(user_id),
-            'start_time': {'$gte': week_ago}
-        }))
-
-class Goal:
-    @staticmethod
-    def create_goal(mongo, user_id, title, description, target_date):
-        # Convert date to datetime for MongoDB
-        if isinstance(target_date, date):
-            target_date = datetime.combine(target_date, datetime.min.time())
-            
-        goal = {
-            'user_id': ObjectId(user_id),
-            'title': title,
-            'description': description,
-            'target_date': target_date,
-            'is_completed': False,
-            'created_at': datetime.utcnow()
-        }
-        return mongo.db.goals.insert_one(goal)
-    
-    @staticmethod
-    def get_user_goals(mongo, user_id):
-        return list(mongo.db.goals.find({'user_id': ObjectId(user_id)}))
\ No newline at end of file
+from flask_pymongo import PyMongo
+from bson import ObjectId
+from collections import OrderedDict, namedtuple
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
+from pymongo import ReplaceOne, UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.hashing import password_hasher
+import bson
+import threading
+import time
+
+def utc_day(moment=None):
+    # Midnight (UTC) of the day containing `moment`, used as the day key everywhere
+    moment = moment or datetime.utcnow()
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def local_day(tz_name, moment=None):
+    # Day key of `moment` (naive UTC) in a user's timezone: local midnight as a
+    # naive datetime. session_date and rollup days are stored in this form.
+    return day_boundaries.day_key(tz_name, moment)
+
+def week_start(moment=None):
+    # Monday (UTC) of the week containing `moment`
+    day = utc_day(moment)
+    return day - timedelta(days=day.weekday())
+
+def purge_batch(collection, query, key, after=None, batch_size=500, archive=None):
+    """Delete up to batch_size documents matching query, in `key` order from
+    `after` on so each batch starts where the last one stopped in the index.
+    With an `archive` collection the documents are copied there first.
+    Returns (documents removed, last key seen)."""
+    if after is not None:
+        query = dict(query, **{key: {'$gte': after}})
+    projection = None if archive is not None else {'_id': 1, key: 1}
+    docs = list(collection.find(query, projection).sort(key, 1).limit(batch_size))
+    if not docs:
+        return 0, after
+    
+    if archive is not None:
+        try:
+            archive.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Already archived by a run that stopped before deleting them
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+    collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+    return len(docs), docs[-1][key]
+
+# Projections: read only the fields a caller uses
+USER_PUBLIC_FIELDS = {'password_hash': 0}
+USER_LOGIN_FIELDS = {'_id': 1, 'name': 1, 'password_hash': 1, 'timezone': 1}
+SUBJECT_FIELDS = {'_id': 1, 'name': 1, 'color': 1, 'icon': 1, 'weekly_goal_hours': 1}
+GOAL_FIELDS = {'_id': 1, 'title': 1, 'description': 1, 'subject_id': 1, 'start_date': 1, 'target_date': 1,
+               'target_minutes': 1, 'progress_minutes': 1, 'is_completed': 1, 'completed_at': 1}
+GOAL_PROGRESS_FIELDS = {'_id': 1, 'user_id': 1, 'subject_id': 1, 'start_date': 1, 'target_date': 1,
+                        'target_minutes': 1, 'progress_minutes': 1, 'is_completed': 1}
+JOB_FIELDS = {'_id': 1, 'kind': 1, 'status': 1, 'phase': 1, 'progress': 1, 'error': 1,
+              'created_at': 1, 'finished_at': 1}
+
+# Lean session shapes for Python-side aggregation and templates. SessionTotal
+# only holds fields in the (user_id, session_date, subject_id,
+# duration_minutes) index, so those queries are covered.
+SessionTotal = namedtuple('SessionTotal', 'subject_id session_date duration_minutes')
+SessionRecord = namedtuple('SessionRecord', 'subject_id start_time duration_minutes')
+DEFAULT_TIMEZONE = 'UTC'
+
+SESSION_TOTAL_FIELDS = {'_id': 0, 'subject_id': 1, 'session_date': 1, 'duration_minutes': 1}
+SESSION_RECORD_FIELDS = {'_id': 0, 'subject_id': 1, 'start_time': 1, 'duration_minutes': 1}
+SESSION_EXPORT_FIELDS = {'_id': 1, 'subject_id': 1, 'start_time': 1, 'duration_minutes': 1}
+
+# The totals a stored session feeds, applied after the insert. A session is
+# stored with them all listed under `pending` (and a lease in pending_until)
+# and loses both once they are applied. A writer that fails part way drops
+# the steps it finished and releases the lease, so its retry, which finds
+# the session already stored, finishes the rest instead of skipping it as a
+# replay; what a writer that died left pending is finished by
+# StudySession.apply_pending once the lease runs out.
+SESSION_EFFECTS = ('rollups', 'leaderboards', 'goals')
+PENDING_LEASE = timedelta(minutes=5)
+
+class DayBoundaries:
+    # Per-timezone cache of the current local day: its key and the UTC
+    # instants it starts and ends at. An entry is recomputed only once `now`
+    # leaves it, so the hot paths (today's totals, new sessions) cost a dict
+    # lookup instead of a tz conversion.
+    
+    def __init__(self):
+        self._current = {}
+    
+    def window(self, tz_name, now=None):
+        """(day key, UTC start, UTC end) of the local day containing `now`"""
+        now = now or datetime.utcnow()
+        current = self._current.get(tz_name)
+        if current is not None and current[1] <= now < current[2]:
+            return current
+        
+        zone = ZoneInfo(tz_name)
+        key = self._local(now, zone).replace(hour=0, minute=0, second=0, microsecond=0)
+        window = (key, self._utc(key, zone), self._utc(key + timedelta(days=1), zone))
+        # Only the day around the real clock is worth keeping
+        if abs(now - datetime.utcnow()) < timedelta(days=1):
+            self._current[tz_name] = window
+        return window
+    
+    def day_key(self, tz_name, moment=None):
+        moment = moment or datetime.utcnow()
+        current = self._current.get(tz_name)
+        if current is not None and current[1] <= moment < current[2]:
+            return current[0]
+        return self.window(tz_name, moment)[0]
+    
+    @staticmethod
+    def _local(moment, zone):
+        return moment.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+    
+    @staticmethod
+    def _utc(local_moment, zone):
+        return local_moment.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+day_boundaries = DayBoundaries()
+
+class LocalCacheBackend:
+    # Bounded LRU with a per-entry TTL, private to one process
+    
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCacheBackend:
+    # Shared store so every worker sees the same entries and invalidations.
+    # Eviction is left to the server's maxmemory policy.
+    
+    def __init__(self, url, ttl=300, prefix='studymate:subjects:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+    
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return bson.decode(raw)['value']
+    
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl, bson.encode({'value': value}))
+    
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+    
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+    
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '*'))
+
+class SubjectCache:
+    # Per-user cache for Subject.get_user_subjects, configured from the app
+    
+    def __init__(self):
+        self.enabled = True
+        self.backend = LocalCacheBackend()
+        self.hits = 0
+        self.misses = 0
+    
+    def init_app(self, app):
+        ttl = app.config.get('SUBJECT_CACHE_TTL', 300)
+        url = app.config.get('SUBJECT_CACHE_URL')
+        self.enabled = app.config.get('SUBJECT_CACHE_ENABLED', True)
+        if url:
+            self.backend = RedisCacheBackend(url, ttl=ttl)
+        else:
+            self.backend = LocalCacheBackend(app.config.get('SUBJECT_CACHE_SIZE', 1024), ttl)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id):
+        if not self.enabled:
+            return None
+        value = self.backend.get(str(user_id))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def set(self, user_id, subjects):
+        if self.enabled:
+            self.backend.set(str(user_id), subjects)
+    
+    def invalidate(self, user_id):
+        self.backend.delete(str(user_id))
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+            'evictions': self.backend.evictions,
+            'size': len(self.backend)
+        }
+
+subject_cache = SubjectCache()
+
+class PeriodCache:
+    # Per-user analytics totals for closed periods (ended before today), keyed
+    # by bucket unit: {period_start: {subject_id: minutes}}. Past days only
+    # change when old sessions arrive late; DailyRollup drops the user's
+    # entries when that happens (in this process; other workers age out by TTL).
+    
+    UNITS = ('day', 'week', 'month')
+    
+    def __init__(self):
+        self.enabled = True
+        self.backend = LocalCacheBackend()
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.enabled = app.config.get('ANALYTICS_CACHE_ENABLED', True)
+        self.backend = LocalCacheBackend(app.config.get('ANALYTICS_CACHE_SIZE', 256),
+                                         app.config.get('ANALYTICS_CACHE_TTL', 3600))
+    
+    def get(self, user_id, unit):
+        if not self.enabled:
+            return {}
+        return self.backend.get(f'{user_id}:{unit}') or {}
+    
+    def update(self, user_id, unit, periods):
+        if not self.enabled or not periods:
+            return
+        key = f'{user_id}:{unit}'
+        with self._lock:
+            # Cached dicts are shared with readers, so merge into a copy
+            self.backend.set(key, {**(self.backend.get(key) or {}), **periods})
+    
+    def invalidate(self, user_id):
+        for unit in self.UNITS:
+            self.backend.delete(f'{user_id}:{unit}')
+    
+    def clear(self):
+        self.backend.clear()
+
+period_cache = PeriodCache()
+
+class User:
+    @staticmethod
+    def create_user(mongo, email, password, name, tz_name=DEFAULT_TIMEZONE):
+        hashed_password = password_hasher.hash(password)
+        user = {
+            'email': email,
+            'password_hash': hashed_password,
+            'name': name,
+            'daily_goal_hours': 2,
+            'preferred_timer_duration': 25,
+            'timezone': tz_name,
+            'stats_version': 0,
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        return mongo.db.users.insert_one(user)
+    
+    @staticmethod
+    def find_by_email(mongo, email, projection=USER_PUBLIC_FIELDS):
+        # Never returns password_hash unless the caller asks for it
+        return mongo.db.users.find_one({'email': email}, projection)
+    
+    @staticmethod
+    def find_credentials(mongo, email):
+        # Just what login needs
+        return mongo.db.users.find_one({'email': email}, USER_LOGIN_FIELDS)
+    
+    @staticmethod
+    def email_exists(mongo, email):
+        return mongo.db.users.find_one({'email': email}, {'_id': 1}) is not None
+    
+    @staticmethod
+    def verify_password(stored_password, provided_password):
+        return password_hasher.verify(stored_password, provided_password)
+    
+    @staticmethod
+    def update_password_hash(mongo, user_id, password_hash):
+        return mongo.db.users.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$set': {'password_hash': password_hash, 'updated_at': datetime.utcnow()}}
+        )
+    
+    @staticmethod
+    def get_timezone(mongo, user_id):
+        user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'_id': 0, 'timezone': 1})
+        return (user or {}).get('timezone', DEFAULT_TIMEZONE)
+    
+    @staticmethod
+    def set_timezone(mongo, user_id, tz_name):
+        # Only sessions recorded from now on use the new timezone; run
+        # migrate_timezones.py --all to re-key the history too
+        return mongo.db.users.update_one(
+            {'_id': ObjectId(user_id)},
+            {'$set': {'timezone': tz_name, 'updated_at': datetime.utcnow()}, '$inc': {'stats_version': 1}}
+        )
+    
+    @staticmethod
+    def bump_stats_version(mongo, user_id):
+        # Called after any write that changes what the dashboard shows
+        return mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$inc': {'stats_version': 1}})
+    
+    @staticmethod
+    def get_stats_version(mongo, user_id):
+        user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'_id': 0, 'stats_version': 1})
+        return (user or {}).get('stats_version', 0)
+
+class Subject:
+    @staticmethod
+    def create_subject(mongo, user_id, name, color, icon, weekly_goal_hours):
+        subject = {
+            'user_id': ObjectId(user_id),
+            'name': name,
+            'color': color,
+            'icon': icon,
+            'weekly_goal_hours': weekly_goal_hours,
+            'created_at': datetime.utcnow()
+        }
+        result = mongo.db.subjects.insert_one(subject)
+        subject_cache.invalidate(user_id)
+        return result
+    
+    @staticmethod
+    def get_user_subjects(mongo, user_id):
+        subjects = subject_cache.get(user_id)
+        if subjects is None:
+            subjects = list(mongo.db.subjects.find({'user_id': ObjectId(user_id), 'deleted_at': None},
+                                                   SUBJECT_FIELDS))
+            subject_cache.set(user_id, subjects)
+        # Callers get their own list so they cannot mutate the cached one
+        return list(subjects)
+    
+    @staticmethod
+    def delete_subject(mongo, subject_id, user_id):
+        # Soft delete: the subject disappears at once, and a delete_subject
+        # job (app/jobs.py) removes its sessions, rollups and goals later
+        result = mongo.db.subjects.update_one(
+            {'_id': ObjectId(subject_id), 'user_id': ObjectId(user_id), 'deleted_at': None},
+            {'$set': {'deleted_at': datetime.utcnow()}}
+        )
+        subject_cache.invalidate(user_id)
+        return result
+    
+    @staticmethod
+    def purge(mongo, subject_id, user_id):
+        # Last step of the cleanup job; only ever removes soft-deleted subjects
+        return mongo.db.subjects.delete_one(
+            {'_id': ObjectId(subject_id), 'user_id': ObjectId(user_id), 'deleted_at': {'$ne': None}})
+
+class StudySession:
+    @staticmethod
+    def build_session(user_id, subject_id, duration_minutes, recorded_at=None, client_id=None,
+                      tz_name=DEFAULT_TIMEZONE):
+        # recorded_at lets queued sessions keep the time they were actually studied
+        recorded_at = recorded_at or datetime.utcnow()
+        
+        # The user's local day, as a datetime for MongoDB compatibility
+        session_date = local_day(tz_name, recorded_at)
+        
+        session = {
+            '_id': ObjectId(),
+            'user_id': ObjectId(user_id),
+            'subject_id': ObjectId(subject_id),
+            'start_time': recorded_at,
+            'duration_minutes': duration_minutes,
+            'session_date': session_date,  # Use datetime instead of date
+            'timezone': tz_name,  # The calendar session_date belongs to
+            'created_at': datetime.utcnow()
+        }
+        if client_id:
+            session['client_id'] = client_id
+        return session
+    
+    @staticmethod
+    def create_session(mongo, user_id, subject_id, duration_minutes, client_id=None, tz_name=DEFAULT_TIMEZONE):
+        session = StudySession.build_session(user_id, subject_id, duration_minutes, client_id=client_id,
+                                             tz_name=tz_name)
+        try:
+            result = mongo.db.study_sessions.insert_one(StudySession._mark_pending([session])[0])
+        except DuplicateKeyError:
+            # This client_id was already saved (e.g. a stopped timer retried);
+            # finish its totals if the first attempt did not
+            StudySession._finish_pending(mongo, {'user_id': ObjectId(user_id), 'client_id': client_id})
+            return None
+        StudySession._apply(mongo, [session])
+        return result
+    
+    @staticmethod
+    def insert_sessions(mongo, sessions):
+        # Bulk insert; sessions whose _id already exists (replays) are skipped
+        # and left out of the rollups so they are never counted twice, unless
+        # their first writer failed before applying them
+        duplicates = set()
+        try:
+            mongo.db.study_sessions.insert_many(StudySession._mark_pending(sessions), ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    raise
+                duplicates.add(error['index'])
+        
+        inserted = [s for i, s in enumerate(sessions) if i not in duplicates]
+        StudySession._apply(mongo, inserted)
+        if duplicates:
+            StudySession._finish_pending(mongo, {'_id': {'$in': [sessions[i]['_id'] for i in duplicates]}})
+        return inserted
+    
+    @staticmethod
+    def insert_client_sessions(mongo, sessions):
+        # Upsert on the client's idempotency key (user_id, client_id) in one
+        # bulk_write, so a retried upload never stores a session twice
+        operations = [
+            UpdateOne({'user_id': s['user_id'], 'client_id': s['client_id']}, {'$setOnInsert': s}, upsert=True)
+            for s in StudySession._mark_pending(sessions)
+        ]
+        if not operations:
+            return []
+        
+        try:
+            upserted = mongo.db.study_sessions.bulk_write(operations, ordered=False).upserted_ids
+        except BulkWriteError as e:
+            # A concurrent retry of the same session won the unique index race
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    raise
+            upserted = {u['index']: u['_id'] for u in e.details.get('upserted', [])}
+        
+        inserted = [s for i, s in enumerate(sessions) if i in upserted]
+        StudySession._apply(mongo, inserted)
+        replayed = {}
+        for i, s in enumerate(sessions):
+            if i not in upserted:
+                replayed.setdefault(s['user_id'], []).append(s['client_id'])
+        for user_id, client_ids in replayed.items():
+            StudySession._finish_pending(mongo, {'user_id': user_id, 'client_id': {'$in': client_ids}})
+        return inserted
+    
+    @staticmethod
+    def apply_pending(mongo, batch_size=500):
+        """Apply the totals of sessions whose writer died before it could;
+        returns how many were finished"""
+        return StudySession._finish_pending(mongo, {}, batch_size)
+    
+    @staticmethod
+    def _mark_pending(sessions):
+        pending_until = datetime.utcnow() + PENDING_LEASE
+        return [dict(s, pending=list(SESSION_EFFECTS), pending_until=pending_until) for s in sessions]
+    
+    @staticmethod
+    def _apply(mongo, sessions):
+        # Each session's pending totals (all of them for a fresh insert), then
+        # clear the mark; on failure keep only the steps not yet done
+        if not sessions:
+            return
+        record = {
+            'rollups': DailyRollup.record_many,
+            'leaderboards': Leaderboard.record_sessions,
+            'goals': Goal.record_sessions
+        }
+        ids = [s['_id'] for s in sessions]
+        for done, effect in enumerate(SESSION_EFFECTS):
+            try:
+                record[effect](mongo, [s for s in sessions if effect in s.get('pending', SESSION_EFFECTS)])
+            except Exception:
+                mongo.db.study_sessions.update_many({'_id': {'$in': ids}}, {
+                    '$pullAll': {'pending': list(SESSION_EFFECTS[:done])},
+                    '$set': {'pending_until': datetime.min}
+                })
+                raise
+        mongo.db.study_sessions.update_many(
+            {'_id': {'$in': ids}}, {'$unset': {'pending': '', 'pending_until': '', 'pending_claim': ''}})
+    
+    @staticmethod
+    def _finish_pending(mongo, query, limit=0):
+        # Stored sessions matching query whose totals were left unapplied and
+        # whose lease is up, claimed for a new lease so one writer finishes them
+        now = datetime.utcnow()
+        ids = [doc['_id'] for doc in mongo.db.study_sessions.find(
+            dict(query, pending_until={'$lt': now}), {'_id': 1}).limit(limit)]
+        if not ids:
+            return 0
+        claim = ObjectId()
+        mongo.db.study_sessions.update_many(
+            {'_id': {'$in': ids}, 'pending_until': {'$lt': now}},
+            {'$set': {'pending_until': now + PENDING_LEASE, 'pending_claim': claim}})
+        sessions = list(mongo.db.study_sessions.find({'_id': {'$in': ids}, 'pending_claim': claim}))
+        StudySession._apply(mongo, sessions)
+        return len(sessions)
+    
+    @staticmethod
+    def existing_ids(mongo, user_id, session_ids):
+        # Which of these session ids the user already has (exported rows
+        # coming back in an import)
+        if not session_ids:
+            return set()
+        return {doc['_id'] for doc in mongo.db.study_sessions.find(
+            {'_id': {'$in': list(session_ids)}, 'user_id': ObjectId(user_id)}, {'_id': 1})}
+    
+    @staticmethod
+    def get_today_sessions(mongo, user_id, tz_name=DEFAULT_TIMEZONE):
+        today = local_day(tz_name)
+        cursor = mongo.db.study_sessions.find({
+            'user_id': ObjectId(user_id),
+            'session_date': today
+        }, SESSION_TOTAL_FIELDS)
+        return [SessionTotal(**doc) for doc in cursor]
+    
+    @staticmethod
+    def get_weekly_sessions(mongo, user_id, tz_name=DEFAULT_TIMEZONE):
+        # Local day keys compare directly; no boundary maths in the query
+        week_ago = local_day(tz_name) - timedelta(days=7)
+        cursor = mongo.db.study_sessions.find({
+            'user_id': ObjectId(user_id),
+            'session_date': {'$gte': week_ago}
+        }, SESSION_TOTAL_FIELDS)
+        return [SessionTotal(**doc) for doc in cursor]
+    
+    @staticmethod
+    def get_recent_sessions(mongo, user_id, limit=10, tz_name=DEFAULT_TIMEZONE):
+        # start_time is UTC: start from the instant the local day began
+        week_ago = day_boundaries.window(tz_name)[1] - timedelta(days=7)
+        cursor = mongo.db.study_sessions.find({
+            'user_id': ObjectId(user_id),
+            'start_time': {'$gte': week_ago}
+        }, SESSION_RECORD_FIELDS).sort('start_time', -1).limit(limit)
+        return [SessionRecord(**doc) for doc in cursor]
+
+    @staticmethod
+    def iter_sessions(mongo, user_id, batch_size=1000):
+        # A user's whole history, oldest first, batch_size documents per round trip
+        return mongo.db.study_sessions.find(
+            {'user_id': ObjectId(user_id)}, SESSION_EXPORT_FIELDS
+        ).sort('start_time', 1).batch_size(batch_size)
+
+    @staticmethod
+    def rekey_session_dates(mongo, batch_size=1000, user_ids=None, rekey_all=False, on_batch=None):
+        """Rewrite session_date as the owner's local day key, one bulk_write
+        per batch_size sessions; returns the ids of users whose days moved.
+        
+        Sessions without a timezone field (keyed by UTC day) are converted;
+        with rekey_all so are sessions recorded under an older timezone.
+        on_batch(scanned, updated) is called after every batch.
+        """
+        query = {} if rekey_all else {'timezone': {'$exists': False}}
+        if user_ids is not None:
+            query['user_id'] = {'$in': [ObjectId(u) for u in user_ids]}
+        cursor = mongo.db.study_sessions.find(
+            query, {'_id': 1, 'user_id': 1, 'start_time': 1, 'session_date': 1, 'timezone': 1}
+        ).sort('_id', 1).batch_size(batch_size)
+        
+        moved = set()
+        scanned = updated = 0
+        batch = []
+        
+        def rekey(batch):
+            # One timezone lookup per batch for the users in it
+            zones = {user['_id']: user.get('timezone', DEFAULT_TIMEZONE) for user in mongo.db.users.find(
+                {'_id': {'$in': list({s['user_id'] for s in batch})}}, {'timezone': 1})}
+            operations = []
+            for s in batch:
+                tz_name = zones.get(s['user_id'], DEFAULT_TIMEZONE)
+                if s.get('timezone') == tz_name:
+                    continue
+                day = local_day(tz_name, s['start_time'])
+                operations.append(UpdateOne({'_id': s['_id']},
+                                            {'$set': {'session_date': day, 'timezone': tz_name}}))
+                if day != s['session_date']:
+                    moved.add(s['user_id'])
+            if operations:
+                mongo.db.study_sessions.bulk_write(operations, ordered=False)
+            return len(operations)
+        
+        for s in cursor:
+            batch.append(s)
+            if len(batch) >= batch_size:
+                scanned += len(batch)
+                updated += rekey(batch)
+                batch = []
+                if on_batch:
+                    on_batch(scanned, updated)
+        if batch:
+            scanned += len(batch)
+            updated += rekey(batch)
+            if on_batch:
+                on_batch(scanned, updated)
+        return moved
+
+    @staticmethod
+    def purge_subject(mongo, user_id, subject_id, after=None, batch_size=500, archive=False):
+        # One batch of a deleted subject's sessions, walking the
+        # (user_id, session_date, subject_id) index a day range at a time
+        return purge_batch(mongo.db.study_sessions,
+                           {'user_id': ObjectId(user_id), 'subject_id': ObjectId(subject_id)},
+                           'session_date', after, batch_size,
+                           mongo.db.study_sessions_archive if archive else None)
+
+class DailyRollup:
+    # One document per (user_id, subject_id, day) holding the minutes studied
+    # that day, so totals cost one document per day instead of one per session.
+    
+    @staticmethod
+    def record(mongo, user_id, subject_id, day, duration_minutes, tz_name=DEFAULT_TIMEZONE):
+        # tz_name is the user's, so a late session is judged by their today
+        if day < local_day(tz_name):
+            period_cache.invalidate(ObjectId(user_id))
+        
+        key = {
+            'user_id': ObjectId(user_id),
+            'subject_id': ObjectId(subject_id),
+            'day': day
+        }
+        update = {
+            '$inc': {'minutes': duration_minutes, 'session_count': 1},
+            '$set': {'updated_at': datetime.utcnow()}
+        }
+        try:
+            return mongo.db.daily_rollups.update_one(key, update, upsert=True)
+        except DuplicateKeyError:
+            # Two upserts raced on a new day; the document exists now
+            return mongo.db.daily_rollups.update_one(key, update)
+    
+    @staticmethod
+    def record_many(mongo, sessions):
+        # Fold a batch of sessions into one $inc per rollup key
+        totals = {}
+        for s in sessions:
+            key = (s['user_id'], s['subject_id'], s['session_date'])
+            minutes, count = totals.get(key, (0, 0))
+            totals[key] = (minutes + s['duration_minutes'], count + 1)
+        
+        if not totals:
+            return
+        
+        # Late sessions change periods the analytics cache considers closed
+        for user_id in {s['user_id'] for s in sessions
+                        if s['session_date'] < local_day(s.get('timezone', DEFAULT_TIMEZONE))}:
+            period_cache.invalidate(user_id)
+        
+        now = datetime.utcnow()
+        items = list(totals.items())
+        
+        def rollup_update(item, upsert):
+            (user_id, subject_id, day), (minutes, count) = item
+            return UpdateOne(
+                {'user_id': user_id, 'subject_id': subject_id, 'day': day},
+                {'$inc': {'minutes': minutes, 'session_count': count}, '$set': {'updated_at': now}},
+                upsert=upsert
+            )
+        
+        try:
+            mongo.db.daily_rollups.bulk_write([rollup_update(item, True) for item in items], ordered=False)
+        except BulkWriteError as e:
+            # Upserts that raced on a new day: the documents exist now
+            retry = []
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    raise
+                retry.append(rollup_update(items[error['index']], False))
+            mongo.db.daily_rollups.bulk_write(retry, ordered=False)
+    
+    @staticmethod
+    def get_minutes_by_subject(mongo, user_id, today, since):
+        # Today's and since-`since` minutes per subject in one $facet round trip
+        pipeline = [
+            {'$match': {'user_id': ObjectId(user_id), 'day': {'$gte': since}}},
+            {'$project': {'_id': 0, 'subject_id': 1, 'day': 1, 'minutes': 1}},
+            {'$facet': {
+                'today': [
+                    {'$match': {'day': today}},
+                    {'$group': {'_id': '$subject_id', 'minutes': {'$sum': '$minutes'}}}
+                ],
+                'period': [
+                    {'$group': {'_id': '$subject_id', 'minutes': {'$sum': '$minutes'}}}
+                ]
+            }}
+        ]
+        result = next(mongo.db.daily_rollups.aggregate(pipeline), {'today': [], 'period': []})
+        today_minutes = {doc['_id']: doc['minutes'] for doc in result['today']}
+        period_minutes = {doc['_id']: doc['minutes'] for doc in result['period']}
+        return today_minutes, period_minutes
+    
+    @staticmethod
+    def sum_minutes(mongo, user_id, start, end, subject_id=None):
+        # Minutes studied on days in [start, end], optionally for one subject
+        match = {'user_id': ObjectId(user_id), 'day': {'$gte': start, '$lte': end}}
+        if subject_id is not None:
+            match['subject_id'] = ObjectId(subject_id)
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': None, 'minutes': {'$sum': '$minutes'}}}
+        ]
+        result = next(mongo.db.daily_rollups.aggregate(pipeline), None)
+        return result['minutes'] if result else 0
+    
+    @staticmethod
+    def purge_subject(mongo, user_id, subject_id, after=None, batch_size=500):
+        # Rollups are derived from sessions, so they are never archived
+        return purge_batch(mongo.db.daily_rollups,
+                           {'user_id': ObjectId(user_id), 'subject_id': ObjectId(subject_id)},
+                           'day', after, batch_size)
+    
+    @staticmethod
+    def get_study_days(mongo, user_id, until=None):
+        # Distinct days with study time, newest first, in a single round trip
+        match = {
+            'user_id': ObjectId(user_id),
+            'minutes': {'$gt': 0}
+        }
+        if until is not None:
+            match['day'] = {'$lte': until}
+        
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': '$day'}},
+            {'$sort': {'_id': -1}}
+        ]
+        return [doc['_id'] for doc in mongo.db.daily_rollups.aggregate(pipeline)]
+    
+    @staticmethod
+    def rebuild(mongo, batch_size=1000, user_ids=None):
+        # Recompute every rollup (or those of user_ids) from the raw sessions
+        # and overwrite in bulk; rollups no session backs any more are removed
+        match = {'user_id': {'$in': [ObjectId(u) for u in user_ids]}} if user_ids is not None else {}
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {
+                    'user_id': '$user_id',
+                    'subject_id': '$subject_id',
+                    'day': '$session_date'
+                },
+                'minutes': {'$sum': '$duration_minutes'},
+                'session_count': {'$sum': 1}
+            }}
+        ]
+        
+        written = 0
+        batch = []
+        now = datetime.utcnow()
+        for group in mongo.db.study_sessions.aggregate(pipeline, allowDiskUse=True):
+            key = group['_id']
+            batch.append(ReplaceOne(key, {
+                **key,
+                'minutes': group['minutes'],
+                'session_count': group['session_count'],
+                'updated_at': now
+            }, upsert=True))
+            
+            if len(batch) >= batch_size:
+                mongo.db.daily_rollups.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        
+        if batch:
+            mongo.db.daily_rollups.bulk_write(batch, ordered=False)
+            written += len(batch)
+        # Sessions recorded meanwhile bump updated_at past `now` and are kept
+        mongo.db.daily_rollups.delete_many({**match, 'updated_at': {'$lt': now}})
+        
+        period_cache.clear()
+        return written
+    
+    @staticmethod
+    def get_period_totals(mongo, user_id, start, end, unit, batch_size=500):
+        # Minutes per (period, subject) for days in [start, end), bucketed by
+        # the server; ordered by subject, then period, so callers can emit
+        # one subject's series at a time
+        period = {'date': '$day', 'unit': unit}
+        if unit == 'week':
+            period['startOfWeek'] = 'monday'
+        pipeline = [
+            {'$match': {'user_id': ObjectId(user_id), 'day': {'$gte': start, '$lt': end}}},
+            {'$group': {
+                '_id': {'subject_id': '$subject_id', 'period': {'$dateTrunc': period}},
+                'minutes': {'$sum': '$minutes'}
+            }},
+            {'$sort': {'_id.subject_id': 1, '_id.period': 1}}
+        ]
+        return mongo.db.daily_rollups.aggregate(pipeline, batchSize=batch_size)
+
+
+class Leaderboard:
+    # Weekly minutes and live streaks of every user, updated on each session
+    # write. leaderboard_scores holds one document per (board, user). Next to
+    # it, leaderboard_counts keeps a two-level histogram of each board's
+    # scores (exact score, and coarse buckets of BUCKETS[kind] scores), so a
+    # rank is a sum over a few hundred counters however many users there are.
+    # Days are each user's local day keys; `today` is the viewer's.
+    #
+    # Boards: 'weekly:<monday>' (score = minutes that week) and 'streak'
+    # (score = consecutive study days ending on the document's `day`). A
+    # streak counts while its day is yesterday, today or tomorrow; its
+    # histogram is kept per day under 'streak:<day>'.
+    
+    BUCKETS = {'weekly': 60, 'streak': 30}
+    
+    @staticmethod
+    def weekly_board(day):
+        return f"weekly:{week_start(day):%Y-%m-%d}"
+    
+    @staticmethod
+    def streak_board(day):
+        return f"streak:{day:%Y-%m-%d}"
+    
+    @staticmethod
+    def live_streak_days(today):
+        # Users east of the viewer may already be a day ahead
+        return [today + timedelta(days=1), today, today - timedelta(days=1)]
+    
+    @staticmethod
+    def record_sessions(mongo, sessions):
+        # Fold a batch of new sessions into the weekly and streak boards
+        weekly = {}
+        days = {}
+        for s in sessions:
+            key = (s['user_id'], week_start(s['session_date']))
+            weekly[key] = weekly.get(key, 0) + s['duration_minutes']
+            days.setdefault(s['user_id'], set()).add(s['session_date'])
+        
+        counts = []
+        for (user_id, week), minutes in weekly.items():
+            counts.extend(Leaderboard._add_minutes(mongo, user_id, week, minutes))
+        for user_id, study_days in days.items():
+            counts.extend(Leaderboard._extend_streak(mongo, user_id, study_days))
+        Leaderboard._apply_counts(mongo, counts)
+    
+    @staticmethod
+    def _add_minutes(mongo, user_id, week, minutes):
+        board = Leaderboard.weekly_board(week)
+        key = {'board': board, 'user_id': user_id}
+        update = {'$inc': {'score': minutes, 'writes': 1}, '$set': {'day': week}}
+        try:
+            entry = mongo.db.leaderboard_scores.find_one_and_update(
+                key, update, upsert=True, return_document=ReturnDocument.AFTER,
+                projection={'score': 1, 'writes': 1})
+        except DuplicateKeyError:
+            # Raced with the user's first session of the week on another worker
+            entry = mongo.db.leaderboard_scores.find_one_and_update(
+                key, update, return_document=ReturnDocument.AFTER, projection={'score': 1, 'writes': 1})
+        # writes == 1: this call created the entry, so the user was not ranked
+        old = entry['score'] - minutes if entry['writes'] > 1 else None
+        return Leaderboard._moves(board, old, board, entry['score'], Leaderboard.BUCKETS['weekly'])
+    
+    @staticmethod
+    def _extend_streak(mongo, user_id, study_days, attempts=3, recount=False):
+        # Optimistic read-modify-write; retried if another write moved the streak
+        for _ in range(attempts):
+            entry = mongo.db.leaderboard_scores.find_one(
+                {'board': 'streak', 'user_id': user_id}, {'score': 1, 'day': 1})
+            
+            if entry is None or recount or min(study_days) < entry['day']:
+                # First streak write or a late session: recount from the rollups
+                history = DailyRollup.get_study_days(mongo, user_id)
+                score, day = Leaderboard._streak_from_days(history)
+            else:
+                score, day = entry['score'], entry['day']
+                for study_day in sorted(study_days):
+                    if study_day == day:
+                        continue
+                    score = score + 1 if study_day == day + timedelta(days=1) else 1
+                    day = study_day
+            
+            if entry is not None and (score, day) == (entry['score'], entry['day']):
+                return []
+            
+            try:
+                if day is None:
+                    # Recounted and nothing is left
+                    if entry is None:
+                        return []
+                    result = mongo.db.leaderboard_scores.delete_one(
+                        {'_id': entry['_id'], 'day': entry['day'], 'score': entry['score']})
+                    if result.deleted_count:
+                        return Leaderboard._moves(Leaderboard.streak_board(entry['day']), entry['score'],
+                                                  None, None, Leaderboard.BUCKETS['streak'])
+                    continue
+                if entry is None:
+                    mongo.db.leaderboard_scores.insert_one(
+                        {'board': 'streak', 'user_id': user_id, 'day': day, 'score': score, 'writes': 1})
+                    return Leaderboard._moves(None, None, Leaderboard.streak_board(day), score,
+                                              Leaderboard.BUCKETS['streak'])
+                result = mongo.db.leaderboard_scores.update_one(
+                    {'_id': entry['_id'], 'day': entry['day'], 'score': entry['score']},
+                    {'$set': {'day': day, 'score': score}, '$inc': {'writes': 1}})
+                if result.matched_count:
+                    return Leaderboard._moves(Leaderboard.streak_board(entry['day']), entry['score'],
+                                              Leaderboard.streak_board(day), score, Leaderboard.BUCKETS['streak'])
+            except DuplicateKeyError:
+                pass
+        return []
+    
+    @staticmethod
+    def recount_user(mongo, user_id):
+        # After some of a user's rollups were removed (a deleted subject):
+        # set each kept weekly entry and the streak back to what the
+        # remaining rollups say
+        user_id = ObjectId(user_id)
+        counts = []
+        for entry in mongo.db.leaderboard_scores.find(
+                {'board': {'$regex': '^weekly:'}, 'user_id': user_id}, {'board': 1, 'day': 1, 'score': 1}):
+            minutes = DailyRollup.sum_minutes(mongo, user_id, entry['day'], entry['day'] + timedelta(days=6))
+            if minutes == 0:
+                # Nothing left that week: unranked, as if never studied
+                result = mongo.db.leaderboard_scores.delete_one({'_id': entry['_id'], 'score': entry['score']})
+                if result.deleted_count:
+                    counts.extend(Leaderboard._moves(entry['board'], entry['score'], None, None,
+                                                     Leaderboard.BUCKETS['weekly']))
+            elif minutes != entry['score']:
+                counts.extend(Leaderboard._add_minutes(mongo, user_id, entry['day'], minutes - entry['score']))
+        counts.extend(Leaderboard._extend_streak(mongo, user_id, set(), recount=True))
+        Leaderboard._apply_counts(mongo, counts)
+    
+    @staticmethod
+    def _streak_from_days(days):
+        # (length, last day) of the run ending on the newest of `days` (newest first)
+        if not days:
+            return 0, None
+        score = 1
+        for newer, older in zip(days, days[1:]):
+            if newer - older != timedelta(days=1):
+                break
+            score += 1
+        return score, days[0]
+    
+    @staticmethod
+    def _moves(old_board, old, new_board, new, width):
+        # Histogram changes for one entry going from `old` to `new`
+        changes = []
+        if old is not None:
+            changes += [(old_board, 'fine', old, -1), (old_board, 'coarse', old // width, -1)]
+        if new is not None:
+            changes += [(new_board, 'fine', new, 1), (new_board, 'coarse', new // width, 1)]
+        return changes
+    
+    @staticmethod
+    def _apply_counts(mongo, changes):
+        totals = {}
+        for board, level, bucket, delta in changes:
+            key = (board, level, bucket)
+            totals[key] = totals.get(key, 0) + delta
+        items = [item for item in totals.items() if item[1]]
+        if not items:
+            return
+        
+        def count_update(item, upsert):
+            (board, level, bucket), delta = item
+            # Decrements never create counters (e.g. for a pruned old board)
+            return UpdateOne({'board': board, 'level': level, 'bucket': bucket},
+                             {'$inc': {'count': delta}}, upsert=upsert and delta > 0)
+        
+        try:
+            mongo.db.leaderboard_counts.bulk_write([count_update(item, True) for item in items], ordered=False)
+        except BulkWriteError as e:
+            # Upserts that raced on a new counter: the documents exist now
+            retry = []
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    raise
+                retry.append(count_update(items[error['index']], False))
+            mongo.db.leaderboard_counts.bulk_write(retry, ordered=False)
+    
+    @staticmethod
+    def count_above(mongo, boards, width, score):
+        # (entries scoring more than `score`, all entries) across `boards`:
+        # coarse buckets above score's bucket plus exact scores inside it
+        bucket = score // width
+        pipeline = [
+            {'$match': {'board': {'$in': boards}, '$or': [
+                {'level': 'coarse'},
+                {'level': 'fine', 'bucket': {'$gt': score, '$lt': (bucket + 1) * width}}
+            ]}},
+            {'$group': {
+                '_id': None,
+                'above': {'$sum': {'$cond': [
+                    {'$or': [
+                        {'$eq': ['$level', 'fine']},
+                        {'$gt': ['$bucket', bucket]}
+                    ]}, '$count', 0]}},
+                'total': {'$sum': {'$cond': [{'$eq': ['$level', 'coarse']}, '$count', 0]}}
+            }}
+        ]
+        result = next(mongo.db.leaderboard_counts.aggregate(pipeline), None)
+        return (result['above'], result['total']) if result else (0, 0)
+    
+    @staticmethod
+    def get_rank(mongo, kind, user_id, today):
+        # {'rank', 'score', 'total'} for the user, or None if not on the
+        # board; today is the viewer's local day
+        if kind == 'weekly':
+            entry = mongo.db.leaderboard_scores.find_one(
+                {'board': Leaderboard.weekly_board(today), 'user_id': ObjectId(user_id)}, {'score': 1})
+            boards = [Leaderboard.weekly_board(today)]
+        else:
+            live = Leaderboard.live_streak_days(today)
+            entry = mongo.db.leaderboard_scores.find_one(
+                {'board': 'streak', 'user_id': ObjectId(user_id), 'day': {'$in': live}}, {'score': 1})
+            boards = [Leaderboard.streak_board(day) for day in live]
+        
+        if not entry or entry['score'] <= 0:
+            return None
+        above, total = Leaderboard.count_above(mongo, boards, Leaderboard.BUCKETS[kind], entry['score'])
+        return {'rank': above + 1, 'score': entry['score'], 'total': total}
+    
+    @staticmethod
+    def get_top(mongo, kind, limit, today):
+        # Highest scores first, served by the (board, day, score) index;
+        # today is the viewer's local day
+        if kind == 'weekly':
+            query = {'board': Leaderboard.weekly_board(today), 'day': week_start(today)}
+        else:
+            query = {'board': 'streak', 'day': {'$in': Leaderboard.live_streak_days(today)}}
+        entries = list(mongo.db.leaderboard_scores.find(
+            {**query, 'score': {'$gt': 0}}, {'_id': 0, 'user_id': 1, 'score': 1}
+        ).sort('score', -1).limit(limit))
+        
+        names = {user['_id']: user['name'] for user in mongo.db.users.find(
+            {'_id': {'$in': [entry['user_id'] for entry in entries]}}, {'name': 1})}
+        return [{'user_id': entry['user_id'], 'name': names.get(entry['user_id'], ''), 'score': entry['score']}
+                for entry in entries]
+    
+    @staticmethod
+    def rebuild_counts(mongo, board, query, width):
+        # Recount one board's histogram from its score documents
+        fine = {}
+        for group in mongo.db.leaderboard_scores.aggregate([
+            {'$match': {**query, 'score': {'$gt': 0}}},
+            {'$group': {'_id': '$score', 'count': {'$sum': 1}}}
+        ]):
+            fine[group['_id']] = group['count']
+        coarse = {}
+        for score, count in fine.items():
+            coarse[score // width] = coarse.get(score // width, 0) + count
+        
+        mongo.db.leaderboard_counts.delete_many({'board': board})
+        documents = [{'board': board, 'level': 'fine', 'bucket': score, 'count': count}
+                     for score, count in fine.items()]
+        documents += [{'board': board, 'level': 'coarse', 'bucket': bucket, 'count': count}
+                      for bucket, count in coarse.items()]
+        if documents:
+            mongo.db.leaderboard_counts.insert_many(documents)
+    
+    @staticmethod
+    def rebuild(mongo, today=None, keep_weeks=8, batch_size=1000):
+        """Recompute the current weekly boards and the live streaks from
+        daily_rollups, correcting any drift in the incremental updates;
+        returns entries written.
+
+        Rollup days are local, so at any moment users are on different days:
+        `today` defaults to the UTC day, and every user's local day is within
+        one day of it. Each weekly board one of those days falls in is
+        rebuilt, so on Sunday/Monday both the ending and the new week are."""
+        today = today or utc_day()
+        live = Leaderboard.live_streak_days(today)
+        week = week_start(today)
+        stamp = datetime.utcnow()
+        written = 0
+        
+        def write(batch):
+            if batch:
+                mongo.db.leaderboard_scores.bulk_write(batch, ordered=False)
+            return len(batch)
+        
+        # Each current week's minutes per user
+        for current_week in sorted({week_start(day) for day in live}):
+            board = Leaderboard.weekly_board(current_week)
+            batch = []
+            for group in mongo.db.daily_rollups.aggregate([
+                {'$match': {'day': {'$gte': current_week, '$lt': current_week + timedelta(days=7)}}},
+                {'$group': {'_id': '$user_id', 'minutes': {'$sum': '$minutes'}}},
+                {'$match': {'minutes': {'$gt': 0}}}
+            ], allowDiskUse=True):
+                batch.append(ReplaceOne({'board': board, 'user_id': group['_id']}, {
+                    'board': board, 'user_id': group['_id'], 'day': current_week,
+                    'score': group['minutes'], 'writes': 1, 'rebuilt_at': stamp
+                }, upsert=True))
+                if len(batch) >= batch_size:
+                    written += write(batch)
+                    batch = []
+            written += write(batch)
+            mongo.db.leaderboard_scores.delete_many({'board': board, 'rebuilt_at': {'$ne': stamp}})
+            Leaderboard.rebuild_counts(mongo, board, {'board': board}, Leaderboard.BUCKETS['weekly'])
+        
+        # Live streaks: users who studied on a live day, recounted a batch of
+        # users at a time from their study days
+        
+        def rewrite_streaks(users):
+            days = {}
+            for group in mongo.db.daily_rollups.aggregate([
+                {'$match': {'user_id': {'$in': users}, 'day': {'$lte': live[0]}, 'minutes': {'$gt': 0}}},
+                {'$group': {'_id': {'user_id': '$user_id', 'day': '$day'}}}
+            ], allowDiskUse=True):
+                days.setdefault(group['_id']['user_id'], []).append(group['_id']['day'])
+            
+            replacements = []
+            for user_id, study_days in days.items():
+                score, day = Leaderboard._streak_from_days(sorted(study_days, reverse=True))
+                replacements.append(ReplaceOne({'board': 'streak', 'user_id': user_id}, {
+                    'board': 'streak', 'user_id': user_id, 'day': day,
+                    'score': score, 'writes': 1, 'rebuilt_at': stamp
+                }, upsert=True))
+            return write(replacements)
+        
+        users = []
+        for group in mongo.db.daily_rollups.aggregate([
+            {'$match': {'day': {'$in': live}, 'minutes': {'$gt': 0}}},
+            {'$group': {'_id': '$user_id'}}
+        ], allowDiskUse=True):
+            users.append(group['_id'])
+            if len(users) >= batch_size:
+                written += rewrite_streaks(users)
+                users = []
+        if users:
+            written += rewrite_streaks(users)
+        # Entries claiming a live streak the rollups do not back up
+        mongo.db.leaderboard_scores.delete_many(
+            {'board': 'streak', 'day': {'$in': live}, 'rebuilt_at': {'$ne': stamp}})
+        for day in live:
+            Leaderboard.rebuild_counts(mongo, Leaderboard.streak_board(day),
+                                       {'board': 'streak', 'day': day}, Leaderboard.BUCKETS['streak'])
+        
+        # Prune histograms and weekly entries nobody can rank against any more
+        live_boards = [Leaderboard.streak_board(day) for day in live]
+        oldest_board = Leaderboard.weekly_board(week - timedelta(weeks=keep_weeks))
+        mongo.db.leaderboard_counts.delete_many({'$or': [
+            {'board': {'$regex': '^streak:', '$nin': live_boards}},
+            {'board': {'$regex': '^weekly:', '$lt': oldest_board}}
+        ]})
+        mongo.db.leaderboard_scores.delete_many({'board': {'$regex': '^weekly:', '$lt': oldest_board}})
+        return written
+
+class ActiveTimer:
+    # The running or paused timer of a user, one document keyed by user_id so
+    # any device can resume it. Work done so far is elapsed_seconds plus the
+    # time since running_since (None while paused). Heartbeats only push
+    # last_seen and expires_at forward; the TTL index drops timers whose
+    # owner has been gone for TIMER_TTL_SECONDS.
+    
+    @staticmethod
+    def start(mongo, timer):
+        mongo.db.active_timers.replace_one({'_id': timer['_id']}, timer, upsert=True)
+        return timer
+    
+    @staticmethod
+    def get(mongo, user_id, now=None):
+        return mongo.db.active_timers.find_one({
+            '_id': ObjectId(user_id),
+            'expires_at': {'$gt': now or datetime.utcnow()}
+        })
+    
+    @staticmethod
+    def update(mongo, user_id, expected, changes):
+        # Compare-and-set: only applies while the fields in `expected` still match
+        return mongo.db.active_timers.find_one_and_update(
+            {'_id': ObjectId(user_id), **expected},
+            {'$set': changes},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def touch_many(mongo, beats, ttl):
+        # beats: {(user_id, timer_id): seen_at}, written in one bulk_write.
+        # $max keeps a late, older heartbeat from moving a timer backwards.
+        operations = [
+            UpdateOne({'_id': ObjectId(user_id), 'timer_id': timer_id},
+                      {'$max': {'last_seen': seen_at, 'expires_at': seen_at + ttl}})
+            for (user_id, timer_id), seen_at in beats.items()
+        ]
+        if operations:
+            mongo.db.active_timers.bulk_write(operations, ordered=False)
+    
+    @staticmethod
+    def claim(mongo, user_id, timer_id=None, now=None):
+        # Remove and return the timer; of two concurrent stops only one gets it
+        query = {'_id': ObjectId(user_id), 'expires_at': {'$gt': now or datetime.utcnow()}}
+        if timer_id is not None:
+            query['timer_id'] = timer_id
+        return mongo.db.active_timers.find_one_and_delete(query)
+
+class Goal:
+    # A measurable target: target_minutes of study (of one subject, or of all
+    # when subject_id is None) on days from start_date to target_date, both
+    # user-local day keys. progress_minutes is kept up to date by every
+    # session write, so listing goals never touches sessions or rollups;
+    # evaluate_goals.py recounts goals close to their target_date.
+    
+    @staticmethod
+    def create_goal(mongo, user_id, title, description, target_date, target_minutes=None,
+                    subject_id=None, start_date=None):
+        # Convert date to datetime for MongoDB
+        if isinstance(target_date, date):
+            target_date = datetime.combine(target_date, datetime.min.time())
+        
+        goal = {
+            'user_id': ObjectId(user_id),
+            'title': title,
+            'description': description,
+            'target_date': target_date,
+            'is_completed': False,
+            'created_at': datetime.utcnow()
+        }
+        if target_minutes:
+            # Day keys are local: without a start, it is the user's today
+            start_date = start_date or local_day(User.get_timezone(mongo, user_id))
+            subject_id = ObjectId(subject_id) if subject_id else None
+            # Whatever was studied earlier on the first day already counts
+            progress = DailyRollup.sum_minutes(mongo, user_id, start_date, target_date, subject_id)
+            goal.update({
+                'subject_id': subject_id,
+                'start_date': start_date,
+                'target_minutes': target_minutes,
+                'progress_minutes': progress,
+                'is_completed': progress >= target_minutes,
+                'completed_at': datetime.utcnow() if progress >= target_minutes else None
+            })
+        return mongo.db.goals.insert_one(goal)
+    
+    @staticmethod
+    def get_user_goals(mongo, user_id):
+        # Stored progress only, soonest target first, from the (user_id, target_date) index
+        return list(mongo.db.goals.find({'user_id': ObjectId(user_id)}, GOAL_FIELDS).sort('target_date', 1))
+    
+    @staticmethod
+    def delete_goal(mongo, goal_id, user_id):
+        return mongo.db.goals.delete_one({'_id': ObjectId(goal_id), 'user_id': ObjectId(user_id)})
+    
+    @staticmethod
+    def record_sessions(mongo, sessions):
+        # Add new sessions to every goal whose window holds their day: one
+        # $inc per (user, subject, day), then one pass flagging goals that
+        # reached their target, all in a single ordered bulk_write
+        totals = {}
+        for s in sessions:
+            key = (s['user_id'], s['subject_id'], s['session_date'])
+            totals[key] = totals.get(key, 0) + s['duration_minutes']
+        if not totals:
+            return
+        
+        operations = [
+            UpdateMany({
+                'user_id': user_id,
+                'target_date': {'$gte': day},
+                'start_date': {'$lte': day},
+                'subject_id': {'$in': [subject_id, None]}
+            }, {'$inc': {'progress_minutes': minutes}})
+            for (user_id, subject_id, day), minutes in totals.items()
+        ]
+        operations.append(UpdateMany({
+            'user_id': {'$in': list({user_id for user_id, _, _ in totals})},
+            'is_completed': False,
+            # Plain goals have no target; null >= null would complete them
+            'target_minutes': {'$gt': 0},
+            '$expr': {'$gte': ['$progress_minutes', '$target_minutes']}
+        }, {'$set': {'is_completed': True, 'completed_at': datetime.utcnow()}}))
+        mongo.db.goals.bulk_write(operations)
+    
+    @staticmethod
+    def iter_due(mongo, start, end, batch_size=1000):
+        # Measurable goals whose target_date falls in [start, end]
+        return mongo.db.goals.find(
+            {'target_date': {'$gte': start, '$lte': end}, 'target_minutes': {'$gt': 0}},
+            GOAL_PROGRESS_FIELDS
+        ).sort('target_date', 1).batch_size(batch_size)
+    
+    @staticmethod
+    def reevaluate(mongo, today=None, horizon_days=3, grace_days=1, batch_size=1000):
+        """Recount the progress of goals due from today - grace_days to
+        today + horizon_days from the daily rollups, fixing any drift in the
+        incremental updates; returns (goals checked, goals changed).
+
+        target_date is each user's local day and `today` defaults to the UTC
+        day, which every local day is within one day of, so the window is
+        widened by a day on both sides to hold it in every timezone."""
+        today = today or utc_day()
+        checked = changed = 0
+        batch = []
+        for goal in Goal.iter_due(mongo, today - timedelta(days=grace_days + 1),
+                                  today + timedelta(days=horizon_days + 1), batch_size):
+            batch.append(goal)
+            if len(batch) >= batch_size:
+                checked += len(batch)
+                changed += Goal._recount(mongo, batch)
+                batch = []
+        if batch:
+            checked += len(batch)
+            changed += Goal._recount(mongo, batch)
+        return checked, changed
+    
+    @staticmethod
+    def recount_user(mongo, user_id):
+        # Every measurable goal of one user, e.g. after a subject was deleted
+        goals = list(mongo.db.goals.find({'user_id': ObjectId(user_id), 'target_minutes': {'$gt': 0}},
+                                         GOAL_PROGRESS_FIELDS))
+        return Goal._recount(mongo, goals) if goals else 0
+    
+    @staticmethod
+    def _recount(mongo, goals):
+        # One rollup aggregation and one bulk_write for a batch of goals;
+        # returns the number of goals whose progress changed
+        windows = {}
+        for goal in goals:
+            first, last = windows.get(goal['user_id'], (goal['start_date'], goal['target_date']))
+            windows[goal['user_id']] = (min(first, goal['start_date']), max(last, goal['target_date']))
+        minutes = {}
+        for row in mongo.db.daily_rollups.aggregate([
+            {'$match': {'$or': [{'user_id': user_id, 'day': {'$gte': first, '$lte': last}}
+                                for user_id, (first, last) in windows.items()]}},
+            {'$group': {'_id': {'user_id': '$user_id', 'subject_id': '$subject_id', 'day': '$day'},
+                        'minutes': {'$sum': '$minutes'}}}
+        ], allowDiskUse=True):
+            minutes.setdefault(row['_id']['user_id'], []).append(
+                (row['_id']['subject_id'], row['_id']['day'], row['minutes']))
+        
+        now = datetime.utcnow()
+        operations = []
+        for goal in goals:
+            progress = sum(m for subject_id, day, m in minutes.get(goal['user_id'], ())
+                           if goal['start_date'] <= day <= goal['target_date']
+                           and goal.get('subject_id') in (None, subject_id))
+            completed = progress >= goal['target_minutes']
+            if (progress, completed) == (goal.get('progress_minutes'), goal['is_completed']):
+                continue
+            update = {'progress_minutes': progress, 'is_completed': completed, 'evaluated_at': now}
+            if completed != goal['is_completed']:
+                update['completed_at'] = now if completed else None
+            operations.append(UpdateOne({'_id': goal['_id']}, {'$set': update}))
+        if operations:
+            mongo.db.goals.bulk_write(operations, ordered=False)
+        return len(operations)
+    
+    @staticmethod
+    def purge_subject(mongo, user_id, subject_id, after=None, batch_size=500, archive=False):
+        # One batch of the goals set on a deleted subject
+        return purge_batch(mongo.db.goals,
+                           {'user_id': ObjectId(user_id), 'subject_id': ObjectId(subject_id)},
+                           'target_date', after, batch_size,
+                           mongo.db.goals_archive if archive else None)
+
+class Job:
+    # Background work in the jobs collection, run by JobRunner (app/jobs.py).
+    # A job is claimed with a lease that the worker renews after every batch;
+    # a job whose lease ran out (its worker died) is claimed again, so job
+    # handlers must be safe to restart from the beginning.
+    
+    @staticmethod
+    def enqueue(mongo, kind, user_id, params):
+        now = datetime.utcnow()
+        job = {
+            'kind': kind,
+            'user_id': ObjectId(user_id),
+            'params': params,
+            'status': 'queued',
+            'phase': None,
+            'progress': {},
+            'attempts': 0,
+            'error': None,
+            'lease_until': now,
+            'created_at': now,
+            'updated_at': now
+        }
+        return mongo.db.jobs.insert_one(job)
+    
+    @staticmethod
+    def claim(mongo, worker, lease):
+        # Oldest runnable job: queued, or running under an expired lease
+        now = datetime.utcnow()
+        return mongo.db.jobs.find_one_and_update(
+            {'status': {'$in': ['queued', 'running']}, 'lease_until': {'$lte': now}},
+            {'$set': {'status': 'running', 'worker': worker, 'lease_until': now + lease, 'updated_at': now},
+             '$inc': {'attempts': 1}},
+            sort=[('lease_until', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def record_progress(mongo, job_id, worker, phase, counts, lease):
+        # Also renews the lease; False when another worker has taken the job over
+        now = datetime.utcnow()
+        update = {'$set': {'phase': phase, 'lease_until': now + lease, 'updated_at': now}}
+        if counts:
+            update['$inc'] = {f'progress.{name}': n for name, n in counts.items()}
+        result = mongo.db.jobs.update_one({'_id': job_id, 'worker': worker, 'status': 'running'}, update)
+        return result.matched_count == 1
+    
+    @staticmethod
+    def finish(mongo, job_id, worker, status, error=None, retry_at=None):
+        # status 'done' or 'failed', or 'queued' to run again from retry_at
+        now = datetime.utcnow()
+        changes = {'status': status, 'error': error, 'updated_at': now}
+        if status == 'queued':
+            changes['lease_until'] = retry_at or now
+        else:
+            changes['finished_at'] = now
+        return mongo.db.jobs.update_one({'_id': job_id, 'worker': worker}, {'$set': changes})
+    
+    @staticmethod
+    def get(mongo, job_id, user_id):
+        return mongo.db.jobs.find_one({'_id': ObjectId(job_id), 'user_id': ObjectId(user_id)}, JOB_FIELDS)
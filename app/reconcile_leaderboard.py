@@ -0,0 +1,38 @@
+from app import create_app, mongo
+from app.models import Leaderboard
+import argparse
+import sys
+import time
+
+def reconcile_leaderboard(batch_size=1000, keep_weeks=8):
+    """Rebuild the current weekly boards and the live streaks from the daily
+    rollups; runs in an app context. Users' days are local, so around the
+    week change both weeks count as current (see Leaderboard.rebuild)."""
+    try:
+        print("Reconciling leaderboards with the daily rollups...")
+        written = Leaderboard.rebuild(mongo.db, keep_weeks=keep_weeks, batch_size=batch_size)
+        print(f"✓ Rewrote {written} leaderboard entr{'y' if written == 1 else 'ies'}")
+        return True
+    except Exception as e:
+        print(f"❌ Error during leaderboard reconciliation: {e}")
+        print("Please check your MongoDB connection and try again.")
+        return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Correct drift in the incrementally kept leaderboards')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--keep-weeks', type=int, default=8, help='weekly boards to keep')
+    parser.add_argument('--every', type=int, help='keep running, reconciling every N seconds')
+    args = parser.parse_args()
+    
+    print("Starting StudyMate Leaderboard Reconciliation...")
+    print("="*50)
+    
+    # One app (and so one MongoClient) for every pass
+    app = create_app()
+    with app.app_context():
+        while True:
+            ok = reconcile_leaderboard(args.batch_size, args.keep_weeks)
+            if not args.every:
+                sys.exit(0 if ok else 1)
+            time.sleep(args.every)
@@ -1,233 +1,684 @@
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash
-from bson import ObjectId
-from datetime import datetime, date, timedelta
-from app.forms import SubjectForm, GoalForm
-from app.models import Subject, StudySession, Goal
-from app import mongo
-
-main = Blueprint('main', __name__)
-
-@main.route('/')
-def index():
-    if 'user_id' not in session:
-        return render_template('index.html')
-    return redirect(url_for('main.dashboard'))
-
-@main.route('/dashboard')
-def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-    
-    user_id = session['user_id']
-    
-    # Get user's subjects
-    subjects = Subject.get_user_subjects(mongo.db, user_id)
-    
-    # Get today's sessions
-    today_sessions = StudySession.get_today_sessions(mongo.db, user_id)
-    total_today_minutes = sum(session['duration_minutes'] for session in today_sessions)
-    
-    # Get weekly progress
-    weekly_sessions = StudySession.get_weekly_sessions(mongo.db, user_id)
-    
-    # Calculate subject-wise progress
-    subject_progress = {}
-    for subject in subjects:
-        subject_sessions = [s for s in today_sessions if str(s['subject_id']) == str(subject['_id'])]
-        subject_today_minutes = sum(s['duration_minutes'] for s in subject_sessions)
-        subject_progress[str(subject['_id'])] = {
-            'today_minutes': subject_today_minutes,
-            'daily_goal_minutes': subject.get('weekly_goal_hours', 1) * 60 / 7
-        }
-    
-    return render_template('dashboard.html', 
-                         subjects=subjects,
-                         total_today_minutes=total_today_minutes,
-                         subject_progress=subject_progress,
-                         weekly_sessions=weekly_sessions,
-                         now=datetime.utcnow())
-
-@main.route('/timer')
-def timer():
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-    
-    subjects = Subject.get_user_subjects(mongo.db, session['user_id'])
-    return render_template('timer.html', subjects=subjects)
-
-@main.route('/progress')
-def progress():
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-    
-    user_id = session['user_id']
-    subjects = Subject.get_user_subjects(mongo.db, user_id)
-    weekly_sessions = StudySession.get_weekly_sessions(mongo.db, user_id)
-    
-    # Calculate streak
-    streak = calculate_streak(mongo.db, user_id)
-    
-    # Prepare chart data
-    chart_data = prepare_chart_data(subjects, weekly_sessions)
-    
-    return render_template('progress.html', 
-                         subjects=subjects,
-                         weekly_sessions=weekly_sessions,
-                         streak=streak,
-                         chart_data=chart_data,
-                         now=datetime.utcnow())
-
-@main.route('/subjects', methods=['GET', 'POST'])
-def subjects():
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-    
-    form = SubjectForm()
-    if form.validate_on_submit():
-        Subject.create_subject(mongo.db, 
-                             session['user_id'],
-                             form.name.data,
-                             form.color.data,
-                             form.icon.data,
-                             form.weekly_goal_hours.data)
-        flash('Subject added successfully!', 'success')
-        return redirect(url_for('main.subjects'))
-    
-    user_subjects = Subject.get_user_subjects(mongo.db, session['user_id'])
-    return render_template('subjects.html', form=form, subjects=user_subjects)
-
-@main.route('/settings')
-def settings():
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-    
-    return render_template('settings.html', now=datetime.utcnow())
-
-# API Routes
-@main.route('/api/start_timer', methods=['POST'])
-def start_timer():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    data = request.get_json()
-    subject_id = data.get('subject_id')
-    duration = data.get('duration')
-    
-    if not subject_id or not duration:
-        return jsonify({'error': 'Missing parameters'}), 400
-    
-    # In a real app, you might want to track active timers
-    return jsonify({'success': True, 'message': 'Timer started'})
-
-@main.route('/api/stop_timer', methods=['POST'])
-def stop_timer():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    data = request.get_json()
-    subject_id = data.get('subject_id')
-    duration = data.get('duration')
-    
-    if not subject_id or not duration:
-        return jsonify({'error': 'Missing parameters'}), 400
-    
-    # Save the study session
-    StudySession.create_session(mongo.db, session['user_id'], subject_id, duration)
-    
-    return jsonify({'success': True, 'message': 'Study session saved'})
-
-@main.route('/api/delete_subject/<subject_id>', methods=['DELETE'])
-def delete_subject(subject_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    result = Subject.delete_subject(mongo.db, subject_id, session['user_id'])
-    if result.deleted_count > 0:
-        return jsonify({'success': True, 'message': 'Subject deleted'})
-    else:
-        return jsonify({'error': 'Subject not found'}), 404
-
-def calculate_streak(mongo_db, user_id):
-    # Simplified streak calculation using datetime
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    streak = 0
-    
-    for i in range(30):  # Check last 30 days
-        check_date = today - timedelta(days=i)
-        sessions = list(mongo_db.study_sessions.find({
-            'user_id': ObjectId(user_id),
-            'session_date': check_date
-        }))
-        
-        if sessions and any(s['duration_minutes'] > 0 for s in sessions):
-            streak += 1
-        else:
-            break
-    
-    return streak
-
-def prepare_chart_data(subjects, sessions):
-    # Prepare data for Chart.js
-    subject_names = [subject['name'] for subject in subjects]
-    subject_times = [0] * len(subjects)
-    
-    subject_id_to_index = {str(subject['_id']): i for i, subject in enumerate(subjects)}
-    
-    for session in sessions:
-        subject_id = str(session['subject_id'])
-        if subject_id in subject_id_to_index:
-            index = subject_id_to_index[subject_id]
-            subject_times[index] += session['duration_minutes'] / 60  # Convert to hours
-    
-    return {
-        'subject_names': subject_names,
-        'subject_times': subject_times,
-        'subject_colors': [subject['color'] for subject in subjects]
-    }
-
-@main.route('/api/dashboard_stats')
-def dashboard_stats():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-    
-    user_id = session['user_id']
-    
-    # Get today's sessions
-    today_sessions = StudySession.get_today_sessions(mongo.db, user_id)
-    total_today_minutes = sum(session['duration_minutes'] for session in today_sessions)
-    today_hours = round(total_today_minutes / 60, 1)
-    
-    # Get weekly sessions
-    weekly_sessions = StudySession.get_weekly_sessions(mongo.db, user_id)
-    weekly_hours = round(sum(session['duration_minutes'] for session in weekly_sessions) / 60, 1)
-    
-    # Get subjects and calculate progress
-    subjects = Subject.get_user_subjects(mongo.db, user_id)
-    subject_progress = []
-    
-    for subject in subjects:
-        subject_sessions = [s for s in today_sessions if str(s['subject_id']) == str(subject['_id'])]
-        subject_today_minutes = sum(s['duration_minutes'] for s in subject_sessions)
-        daily_goal_minutes = subject.get('weekly_goal_hours', 1) * 60 / 7
-        percentage = min(round((subject_today_minutes / daily_goal_minutes) * 100, 1), 100) if daily_goal_minutes > 0 else 0
-        
-        subject_progress.append({
-            'subject_id': str(subject['_id']),
-            'today_minutes': subject_today_minutes,
-            'percentage': percentage
-        })
-    
-    # Calculate daily goal percentage
-    total_daily_goal = sum(subject.get('weekly_goal_hours', 0) for subject in subjects) / 7
-    daily_goal_percentage = round((today_hours / total_daily_goal) * 100, 1) if total_daily_goal > 0 else 0
-    
-    return jsonify({
-        'success': True,
-        'stats': {
-            'today_hours': today_hours,
-            'weekly_hours': weekly_hours,
-            'subject_count': len(subjects),
-            'daily_goal_percentage': daily_goal_percentage,
-            'subject_progress': subject_progress
-        }
-    })
\ No newline at end of file
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, make_response, Response, stream_with_context, current_app
+from bson import ObjectId
+from datetime import datetime, date, timedelta, timezone
+import csv
+import json
+import queue
+from app.forms import SubjectForm, GoalForm, TimezoneForm
+from app.models import User, Subject, StudySession, DailyRollup, Leaderboard, Goal, local_day
+from app.analytics import parse_range, stream_series
+from app.transfer import FORMATS, export_rows, stream_export, detect_format, read_rows, import_key
+from app import mongo, events, ingestor, timers, jobs, analytics_db
+
+main = Blueprint('main', __name__)
+
+@main.route('/')
+def index():
+    if 'user_id' not in session:
+        return render_template('index.html')
+    return redirect(url_for('main.dashboard'))
+
+@main.route('/dashboard')
+def dashboard():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    
+    # Get user's subjects
+    subjects = Subject.get_user_subjects(mongo.db, user_id)
+    
+    # Get today's and this week's totals from the daily rollups
+    today_minutes, weekly_minutes = summarize_rollups(mongo.db, user_id, local_day(user_timezone()))
+    total_today_minutes = sum(today_minutes.get(subject['_id'], 0) for subject in subjects)
+    
+    # Calculate subject-wise progress
+    subject_progress = {}
+    for subject in subjects:
+        subject_progress[str(subject['_id'])] = {
+            'today_minutes': today_minutes.get(subject['_id'], 0),
+            'daily_goal_minutes': subject.get('weekly_goal_hours', 1) * 60 / 7
+        }
+    
+    return render_template('dashboard.html', 
+                         subjects=subjects,
+                         total_today_minutes=total_today_minutes,
+                         subject_progress=subject_progress,
+                         weekly_minutes=sum(weekly_minutes.get(subject['_id'], 0) for subject in subjects),
+                         now=datetime.utcnow())
+
+@main.route('/timer')
+def timer():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    subjects = Subject.get_user_subjects(mongo.db, session['user_id'])
+    return render_template('timer.html', subjects=subjects)
+
+@main.route('/progress')
+def progress():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    tz_name = user_timezone()
+    today = local_day(tz_name)
+    # Read-only page: served from a secondary when one is available
+    db = analytics_db()
+    subjects = Subject.get_user_subjects(db, user_id)
+    _, weekly_minutes = summarize_rollups(db, user_id, today)
+    recent_sessions = StudySession.get_recent_sessions(db, user_id, tz_name=tz_name)
+    
+    # Calculate streak
+    streak = calculate_streak(db, user_id, today)
+    
+    # Prepare chart data
+    chart_data = prepare_chart_data(subjects, weekly_minutes)
+    
+    return render_template('progress.html', 
+                         subjects_by_id={subject['_id']: subject for subject in subjects},
+                         recent_sessions=recent_sessions,
+                         streak=streak,
+                         chart_data=chart_data,
+                         now=datetime.utcnow())
+
+@main.route('/leaderboard')
+def leaderboard():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    today = local_day(user_timezone())
+    db = analytics_db()
+    boards = {kind: {
+        'top': Leaderboard.get_top(db, kind, limit=current_app.config['LEADERBOARD_SIZE'], today=today),
+        'mine': Leaderboard.get_rank(db, kind, user_id, today)
+    } for kind in ('weekly', 'streak')}
+    
+    return render_template('leaderboard.html', boards=boards, user_id=user_id)
+
+@main.route('/api/leaderboard')
+def leaderboard_api():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    kind = request.args.get('board', 'weekly')
+    if kind not in Leaderboard.BUCKETS:
+        return jsonify({'error': 'board must be weekly or streak'}), 400
+    limit = min(request.args.get('limit', current_app.config['LEADERBOARD_SIZE'], type=int), 100)
+    
+    today = local_day(user_timezone())
+    db = analytics_db()
+    return jsonify({
+        'success': True,
+        'board': kind,
+        'top': [{**entry, 'user_id': str(entry['user_id'])}
+                for entry in Leaderboard.get_top(db, kind, limit, today)],
+        'mine': Leaderboard.get_rank(db, kind, session['user_id'], today)
+    })
+
+@main.route('/subjects', methods=['GET', 'POST'])
+def subjects():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    form = SubjectForm()
+    if form.validate_on_submit():
+        Subject.create_subject(mongo.db, 
+                             session['user_id'],
+                             form.name.data,
+                             form.color.data,
+                             form.icon.data,
+                             form.weekly_goal_hours.data)
+        User.bump_stats_version(mongo.db, session['user_id'])
+        flash('Subject added successfully!', 'success')
+        return redirect(url_for('main.subjects'))
+    
+    user_subjects = Subject.get_user_subjects(mongo.db, session['user_id'])
+    return render_template('subjects.html', form=form, subjects=user_subjects)
+
+@main.route('/goals', methods=['GET', 'POST'])
+def goals():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    user_subjects = Subject.get_user_subjects(mongo.db, user_id)
+    today = local_day(user_timezone())
+    
+    form = GoalForm()
+    form.subject.choices = [('', 'All subjects')] + [(str(s['_id']), s['name']) for s in user_subjects]
+    if form.validate_on_submit():
+        target_date = datetime.combine(form.target_date.data, datetime.min.time())
+        if target_date < today:
+            flash('Target date must not be in the past.', 'error')
+        else:
+            Goal.create_goal(mongo.db,
+                             user_id,
+                             form.title.data,
+                             form.description.data,
+                             target_date,
+                             target_minutes=form.target_hours.data * 60,
+                             subject_id=form.subject.data or None,
+                             start_date=today)
+            flash('Goal created successfully!', 'success')
+            return redirect(url_for('main.goals'))
+    
+    # Progress is stored on each goal; nothing here reads sessions
+    user_goals = Goal.get_user_goals(mongo.db, user_id)
+    subject_names = {s['_id']: s['name'] for s in user_subjects}
+    return render_template('goals.html', form=form, goals=user_goals,
+                           subject_names=subject_names, today=today)
+
+@main.route('/settings', methods=['GET', 'POST'])
+def settings():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    form = TimezoneForm(timezone=user_timezone())
+    if form.validate_on_submit():
+        User.set_timezone(mongo.db, session['user_id'], form.timezone.data)
+        session['timezone'] = form.timezone.data
+        flash('Timezone updated.', 'success')
+        return redirect(url_for('main.settings'))
+    
+    return render_template('settings.html', form=form, now=datetime.utcnow())
+
+# API Routes
+@main.route('/api/start_timer', methods=['POST'])
+def start_timer():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    timer_id = data.get('timer_id')
+    subject_id = data.get('subject_id')
+    duration = data.get('duration')
+    
+    if not isinstance(timer_id, str) or not 0 < len(timer_id) <= 64:
+        return jsonify({'error': 'Missing parameters'}), 400
+    if isinstance(duration, bool) or not isinstance(duration, int) or not 0 < duration <= 24 * 60:
+        return jsonify({'error': 'Missing parameters'}), 400
+    
+    user_id = session['user_id']
+    if subject_id not in {str(subject['_id']) for subject in Subject.get_user_subjects(mongo.db, user_id)}:
+        return jsonify({'error': 'Unknown subject'}), 400
+    
+    # Starting again with the same timer_id resumes it; a different one
+    # finishes (and saves) whatever timer the user had running elsewhere
+    timer, replaced = timers.start(user_id, timer_id, subject_id, duration)
+    if replaced is not None:
+        save_timer_session(user_id, replaced, timers.elapsed_seconds(replaced), user_timezone())
+    
+    return jsonify({'success': True, 'message': 'Timer started', 'timer': timers.describe(timer)})
+
+@main.route('/api/timer_heartbeat', methods=['POST'])
+def timer_heartbeat():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('timer_id'), str):
+        return jsonify({'error': 'Missing parameters'}), 400
+    
+    # Buffered in this process; written in bulk, not once per beat
+    timers.heartbeat(session['user_id'], data['timer_id'])
+    return '', 204
+
+@main.route('/api/pause_timer', methods=['POST'])
+def pause_timer():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    timer = timers.pause(session['user_id'], data.get('timer_id'))
+    if timer is None:
+        return jsonify({'error': 'No active timer'}), 404
+    return jsonify({'success': True, 'timer': timers.describe(timer)})
+
+@main.route('/api/active_timer')
+def active_timer():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    timer = timers.get(session['user_id'])
+    return jsonify({'success': True, 'timer': timers.describe(timer) if timer else None})
+
+@main.route('/api/stop_timer', methods=['POST'])
+def stop_timer():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    user_id = session['user_id']
+    
+    # The duration is measured here; whatever the client counted is ignored
+    timer, seconds = timers.stop(user_id, data.get('timer_id'))
+    if timer is None:
+        return jsonify({'error': 'No active timer'}), 404
+    
+    if data.get('discard'):
+        return jsonify({'success': True, 'saved': False, 'duration_minutes': 0, 'message': 'Timer discarded'})
+    
+    duration = save_timer_session(user_id, timer, seconds, user_timezone())
+    return jsonify({
+        'success': True,
+        'saved': duration > 0,
+        'duration_minutes': duration,
+        'message': 'Study session saved' if duration else 'Less than a minute studied'
+    })
+
+def save_timer_session(user_id, timer, seconds, tz_name):
+    # Whole minutes, saved under the timer's id so a client that also queued
+    # the session (e.g. the response was lost) cannot store it twice
+    duration = round(seconds / 60)
+    if duration > 0:
+        ingestor.submit(user_id, timer['subject_id'], duration, client_id=timer['timer_id'], tz_name=tz_name)
+    return duration
+
+@ingestor.on_flush
+def sessions_recorded(user_ids):
+    # Push the fresh numbers to every open dashboard of these users; this
+    # may run on the ingest thread, away from any login session
+    for user_id in user_ids:
+        User.bump_stats_version(mongo.db, user_id)
+        today = local_day(User.get_timezone(mongo.db, user_id))
+        events.publish(user_id, build_dashboard_stats(mongo.db, user_id, today))
+
+@main.route('/api/sessions/bulk', methods=['POST'])
+def bulk_sessions():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    items = data.get('sessions')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing parameters'}), 400
+    if len(items) > current_app.config.get('BULK_SESSIONS_MAX', 100):
+        return jsonify({'error': 'Too many sessions'}), 413
+    
+    user_id = session['user_id']
+    tz_name = user_timezone()
+    subject_ids = {str(subject['_id']) for subject in Subject.get_user_subjects(mongo.db, user_id)}
+    
+    accepted = []
+    rejected = []
+    seen = set()
+    for item in items:
+        study_session = parse_client_session(user_id, item, subject_ids, tz_name)
+        if study_session is None:
+            rejected.append(item.get('client_id') if isinstance(item, dict) else None)
+        elif study_session['client_id'] not in seen:
+            seen.add(study_session['client_id'])
+            accepted.append(study_session)
+    
+    # One bulk_write; sessions already uploaded by an earlier retry are skipped
+    inserted = StudySession.insert_client_sessions(mongo.db, accepted)
+    if inserted:
+        sessions_recorded({user_id})
+    
+    return jsonify({
+        'success': True,
+        'accepted': [s['client_id'] for s in accepted],
+        'saved': len(inserted),
+        'rejected': rejected
+    })
+
+def parse_client_session(user_id, item, subject_ids, tz_name):
+    # Validate one queued session from the timer client; None if unusable
+    if not isinstance(item, dict):
+        return None
+    
+    client_id = item.get('client_id')
+    subject_id = item.get('subject_id')
+    duration = item.get('duration')
+    
+    if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+        return None
+    if subject_id not in subject_ids:
+        return None
+    if isinstance(duration, bool) or not isinstance(duration, int) or not 0 < duration <= 24 * 60:
+        return None
+    
+    now = datetime.utcnow()
+    recorded_at = now
+    if item.get('completed_at'):
+        try:
+            recorded_at = datetime.fromisoformat(str(item['completed_at']).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if recorded_at.tzinfo is not None:
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+        recorded_at = min(recorded_at, now)
+    
+    return StudySession.build_session(user_id, subject_id, duration,
+                                      recorded_at=recorded_at, client_id=client_id, tz_name=tz_name)
+
+@main.route('/api/export')
+def export_sessions():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    user_id = session['user_id']
+    db = analytics_db()
+    subject_names = {subject['_id']: subject['name'] for subject in Subject.get_user_subjects(db, user_id)}
+    cursor = StudySession.iter_sessions(db, user_id, current_app.config['EXPORT_BATCH_SIZE'])
+    
+    # Rows are serialized as the cursor yields them; nothing is buffered
+    response = Response(stream_with_context(stream_export(export_rows(cursor, subject_names), fmt)),
+                        mimetype=FORMATS[fmt])
+    filename = f'studymate-sessions-{local_day(user_timezone()):%Y%m%d}.{fmt}'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@main.route('/api/import', methods=['POST'])
+def import_sessions():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if (request.content_length or 0) > current_app.config['IMPORT_MAX_BYTES']:
+        return jsonify({'error': 'File too large'}), 413
+    
+    # A multipart upload (field 'file') or the raw request body
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = detect_format(request.args.get('format'),
+                        upload.filename if upload else None,
+                        upload.mimetype if upload else request.mimetype)
+    if fmt is None:
+        return jsonify({'error': 'Upload a .csv or .ndjson file'}), 400
+    
+    user_id = session['user_id']
+    tz_name = user_timezone()
+    # One subject lookup for the whole file; rows may name a subject or give its id
+    subjects = Subject.get_user_subjects(mongo.db, user_id)
+    subject_ids = {str(subject['_id']) for subject in subjects}
+    subjects_by_name = {subject['name'].strip().lower(): str(subject['_id']) for subject in subjects}
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    
+    counts = {'imported': 0, 'duplicates': 0, 'rejected': 0}
+    rejected_lines = []
+    batch = []
+    
+    def write_batch():
+        # Rows exported from this account are still stored under their id;
+        # ordered=False insert_many for the rest, where rows already
+        # imported hit the client_id index
+        existing = StudySession.existing_ids(mongo.db, user_id, {source_id for _, source_id in batch if source_id})
+        sessions = [s for s, source_id in batch if source_id not in existing]
+        inserted = StudySession.insert_sessions(mongo.db, sessions) if sessions else []
+        counts['imported'] += len(inserted)
+        counts['duplicates'] += len(batch) - len(inserted)
+        batch.clear()
+    
+    try:
+        for line, row in read_rows(stream, fmt):
+            parsed = parse_import_row(user_id, row, subject_ids, subjects_by_name, tz_name)
+            if parsed is None:
+                counts['rejected'] += 1
+                if len(rejected_lines) < 20:
+                    rejected_lines.append(line)
+                continue
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                write_batch()
+    except (UnicodeDecodeError, csv.Error):
+        error = 'File is not valid UTF-8 CSV/NDJSON'
+    else:
+        error = None
+    if batch:
+        write_batch()
+    
+    if counts['imported']:
+        sessions_recorded({user_id})
+    
+    body = {'success': error is None, **counts, 'rejected_lines': rejected_lines}
+    if error:
+        body['error'] = error
+    return jsonify(body), 200 if error is None else 400
+
+def parse_import_row(user_id, row, subject_ids, subjects_by_name, tz_name):
+    # Map an export/import row onto the timer client's session shape and
+    # validate it the same way; (session, exported session id or None), or
+    # None if unusable
+    if not row:
+        return None
+    
+    subject_id = str(row.get('subject_id') or '').strip()
+    if subject_id not in subject_ids:
+        subject_id = subjects_by_name.get(str(row.get('subject') or '').strip().lower())
+    
+    duration = row.get('duration_minutes', row.get('duration'))
+    try:
+        duration = int(str(duration).strip())
+    except ValueError:
+        return None
+    
+    start_time = str(row.get('start_time') or row.get('date') or '').strip()
+    if not start_time:
+        return None
+    
+    source_id = str(row.get('id') or '').strip()
+    source_id = ObjectId(source_id) if ObjectId.is_valid(source_id) else None
+    study_session = parse_client_session(user_id, {
+        'client_id': import_key(start_time, subject_id, duration, source_id),
+        'subject_id': subject_id,
+        'duration': duration,
+        'completed_at': start_time
+    }, subject_ids, tz_name)
+    return (study_session, source_id) if study_session is not None else None
+
+@main.route('/api/delete_subject/<subject_id>', methods=['DELETE'])
+def delete_subject(subject_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if not ObjectId.is_valid(subject_id):
+        return jsonify({'error': 'Subject not found'}), 404
+    
+    # Hidden right away; its sessions, rollups and goals go in the background
+    user_id = session['user_id']
+    result = Subject.delete_subject(mongo.db, subject_id, user_id)
+    if result.modified_count > 0:
+        User.bump_stats_version(mongo.db, user_id)
+        job_id = jobs.enqueue('delete_subject', user_id, subject_id=ObjectId(subject_id),
+                              archive=current_app.config['SUBJECT_DELETE_MODE'] == 'archive')
+        return jsonify({'success': True, 'message': 'Subject deleted', 'job_id': str(job_id)}), 202
+    else:
+        return jsonify({'error': 'Subject not found'}), 404
+
+@main.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = jobs.get(job_id, session['user_id'])
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': jobs.describe(job)})
+
+@main.route('/api/delete_goal/<goal_id>', methods=['DELETE'])
+def delete_goal(goal_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not ObjectId.is_valid(goal_id):
+        return jsonify({'error': 'Goal not found'}), 404
+    
+    result = Goal.delete_goal(mongo.db, goal_id, session['user_id'])
+    if result.deleted_count > 0:
+        return jsonify({'success': True, 'message': 'Goal deleted'})
+    else:
+        return jsonify({'error': 'Goal not found'}), 404
+
+def user_timezone():
+    # The logged-in user's timezone, kept in the login session; looked up
+    # once for sessions that predate it
+    if 'timezone' not in session:
+        session['timezone'] = User.get_timezone(mongo.db, session['user_id'])
+    return session['timezone']
+
+def calculate_streak(mongo_db, user_id, today):
+    # One aggregation for every studied day, then walk the streak in memory
+    study_dates = DailyRollup.get_study_days(mongo_db, user_id, until=today)
+    
+    streak = 0
+    expected = today
+    for study_date in study_dates:
+        if study_date != expected:
+            break
+        streak += 1
+        expected -= timedelta(days=1)
+    
+    return streak
+
+def summarize_rollups(mongo_db, user_id, today):
+    # Today's and the last week's minutes per subject, keyed by subject
+    # ObjectId; `today` is the user's local day key
+    return DailyRollup.get_minutes_by_subject(mongo_db, user_id, today, today - timedelta(days=7))
+
+def prepare_chart_data(subjects, subject_minutes):
+    # Prepare data for Chart.js
+    subject_names = [subject['name'] for subject in subjects]
+    subject_times = [subject_minutes.get(subject['_id'], 0) / 60 for subject in subjects]  # Convert to hours
+    
+    return {
+        'subject_names': subject_names,
+        'subject_times': subject_times,
+        'subject_colors': [subject['color'] for subject in subjects]
+    }
+
+def build_dashboard_stats(mongo_db, user_id, today):
+    # Get today's and weekly totals in one aggregation over the daily rollups
+    today_minutes, weekly_minutes = summarize_rollups(mongo_db, user_id, today)
+    
+    # Only current subjects count: a deleted subject's rollups linger until
+    # its cleanup job has run
+    subjects = Subject.get_user_subjects(mongo_db, user_id)
+    total_today_minutes = sum(today_minutes.get(subject['_id'], 0) for subject in subjects)
+    today_hours = round(total_today_minutes / 60, 1)
+    weekly_hours = round(sum(weekly_minutes.get(subject['_id'], 0) for subject in subjects) / 60, 1)
+    
+    # Calculate progress
+    subject_progress = []
+    
+    for subject in subjects:
+        subject_today_minutes = today_minutes.get(subject['_id'], 0)
+        daily_goal_minutes = subject.get('weekly_goal_hours', 1) * 60 / 7
+        percentage = min(round((subject_today_minutes / daily_goal_minutes) * 100, 1), 100) if daily_goal_minutes > 0 else 0
+        
+        subject_progress.append({
+            'subject_id': str(subject['_id']),
+            'today_minutes': subject_today_minutes,
+            'percentage': percentage
+        })
+    
+    # Calculate daily goal percentage
+    total_daily_goal = sum(subject.get('weekly_goal_hours', 0) for subject in subjects) / 7
+    daily_goal_percentage = round((today_hours / total_daily_goal) * 100, 1) if total_daily_goal > 0 else 0
+    
+    return {
+        'today_hours': today_hours,
+        'weekly_hours': weekly_hours,
+        'subject_count': len(subjects),
+        'daily_goal_percentage': daily_goal_percentage,
+        'subject_progress': subject_progress
+    }
+
+def dashboard_etag(mongo_db, user_id, today):
+    # Stats change on writes (version counter) and when the user's day rolls over
+    version = User.get_stats_version(mongo_db, user_id)
+    return f"{version}-{today:%Y%m%d}"
+
+@main.route('/api/dashboard_stats')
+def dashboard_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    today = local_day(user_timezone())
+    
+    # Version and stats come from the same (possibly secondary) handle, and
+    # the version is read first, so an ETag never claims newer data than the
+    # body it is sent with
+    db = analytics_db()
+    
+    # Answer unchanged polls from the version counter alone
+    etag = dashboard_etag(db, user_id, today)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    response = jsonify({
+        'success': True,
+        'stats': build_dashboard_stats(db, user_id, today)
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@main.route('/api/analytics')
+def analytics():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    today = local_day(user_timezone())
+    try:
+        unit, periods, end = parse_range(request.args, current_app.config['ANALYTICS_MAX_PERIODS'], today)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    db = analytics_db()
+    subjects = Subject.get_user_subjects(db, user_id)
+    subject_id = request.args.get('subject')
+    if subject_id:
+        subjects = [subject for subject in subjects if str(subject['_id']) == subject_id]
+        if not subjects:
+            return jsonify({'error': 'Subject not found'}), 404
+    
+    response = Response(
+        stream_with_context(stream_series(db, user_id, subjects, unit, periods, end, today,
+                                          current_app.config['ANALYTICS_BATCH_SIZE'])),
+        mimetype='application/json'
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@main.route('/api/stream/dashboard')
+def dashboard_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    # 204 tells EventSource not to reconnect; the page falls back to polling
+    if not current_app.config.get('SSE_ENABLED'):
+        return '', 204
+    
+    user_id = session['user_id']
+    tz_name = user_timezone()
+    keepalive = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+    subscription = events.subscribe(user_id)
+    
+    def generate():
+        try:
+            # Current numbers first, then only what stop_timer publishes
+            yield format_sse('stats', build_dashboard_stats(mongo.db, user_id, local_day(tz_name)))
+            while True:
+                try:
+                    stats = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse('stats', stats)
+        finally:
+            events.unsubscribe(user_id, subscription)
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
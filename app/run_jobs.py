@@ -0,0 +1,59 @@
+from app import create_app, mongo, jobs
+import argparse
+import sys
+import time
+
+def enqueue_orphans():
+    """Queue cleanup jobs for rollups (and so sessions) of subjects that no
+    longer exist, e.g. deleted before deletion cascaded"""
+    pipeline = [
+        {'$group': {'_id': {'user_id': '$user_id', 'subject_id': '$subject_id'}}},
+        {'$lookup': {'from': 'db.subjects', 'localField': '_id.subject_id',
+                     'foreignField': '_id', 'as': 'subject'}},
+        {'$match': {'subject': []}}
+    ]
+    queued = 0
+    for orphan in mongo.db.db.daily_rollups.aggregate(pipeline, allowDiskUse=True):
+        jobs.enqueue('delete_subject', orphan['_id']['user_id'], subject_id=orphan['_id']['subject_id'],
+                     archive=False)
+        queued += 1
+    return queued
+
+def run_jobs(orphans=False):
+    """Run every queued job, then return; runs in an app context"""
+    try:
+        if orphans:
+            queued = enqueue_orphans()
+            print(f"✓ Queued cleanup of {queued} orphaned subject(s)")
+        ran = jobs.run_pending()
+        stats = jobs.stats()
+        print(f"✓ Ran {ran} job(s) in {stats['batches']} batch(es), {stats['failures']} failure(s)")
+        applied = jobs.apply_pending_sessions()
+        if applied:
+            print(f"✓ Applied the totals of {applied} study session(s) left pending")
+        return True
+    except Exception as e:
+        print(f"❌ Error while running jobs: {e}")
+        print("Please check your MongoDB connection and try again.")
+        return False
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run queued background jobs (subject deletion cleanup, pending session totals)')
+    parser.add_argument('--orphans', action='store_true',
+                        help='first queue cleanup for sessions of subjects that no longer exist')
+    parser.add_argument('--every', type=int, help='keep running, checking for jobs every N seconds')
+    args = parser.parse_args()
+    
+    print("Starting StudyMate Job Runner...")
+    print("="*50)
+    
+    # One app (and so one MongoClient) for every pass; this process is the
+    # worker, so no extra thread
+    app = create_app()
+    jobs.mode = 'none'
+    with app.app_context():
+        ok = run_jobs(args.orphans)
+        while args.every:
+            time.sleep(args.every)
+            ok = run_jobs()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,124 @@
+from app import create_app, mongo
+from app.models import StudySession, Leaderboard, DEFAULT_TIMEZONE, utc_day
+from app.init_db import resolve_collection
+from app.hashing import password_hasher
+from bson import ObjectId
+from datetime import datetime, timedelta
+import argparse
+import random
+import sys
+
+SEED_PASSWORD = 'password123'
+SUBJECT_NAMES = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'History',
+                 'Literature', 'Economics', 'Computer Science', 'Philosophy', 'Languages']
+COLORS = ['#6366F1', '#8B5CF6', '#10B981', '#F59E0B', '#EF4444', '#3B82F6', '#06B6D4', '#84CC16']
+ICONS = ['📚', '🧠', '🔬', '∫', 'α', '📖', '✏️', '📊']
+
+# Mostly timer presets, with some stopped-early and custom sessions
+DURATIONS = [25, 45, 60, 15, 30, 90, 5]
+DURATION_WEIGHTS = [45, 20, 15, 8, 6, 4, 2]
+
+def seed_email(index):
+    return f'bench-user-{index}@example.com'
+
+def generate_sessions(rng, user_id, subject_ids, count, days):
+    """Spread `count` sessions over the last `days` days like a real user would"""
+    today = utc_day()
+    # Some days are skipped entirely, recent days are busier, and one or two
+    # subjects get most of the attention
+    active_days = [d for d in range(days) if rng.random() < 0.7] or [0]
+    day_weights = [1.0 / (1 + d / 30) for d in active_days]
+    subject_weights = [1.0 / (i + 1) for i in range(len(subject_ids))]
+
+    sessions = []
+    for _ in range(count):
+        day = rng.choices(active_days, weights=day_weights)[0]
+        recorded_at = today - timedelta(days=day) + timedelta(
+            hours=rng.choice([8, 9, 10, 14, 15, 16, 19, 20, 21, 22]),
+            minutes=rng.randrange(60)
+        )
+        recorded_at = min(recorded_at, datetime.utcnow())
+        sessions.append(StudySession.build_session(
+            user_id,
+            rng.choices(subject_ids, weights=subject_weights)[0],
+            rng.choices(DURATIONS, weights=DURATION_WEIGHTS)[0],
+            recorded_at=recorded_at
+        ))
+    return sessions
+
+def seed_database(db, users=10, subjects=4, sessions=200, days=90, seed=42, batch_size=5000):
+    """Create users x subjects x sessions of synthetic history; returns the emails"""
+    rng = random.Random(seed)
+    # Hash once: every seeded user shares the same password
+    password_hash = password_hasher.hash(SEED_PASSWORD)
+    now = datetime.utcnow()
+    emails = []
+
+    for index in range(users):
+        email = seed_email(index)
+        users_collection = resolve_collection(db, 'users')
+        
+        # Re-seeding replaces the user and all of their history
+        previous = users_collection.find_one({'email': email}, {'_id': 1})
+        if previous:
+            for name in ('subjects', 'study_sessions', 'daily_rollups', 'leaderboard_scores', 'goals'):
+                resolve_collection(db, name).delete_many({'user_id': previous['_id']})
+            users_collection.delete_one({'_id': previous['_id']})
+        
+        user_id = users_collection.insert_one({
+            'email': email,
+            'password_hash': password_hash,
+            'name': f'Bench User {index}',
+            'daily_goal_hours': 2,
+            'preferred_timer_duration': 25,
+            'timezone': DEFAULT_TIMEZONE,
+            'stats_version': 0,
+            'created_at': now,
+            'updated_at': now
+        }).inserted_id
+        emails.append(email)
+
+        subject_docs = [{
+            '_id': ObjectId(),
+            'user_id': user_id,
+            'name': SUBJECT_NAMES[i % len(SUBJECT_NAMES)],
+            'color': COLORS[i % len(COLORS)],
+            'icon': ICONS[i % len(ICONS)],
+            'weekly_goal_hours': rng.randint(2, 10),
+            'created_at': now
+        } for i in range(subjects)]
+        if not subject_docs:
+            continue
+        resolve_collection(db, 'subjects').insert_many(subject_docs)
+        history = generate_sessions(rng, user_id, [s['_id'] for s in subject_docs], sessions, days)
+        for start in range(0, len(history), batch_size):
+            # Keeps the daily rollups in step with the raw sessions
+            StudySession.insert_sessions(db, history[start:start + batch_size])
+
+    # Replaced users leave entries behind in the score histograms
+    Leaderboard.rebuild(db)
+    return emails
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed StudyMate with synthetic study history')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--subjects', type=int, default=4, help='subjects per user')
+    parser.add_argument('--sessions', type=int, default=200, help='sessions per user')
+    parser.add_argument('--days', type=int, default=90, help='days of history')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print("Seeding StudyMate database...")
+    print("="*50)
+
+    app = create_app()
+    with app.app_context():
+        try:
+            emails = seed_database(mongo.db, args.users, args.subjects, args.sessions, args.days, args.seed)
+        except Exception as e:
+            print(f"❌ Error while seeding: {e}")
+            sys.exit(1)
+
+    print(f"✓ Created {len(emails)} user(s) with {args.subjects} subject(s) and {args.sessions} session(s) each")
+    print(f"✓ Log in as {seed_email(0)} / {SEED_PASSWORD}")
+    print("="*50)
@@ -1,161 +1,173 @@
-// Chart.js initialization and management
-
-class StudyCharts {
-    constructor() {
-        this.charts = new Map();
-        this.initializeCharts();
-    }
-
-    initializeCharts() {
-        this.initializeSubjectDistributionChart();
-        this.initializeWeeklyProgressChart();
-        this.initializeDailyTrendChart();
-    }
-
-    initializeSubjectDistributionChart() {
-        const ctx = document.getElementById('subjectDistributionChart');
-        if (!ctx) return;
-
-        const chartData = JSON.parse(ctx.getAttribute('data-chart'));
-        
-        this.charts.set('distribution', new Chart(ctx, {
-            type: 'doughnut',
-            data: {
-                labels: chartData.subject_names,
-                datasets: [{
-                    data: chartData.subject_times,
-                    backgroundColor: chartData.subject_colors,
-                    borderWidth: 2,
-                    borderColor: '#FFFFFF'
-                }]
-            },
-            options: {
-                responsive: true,
-                plugins: {
-                    legend: {
-                        position: 'bottom',
-                    },
-                    title: {
-                        display: true,
-                        text: 'Study Time Distribution'
-                    }
-                }
-            }
-        }));
-    }
-
-    initializeWeeklyProgressChart() {
-        const ctx = document.getElementById('weeklyProgressChart');
-        if (!ctx) return;
-
-        // This would typically come from server-side data
-        const weeklyData = this.getWeeklyData();
-        
-        this.charts.set('weekly', new Chart(ctx, {
-            type: 'bar',
-            data: {
-                labels: ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-                datasets: [{
-                    label: 'Study Hours',
-                    data: weeklyData,
-                    backgroundColor: '#6366F1',
-                    borderRadius: 8
-                }]
-            },
-            options: {
-                responsive: true,
-                plugins: {
-                    title: {
-                        display: true,
-                        text: 'Weekly Study Progress'
-                    }
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        title: {
-                            display: true,
-                            text: 'Hours'
-                        }
-                    }
-                }
-            }
-        }));
-    }
-
-    initializeDailyTrendChart() {
-        const ctx = document.getElementById('dailyTrendChart');
-        if (!ctx) return;
-
-        const trendData = this.getDailyTrendData();
-        
-        this.charts.set('trend', new Chart(ctx, {
-            type: 'line',
-            data: {
-                labels: trendData.labels,
-                datasets: [{
-                    label: 'Daily Study Time',
-                    data: trendData.data,
-                    borderColor: '#8B5CF6',
-                    backgroundColor: 'rgba(139, 92, 246, 0.1)',
-                    tension: 0.4,
-                    fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                plugins: {
-                    title: {
-                        display: true,
-                        text: 'Daily Study Trend'
-                    }
-                },
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        title: {
-                            display: true,
-                            text: 'Hours'
-                        }
-                    }
-                }
-            }
-        }));
-    }
-
-    getWeeklyData() {
-        // Mock data - in real app, this would come from the server
-        return [2, 3, 1.5, 2.5, 4, 1, 2];
-    }
-
-    getDailyTrendData() {
-        // Mock data for the last 7 days
-        const labels = [];
-        const data = [];
-        
-        for (let i = 6; i >= 0; i--) {
-            const date = new Date();
-            date.setDate(date.getDate() - i);
-            labels.push(date.toLocaleDateString('en', { weekday: 'short' }));
-            data.push(Math.random() * 4 + 1); // Random data between 1-5 hours
-        }
-        
-        return { labels, data };
-    }
-
-    updateCharts() {
-        // Method to refresh all charts with new data
-        this.charts.forEach(chart => {
-            chart.destroy();
-        });
-        this.charts.clear();
-        this.initializeCharts();
-    }
-}
-
-// Initialize charts when page loads
-document.addEventListener('DOMContentLoaded', function() {
-    if (document.querySelector('.chart-container')) {
-        window.studyCharts = new StudyCharts();
-    }
+// Chart.js initialization and management
+
+class StudyCharts {
+    constructor() {
+        this.charts = new Map();
+        this.initializeCharts();
+    }
+
+    initializeCharts() {
+        this.initializeSubjectDistributionChart();
+        this.initializeWeeklyProgressChart();
+        this.initializeDailyTrendChart();
+    }
+
+    initializeSubjectDistributionChart() {
+        const ctx = document.getElementById('subjectDistributionChart');
+        if (!ctx) return;
+
+        const chartData = JSON.parse(ctx.getAttribute('data-chart'));
+        
+        this.charts.set('distribution', new Chart(ctx, {
+            type: 'doughnut',
+            data: {
+                labels: chartData.subject_names,
+                datasets: [{
+                    data: chartData.subject_times,
+                    backgroundColor: chartData.subject_colors,
+                    borderWidth: 2,
+                    borderColor: '#FFFFFF'
+                }]
+            },
+            options: {
+                responsive: true,
+                plugins: {
+                    legend: {
+                        position: 'bottom',
+                    },
+                    title: {
+                        display: true,
+                        text: 'Study Time Distribution'
+                    }
+                }
+            }
+        }));
+    }
+
+    async initializeWeeklyProgressChart() {
+        const ctx = document.getElementById('weeklyProgressChart');
+        if (!ctx) return;
+
+        // Last 12 weeks, one stacked series per subject
+        const analytics = await this.loadAnalytics('week', 7 * 11 + 1);
+        if (!analytics) return;
+
+        this.charts.set('weekly', new Chart(ctx, {
+            type: 'bar',
+            data: {
+                labels: analytics.periods.map(period => this.formatPeriod(period, 'week')),
+                datasets: analytics.series.map(series => ({
+                    label: series.name,
+                    data: series.minutes.map(minutes => minutes / 60),
+                    backgroundColor: series.color,
+                    borderRadius: 8
+                }))
+            },
+            options: {
+                responsive: true,
+                plugins: {
+                    title: {
+                        display: true,
+                        text: 'Weekly Study Progress'
+                    }
+                },
+                scales: {
+                    x: {
+                        stacked: true
+                    },
+                    y: {
+                        stacked: true,
+                        beginAtZero: true,
+                        title: {
+                            display: true,
+                            text: 'Hours'
+                        }
+                    }
+                }
+            }
+        }));
+    }
+
+    async initializeDailyTrendChart() {
+        const ctx = document.getElementById('dailyTrendChart');
+        if (!ctx) return;
+
+        // Last 30 days, all subjects together
+        const analytics = await this.loadAnalytics('day', 30);
+        if (!analytics) return;
+
+        this.charts.set('trend', new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: analytics.periods.map(period => this.formatPeriod(period, 'day')),
+                datasets: [{
+                    label: 'Daily Study Time',
+                    data: analytics.totals.map(minutes => minutes / 60),
+                    borderColor: '#8B5CF6',
+                    backgroundColor: 'rgba(139, 92, 246, 0.1)',
+                    tension: 0.4,
+                    fill: true
+                }]
+            },
+            options: {
+                responsive: true,
+                plugins: {
+                    title: {
+                        display: true,
+                        text: 'Daily Study Trend'
+                    }
+                },
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        title: {
+                            display: true,
+                            text: 'Hours'
+                        }
+                    }
+                }
+            }
+        }));
+    }
+
+    async loadAnalytics(bucket, days) {
+        // Columnar series from /api/analytics for the last `days` days; the
+        // server ends the range on today in the user's own timezone
+        const params = new URLSearchParams({ bucket, days });
+
+        try {
+            const response = await fetch(`/api/analytics?${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error('Error loading analytics:', error);
+            return null;
+        }
+    }
+
+    formatPeriod(period, bucket) {
+        const date = new Date(`${period}T00:00:00Z`);
+        if (bucket === 'week') {
+            return date.toLocaleDateString('en', { month: 'short', day: 'numeric', timeZone: 'UTC' });
+        }
+        return date.toLocaleDateString('en', { weekday: 'short', day: 'numeric', timeZone: 'UTC' });
+    }
+
+    updateCharts() {
+        // Method to refresh all charts with new data
+        this.charts.forEach(chart => {
+            chart.destroy();
+        });
+        this.charts.clear();
+        this.initializeCharts();
+    }
+}
+
+// Initialize charts when page loads
+document.addEventListener('DOMContentLoaded', function() {
+    if (document.querySelector('.chart-container')) {
+        window.studyCharts = new StudyCharts();
+    }
 });
\ No newline at end of file
@@ -1,105 +1,146 @@
-// Dashboard real-time functionality
-
-class DashboardUpdater {
-    constructor() {
-        this.updateInterval = 30000; // Update every 30 seconds
-        this.init();
-    }
-
-    init() {
-        // Update stats immediately
-        this.updateStats();
-        
-        // Set up periodic updates
-        setInterval(() => {
-            this.updateStats();
-        }, this.updateInterval);
-
-        // Add event listeners for manual refresh
-        this.addEventListeners();
-    }
-
-    async updateStats() {
-        try {
-            const response = await fetch('/api/dashboard_stats');
-            const data = await response.json();
-            
-            if (data.success) {
-                this.updateDisplay(data.stats);
-            }
-        } catch (error) {
-            console.error('Error updating dashboard stats:', error);
-        }
-    }
-
-    updateDisplay(stats) {
-        // Update today's study time
-        const todayElement = document.querySelector('.stat-number');
-        if (todayElement) {
-            todayElement.textContent = `${stats.today_hours}h`;
-        }
-
-        // Update subject progress bars
-        stats.subject_progress.forEach(subject => {
-            const progressBar = document.querySelector(`[data-subject-id="${subject.subject_id}"] .progress-fill`);
-            if (progressBar) {
-                progressBar.style.width = `${subject.percentage}%`;
-                
-                // Update time display
-                const timeDisplay = progressBar.closest('.subject-card').querySelector('.subject-time');
-                if (timeDisplay) {
-                    timeDisplay.textContent = `${subject.today_minutes}m today`;
-                }
-            }
-        });
-
-        // Update weekly total
-        const weeklyElement = document.querySelectorAll('.stat-number')[2];
-        if (weeklyElement) {
-            weeklyElement.textContent = `${stats.weekly_hours}h`;
-        }
-
-        // Update goal progress
-        const goalElement = document.querySelectorAll('.stat-number')[3];
-        if (goalElement) {
-            goalElement.textContent = `${stats.daily_goal_percentage}%`;
-        }
-    }
-
-    addEventListeners() {
-        // Refresh button if exists
-        const refreshBtn = document.getElementById('refreshStats');
-        if (refreshBtn) {
-            refreshBtn.addEventListener('click', () => {
-                this.updateStats();
-                this.showNotification('Stats updated!', 'success');
-            });
-        }
-    }
-
-    showNotification(message, type) {
-        const flashContainer = document.querySelector('.flash-messages');
-        if (flashContainer) {
-            const flash = document.createElement('div');
-            flash.className = `flash ${type}`;
-            flash.textContent = message;
-            flashContainer.appendChild(flash);
-            
-            setTimeout(() => flash.remove(), 3000);
-        }
-    }
-}
-
-// Global function to update dashboard stats
-function updateDashboardStats() {
-    if (window.dashboardUpdater) {
-        window.dashboardUpdater.updateStats();
-    }
-}
-
-// Initialize dashboard updater
-document.addEventListener('DOMContentLoaded', function() {
-    if (document.querySelector('.dashboard-header')) {
-        window.dashboardUpdater = new DashboardUpdater();
-    }
+// Dashboard real-time functionality
+
+class DashboardUpdater {
+    constructor() {
+        this.updateInterval = 30000; // Poll every 30 seconds when streaming is unavailable
+        this.etag = null; // Last ETag seen, sent back as If-None-Match
+        this.stream = null;
+        this.pollTimer = null;
+        this.init();
+    }
+
+    init() {
+        // Prefer server push (it sends current stats on connect) where the
+        // server offers it; otherwise poll
+        const header = document.querySelector('.dashboard-header');
+        if (window.EventSource && header.dataset.stream === 'on') {
+            this.connectStream();
+        } else {
+            this.updateStats();
+            this.startPolling();
+        }
+
+        // Add event listeners for manual refresh
+        this.addEventListeners();
+    }
+
+    connectStream() {
+        this.stream = new EventSource('/api/stream/dashboard');
+
+        this.stream.addEventListener('stats', (event) => {
+            this.updateDisplay(JSON.parse(event.data));
+        });
+
+        this.stream.onerror = () => {
+            // EventSource reconnects on its own unless the server refused us
+            if (this.stream.readyState === EventSource.CLOSED) {
+                this.updateStats();
+                this.startPolling();
+            }
+        };
+    }
+
+    startPolling() {
+        if (this.pollTimer) return;
+
+        this.pollTimer = setInterval(() => {
+            this.updateStats();
+        }, this.updateInterval);
+    }
+
+    async updateStats() {
+        try {
+            const headers = {};
+            if (this.etag) {
+                headers['If-None-Match'] = this.etag;
+            }
+
+            const response = await fetch('/api/dashboard_stats', { headers, cache: 'no-store' });
+            
+            // Nothing changed since the last poll
+            if (response.status === 304) {
+                return;
+            }
+
+            this.etag = response.headers.get('ETag');
+            const data = await response.json();
+            
+            if (data.success) {
+                this.updateDisplay(data.stats);
+            }
+        } catch (error) {
+            console.error('Error updating dashboard stats:', error);
+        }
+    }
+
+    updateDisplay(stats) {
+        // Update today's study time
+        const todayElement = document.querySelector('.stat-number');
+        if (todayElement) {
+            todayElement.textContent = `${stats.today_hours}h`;
+        }
+
+        // Update subject progress bars
+        stats.subject_progress.forEach(subject => {
+            const progressBar = document.querySelector(`[data-subject-id="${subject.subject_id}"] .progress-fill`);
+            if (progressBar) {
+                progressBar.style.width = `${subject.percentage}%`;
+                
+                // Update time display
+                const timeDisplay = progressBar.closest('.subject-card').querySelector('.subject-time');
+                if (timeDisplay) {
+                    timeDisplay.textContent = `${subject.today_minutes}m today`;
+                }
+            }
+        });
+
+        // Update weekly total
+        const weeklyElement = document.querySelectorAll('.stat-number')[2];
+        if (weeklyElement) {
+            weeklyElement.textContent = `${stats.weekly_hours}h`;
+        }
+
+        // Update goal progress
+        const goalElement = document.querySelectorAll('.stat-number')[3];
+        if (goalElement) {
+            goalElement.textContent = `${stats.daily_goal_percentage}%`;
+        }
+    }
+
+    addEventListeners() {
+        // Refresh button if exists
+        const refreshBtn = document.getElementById('refreshStats');
+        if (refreshBtn) {
+            refreshBtn.addEventListener('click', () => {
+                this.updateStats();
+                this.showNotification('Stats updated!', 'success');
+            });
+        }
+    }
+
+    showNotification(message, type) {
+        const flashContainer = document.querySelector('.flash-messages');
+        if (flashContainer) {
+            const flash = document.createElement('div');
+            flash.className = `flash ${type}`;
+            flash.textContent = message;
+            flashContainer.appendChild(flash);
+            
+            setTimeout(() => flash.remove(), 3000);
+        }
+    }
+}
+
+// Global function to update dashboard stats
+function updateDashboardStats() {
+    if (window.dashboardUpdater) {
+        window.dashboardUpdater.updateStats();
+    }
+}
+
+// Initialize dashboard updater
+document.addEventListener('DOMContentLoaded', function() {
+    if (document.querySelector('.dashboard-header')) {
+        window.dashboardUpdater = new DashboardUpdater();
+    }
 });
\ No newline at end of file
@@ -1,105 +1,195 @@
-// Main JavaScript functionality
-
-document.addEventListener('DOMContentLoaded', function() {
-    // Flash messages auto-hide
-    const flashMessages = document.querySelectorAll('.flash');
-    flashMessages.forEach(message => {
-        setTimeout(() => {
-            message.style.opacity = '0';
-            setTimeout(() => message.remove(), 300);
-        }, 5000);
-    });
-
-    // Mobile menu toggle
-    const mobileMenuBtn = document.getElementById('mobileMenuBtn');
-    const navLinks = document.querySelector('.nav-links');
-    
-    if (mobileMenuBtn) {
-        mobileMenuBtn.addEventListener('click', () => {
-            navLinks.classList.toggle('active');
-        });
-    }
-
-    // Delete subject confirmation
-    const deleteButtons = document.querySelectorAll('.delete-subject');
-    deleteButtons.forEach(button => {
-        button.addEventListener('click', function(e) {
-            e.preventDefault();
-            const subjectName = this.getAttribute('data-subject-name');
-            
-            if (confirm(`Are you sure you want to delete "${subjectName}"? This will also delete all associated study sessions.`)) {
-                const subjectId = this.getAttribute('data-subject-id');
-                deleteSubject(subjectId);
-            }
-        });
-    });
-});
-
-async function deleteSubject(subjectId) {
-    try {
-        const response = await fetch(`/api/delete_subject/${subjectId}`, {
-            method: 'DELETE',
-            headers: {
-                'Content-Type': 'application/json',
-            }
-        });
-
-        const data = await response.json();
-        
-        if (data.success) {
-            // Remove subject card from DOM
-            const subjectCard = document.querySelector(`[data-subject-id="${subjectId}"]`).closest('.subject-card');
-            subjectCard.remove();
-            
-            showFlash('Subject deleted successfully', 'success');
-        } else {
-            showFlash('Error deleting subject', 'error');
-        }
-    } catch (error) {
-        console.error('Error:', error);
-        showFlash('Error deleting subject', 'error');
-    }
-}
-
-function showFlash(message, type) {
-    const flashContainer = document.querySelector('.flash-messages') || createFlashContainer();
-    
-    const flash = document.createElement('div');
-    flash.className = `flash ${type}`;
-    flash.textContent = message;
-    
-    flashContainer.appendChild(flash);
-    
-    setTimeout(() => {
-        flash.style.opacity = '0';
-        setTimeout(() => flash.remove(), 300);
-    }, 5000);
-}
-
-function createFlashContainer() {
-    const container = document.createElement('div');
-    container.className = 'flash-messages';
-    document.body.appendChild(container);
-    return container;
-}
-
-// Format time functions
-function formatTime(minutes) {
-    const hrs = Math.floor(minutes / 60);
-    const mins = minutes % 60;
-    
-    if (hrs > 0) {
-        return `${hrs}h ${mins}m`;
-    }
-    return `${mins}m`;
-}
-
-function formatMinutes(minutes) {
-    const hrs = Math.floor(minutes / 60);
-    const mins = minutes % 60;
-    
-    if (hrs > 0) {
-        return `${hrs}:${mins.toString().padStart(2, '0')}`;
-    }
-    return `0:${mins.toString().padStart(2, '0')}`;
+// Main JavaScript functionality
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Flash messages auto-hide
+    const flashMessages = document.querySelectorAll('.flash');
+    flashMessages.forEach(message => {
+        setTimeout(() => {
+            message.style.opacity = '0';
+            setTimeout(() => message.remove(), 300);
+        }, 5000);
+    });
+
+    // New accounts start in the browser's timezone (used for day boundaries)
+    const timezoneField = document.querySelector('input[type="hidden"][name="timezone"]');
+    if (timezoneField && !timezoneField.value && window.Intl) {
+        timezoneField.value = Intl.DateTimeFormat().resolvedOptions().timeZone || '';
+    }
+
+    // Mobile menu toggle
+    const mobileMenuBtn = document.getElementById('mobileMenuBtn');
+    const navLinks = document.querySelector('.nav-links');
+    
+    if (mobileMenuBtn) {
+        mobileMenuBtn.addEventListener('click', () => {
+            navLinks.classList.toggle('active');
+        });
+    }
+
+    // Study data import (settings page)
+    const importForm = document.getElementById('importForm');
+    if (importForm) {
+        importForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            importStudyData(this);
+        });
+    }
+
+    // Delete subject confirmation
+    const deleteButtons = document.querySelectorAll('.delete-subject');
+    deleteButtons.forEach(button => {
+        button.addEventListener('click', function(e) {
+            e.preventDefault();
+            const subjectName = this.getAttribute('data-subject-name');
+            
+            if (confirm(`Are you sure you want to delete "${subjectName}"? This will also delete all associated study sessions and goals.`)) {
+                const subjectId = this.getAttribute('data-subject-id');
+                deleteSubject(subjectId);
+            }
+        });
+    });
+
+    document.querySelectorAll('.delete-goal').forEach(button => {
+        button.addEventListener('click', function(e) {
+            e.preventDefault();
+            const goalTitle = this.getAttribute('data-goal-title');
+            
+            if (confirm(`Are you sure you want to delete the goal "${goalTitle}"?`)) {
+                deleteGoal(this.getAttribute('data-goal-id'));
+            }
+        });
+    });
+});
+
+async function importStudyData(form) {
+    const input = form.querySelector('input[type="file"]');
+    if (!input.files.length) {
+        showFlash('Choose a file to import', 'error');
+        return;
+    }
+
+    const body = new FormData();
+    body.append('file', input.files[0]);
+
+    try {
+        const response = await fetch('/api/import', { method: 'POST', body });
+        const data = await response.json();
+
+        if (data.success) {
+            showFlash(`Imported ${data.imported} session(s); ${data.duplicates} already present, ${data.rejected} rejected`, 'success');
+            form.reset();
+        } else {
+            showFlash(data.error || 'Error importing study data', 'error');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showFlash('Error importing study data', 'error');
+    }
+}
+
+async function deleteSubject(subjectId) {
+    try {
+        const response = await fetch(`/api/delete_subject/${subjectId}`, {
+            method: 'DELETE',
+            headers: {
+                'Content-Type': 'application/json',
+            }
+        });
+
+        const data = await response.json();
+        
+        if (data.success) {
+            // Remove subject card from DOM
+            const subjectCard = document.querySelector(`[data-subject-id="${subjectId}"]`).closest('.subject-card');
+            subjectCard.remove();
+            
+            showFlash('Subject deleted. Its study history is being removed in the background.', 'success');
+            watchJob(data.job_id, 'Study history of the deleted subject removed');
+        } else {
+            showFlash('Error deleting subject', 'error');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showFlash('Error deleting subject', 'error');
+    }
+}
+
+async function deleteGoal(goalId) {
+    try {
+        const response = await fetch(`/api/delete_goal/${goalId}`, { method: 'DELETE' });
+        const data = await response.json();
+        
+        if (data.success) {
+            document.querySelector(`[data-goal-id="${goalId}"]`).closest('.subject-card').remove();
+            showFlash('Goal deleted successfully', 'success');
+        } else {
+            showFlash('Error deleting goal', 'error');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showFlash('Error deleting goal', 'error');
+    }
+}
+
+async function watchJob(jobId, doneMessage, interval = 2000) {
+    // Poll a background job until it finishes
+    if (!jobId) return;
+    try {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const data = await response.json();
+        if (!data.success) return;
+        
+        if (data.job.status === 'done') {
+            showFlash(doneMessage, 'success');
+        } else if (data.job.status === 'failed') {
+            showFlash('Background cleanup failed', 'error');
+        } else {
+            setTimeout(() => watchJob(jobId, doneMessage, Math.min(interval * 2, 30000)), interval);
+        }
+    } catch (error) {
+        console.error('Error:', error);
+    }
+}
+
+function showFlash(message, type) {
+    const flashContainer = document.querySelector('.flash-messages') || createFlashContainer();
+    
+    const flash = document.createElement('div');
+    flash.className = `flash ${type}`;
+    flash.textContent = message;
+    
+    flashContainer.appendChild(flash);
+    
+    setTimeout(() => {
+        flash.style.opacity = '0';
+        setTimeout(() => flash.remove(), 300);
+    }, 5000);
+}
+
+function createFlashContainer() {
+    const container = document.createElement('div');
+    container.className = 'flash-messages';
+    document.body.appendChild(container);
+    return container;
+}
+
+// Format time functions
+function formatTime(minutes) {
+    const hrs = Math.floor(minutes / 60);
+    const mins = minutes % 60;
+    
+    if (hrs > 0) {
+        return `${hrs}h ${mins}m`;
+    }
+    return `${mins}m`;
+}
+
+function formatMinutes(minutes) {
+    const hrs = Math.floor(minutes / 60);
+    const mins = minutes % 60;
+    
+    if (hrs > 0) {
+        return `${hrs}:${mins.toString().padStart(2, '0')}`;
+    }
+    return `0:${mins.toString().padStart(2, '0')}`;
 }
\ No newline at end of file
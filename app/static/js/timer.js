@@ -1,337 +1,558 @@
-class StudyTimer {
-    constructor() {
-        this.isRunning = false;
-        this.timeLeft = 25 * 60; // 25 minutes in seconds
-        this.originalTime = 25 * 60;
-        this.interval = null;
-        this.selectedSubject = null;
-        this.startTime = null;
-        
-        this.initializeEventListeners();
-        this.updateDisplay();
-    }
-
-    initializeEventListeners() {
-        // Preset buttons
-        document.querySelectorAll('.preset-btn').forEach(btn => {
-            btn.addEventListener('click', (e) => {
-                const minutes = parseInt(e.target.dataset.minutes);
-                this.setTime(minutes);
-                this.updatePresetButtons(e.target);
-            });
-        });
-
-        // Control buttons
-        document.getElementById('startBtn').addEventListener('click', () => this.start());
-        document.getElementById('pauseBtn').addEventListener('click', () => this.pause());
-        document.getElementById('stopBtn').addEventListener('click', () => this.stop());
-
-        // Subject selection
-        const subjectSelect = document.getElementById('subjectSelect');
-        if (subjectSelect) {
-            subjectSelect.addEventListener('change', (e) => {
-                this.selectedSubject = e.target.value;
-            });
-        }
-
-        // Custom time input
-        const customTimeInput = document.getElementById('customTime');
-        if (customTimeInput) {
-            customTimeInput.addEventListener('change', (e) => {
-                const minutes = parseInt(e.target.value);
-                if (minutes > 0 && minutes <= 180) {
-                    this.setTime(minutes);
-                } else {
-                    alert('Please enter a time between 1 and 180 minutes');
-                    e.target.value = '';
-                }
-            });
-        }
-    }
-
-    setTime(minutes) {
-        this.timeLeft = minutes * 60;
-        this.originalTime = minutes * 60;
-        this.updateDisplay();
-        
-        // Update preset buttons
-        document.querySelectorAll('.preset-btn').forEach(btn => {
-            btn.classList.remove('active');
-            if (parseInt(btn.dataset.minutes) === minutes) {
-                btn.classList.add('active');
-            }
-        });
-    }
-
-    updatePresetButtons(activeBtn) {
-        document.querySelectorAll('.preset-btn').forEach(btn => {
-            btn.classList.remove('active');
-        });
-        activeBtn.classList.add('active');
-    }
-
-    start() {
-        if (!this.selectedSubject) {
-            alert('Please select a subject first!');
-            return;
-        }
-
-        if (!this.isRunning) {
-            this.isRunning = true;
-            this.startTime = new Date();
-            
-            this.interval = setInterval(() => {
-                this.timeLeft--;
-                this.updateDisplay();
-
-                if (this.timeLeft <= 0) {
-                    this.completeSession();
-                }
-            }, 1000);
-
-            document.getElementById('startBtn').style.display = 'none';
-            document.getElementById('pauseBtn').style.display = 'inline-flex';
-            
-            // Visual feedback
-            document.body.style.backgroundColor = '#f0f9ff';
-        }
-    }
-
-    pause() {
-        this.isRunning = false;
-        clearInterval(this.interval);
-        
-        document.getElementById('startBtn').style.display = 'inline-flex';
-        document.getElementById('pauseBtn').style.display = 'none';
-        
-        // Reset background
-        document.body.style.backgroundColor = '';
-    }
-
-    stop() {
-        this.isRunning = false;
-        clearInterval(this.interval);
-        
-        const minutesStudied = Math.round((this.originalTime - this.timeLeft) / 60);
-        
-        if (minutesStudied > 1) { // At least 1 minute studied
-            if (confirm(`Save ${minutesStudied} minutes of study time for this session?`)) {
-                this.saveSession(minutesStudied);
-            }
-        } else if (minutesStudied > 0) {
-            if (confirm(`Save ${minutesStudied} minute of study time?`)) {
-                this.saveSession(minutesStudied);
-            }
-        }
-        
-        this.reset();
-    }
-
-    completeSession() {
-        this.isRunning = false;
-        clearInterval(this.interval);
-        
-        const minutesStudied = this.originalTime / 60;
-        this.saveSession(minutesStudied);
-        this.reset();
-        
-        // Show completion alert with confetti effect
-        this.showCompletionAlert();
-    }
-
-    async saveSession(durationMinutes) {
-        try {
-            console.log('Saving session:', {
-                subject_id: this.selectedSubject,
-                duration: durationMinutes
-            });
-
-            const response = await fetch('/api/stop_timer', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    subject_id: this.selectedSubject,
-                    duration: Math.round(durationMinutes)
-                })
-            });
-
-            const data = await response.json();
-            
-            if (data.success) {
-                console.log('Study session saved successfully');
-                this.showNotification('Study session saved! 🎉', 'success');
-                
-                // Update dashboard stats if on dashboard page
-                if (typeof updateDashboardStats === 'function') {
-                    updateDashboardStats();
-                }
-            } else {
-                console.error('Error saving session:', data.error);
-                this.showNotification('Error saving session. Please try again.', 'error');
-            }
-        } catch (error) {
-            console.error('Error:', error);
-            this.showNotification('Network error. Please check your connection.', 'error');
-        }
-    }
-
-    showCompletionAlert() {
-        // Create a beautiful completion modal
-        const modal = document.createElement('div');
-        modal.style.cssText = `
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0,0,0,0.8);
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            z-index: 10000;
-        `;
-        
-        modal.innerHTML = `
-            <div style="background: white; padding: 2rem; border-radius: 12px; text-align: center; max-width: 400px;">
-                <div style="font-size: 4rem; margin-bottom: 1rem;">🎉</div>
-                <h2 style="color: #10B981; margin-bottom: 1rem;">Session Complete!</h2>
-                <p style="margin-bottom: 2rem; color: #6B7280;">Great job! You've completed your study session.</p>
-                <button onclick="this.closest('div').parentElement.remove()" 
-                        style="background: #6366F1; color: white; border: none; padding: 0.75rem 1.5rem; 
-                               border-radius: 8px; cursor: pointer; font-weight: 600;">
-                    Continue Studying
-                </button>
-            </div>
-        `;
-        
-        document.body.appendChild(modal);
-        
-        // Add confetti effect
-        this.createConfetti();
-    }
-
-    createConfetti() {
-        const confettiCount = 100;
-        const colors = ['#6366F1', '#8B5CF6', '#10B981', '#F59E0B', '#EF4444'];
-        
-        for (let i = 0; i < confettiCount; i++) {
-            const confetti = document.createElement('div');
-            confetti.style.cssText = `
-                position: fixed;
-                width: 10px;
-                height: 10px;
-                background: ${colors[Math.floor(Math.random() * colors.length)]};
-                top: -10px;
-                left: ${Math.random() * 100}vw;
-                border-radius: 2px;
-                z-index: 9999;
-                pointer-events: none;
-            `;
-            
-            document.body.appendChild(confetti);
-            
-            // Animate confetti
-            const animation = confetti.animate([
-                { transform: 'translateY(0) rotate(0deg)', opacity: 1 },
-                { transform: `translateY(${window.innerHeight}px) rotate(${360 + Math.random() * 360}deg)`, opacity: 0 }
-            ], {
-                duration: 1000 + Math.random() * 2000,
-                easing: 'cubic-bezier(0.1, 0.8, 0.2, 1)'
-            });
-            
-            animation.onfinish = () => confetti.remove();
-        }
-    }
-
-    showNotification(message, type) {
-        // Use existing flash message system or create a new one
-        const flashContainer = document.querySelector('.flash-messages') || this.createFlashContainer();
-        
-        const flash = document.createElement('div');
-        flash.className = `flash ${type}`;
-        flash.textContent = message;
-        flash.style.animation = 'slideIn 0.3s ease-out';
-        
-        flashContainer.appendChild(flash);
-        
-        setTimeout(() => {
-            flash.style.animation = 'slideOut 0.3s ease-in';
-            setTimeout(() => flash.remove(), 300);
-        }, 3000);
-    }
-
-    createFlashContainer() {
-        const container = document.createElement('div');
-        container.className = 'flash-messages';
-        container.style.cssText = `
-            position: fixed;
-            top: 80px;
-            right: 20px;
-            z-index: 1000;
-        `;
-        document.body.appendChild(container);
-        return container;
-    }
-
-    reset() {
-        this.timeLeft = this.originalTime;
-        this.isRunning = false;
-        this.startTime = null;
-        clearInterval(this.interval);
-        this.updateDisplay();
-        
-        document.getElementById('startBtn').style.display = 'inline-flex';
-        document.getElementById('pauseBtn').style.display = 'none';
-        
-        // Reset background
-        document.body.style.backgroundColor = '';
-    }
-
-    updateDisplay() {
-        const minutes = Math.floor(this.timeLeft / 60);
-        const seconds = this.timeLeft % 60;
-        
-        const timerDisplay = document.getElementById('timerDisplay');
-        if (timerDisplay) {
-            timerDisplay.textContent = 
-                `${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
-        }
-
-        // Update progress circle if exists
-        const progressCircle = document.querySelector('.progress-circle');
-        if (progressCircle) {
-            const circumference = 2 * Math.PI * 45;
-            const offset = circumference - (this.timeLeft / this.originalTime) * circumference;
-            progressCircle.style.strokeDashoffset = offset;
-        }
-    }
-}
-
-// Add CSS animations
-const style = document.createElement('style');
-style.textContent = `
-    @keyframes slideIn {
-        from { transform: translateX(100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-    
-    @keyframes slideOut {
-        from { transform: translateX(0); opacity: 1; }
-        to { transform: translateX(100%); opacity: 0; }
-    }
-    
-    .timer-active {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        transition: background 0.5s ease;
-    }
-`;
-document.head.appendChild(style);
-
-// Initialize timer when page loads
-document.addEventListener('DOMContentLoaded', function() {
-    if (document.getElementById('timerDisplay')) {
-        window.studyTimer = new StudyTimer();
-    }
+// Completed sessions waiting for upload. Kept in localStorage so they
+// survive reloads, network failures and offline periods.
+class SessionQueue {
+    constructor(storageKey = 'studymate.pendingSessions') {
+        this.storageKey = storageKey;
+        this.batchSize = 50;
+        this.flushing = null;
+    }
+
+    load() {
+        try {
+            return JSON.parse(localStorage.getItem(this.storageKey)) || [];
+        } catch (error) {
+            return [];
+        }
+    }
+
+    save(sessions) {
+        localStorage.setItem(this.storageKey, JSON.stringify(sessions));
+    }
+
+    get size() {
+        return this.load().length;
+    }
+
+    enqueue(subjectId, durationMinutes, clientId = null) {
+        const session = {
+            client_id: clientId || this.generateId(), // Idempotency key, stable across retries
+            subject_id: subjectId,
+            duration: Math.round(durationMinutes),
+            completed_at: new Date().toISOString()
+        };
+
+        const sessions = this.load();
+        sessions.push(session);
+        this.save(sessions);
+        return session;
+    }
+
+    generateId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+
+    // Only one upload runs at a time; callers share the in-flight one
+    flush() {
+        if (!this.flushing) {
+            this.flushing = this.upload().finally(() => {
+                this.flushing = null;
+            });
+        }
+        return this.flushing;
+    }
+
+    async upload() {
+        const accepted = new Set();
+        const rejected = new Set();
+        let pending = this.load();
+
+        while (pending.length) {
+            const batch = pending.slice(0, this.batchSize);
+            const response = await fetch('/api/sessions/bulk', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ sessions: batch })
+            });
+
+            if (!response.ok) {
+                throw new Error(`Upload failed with status ${response.status}`);
+            }
+
+            const data = await response.json();
+            data.accepted.forEach(id => accepted.add(id));
+            data.rejected.forEach(id => rejected.add(id));
+
+            // Re-read storage: more sessions may have been queued meanwhile
+            const settled = new Set([...accepted, ...rejected]);
+            this.save(this.load().filter(session => !settled.has(session.client_id)));
+            pending = this.load();
+
+            if (!batch.some(session => settled.has(session.client_id))) {
+                break;
+            }
+        }
+
+        return { accepted, rejected };
+    }
+}
+
+class StudyTimer {
+    constructor() {
+        this.isRunning = false;
+        this.timeLeft = 25 * 60; // 25 minutes in seconds
+        this.originalTime = 25 * 60;
+        this.interval = null;
+        this.selectedSubject = null;
+        this.startTime = null;
+        this.queue = new SessionQueue();
+        this.timerId = null; // Server-side timer, shared with other devices
+        this.heartbeat = null;
+        this.heartbeatSeconds = 30;
+        
+        this.initializeEventListeners();
+        this.updateDisplay();
+        
+        // Pick up a timer left running here or started on another device
+        this.restoreActiveTimer();
+        
+        // Upload anything left over from an earlier visit or lost connection
+        this.syncQueue();
+        window.addEventListener('online', () => this.syncQueue());
+        setInterval(() => this.syncQueue(), 60000);
+    }
+
+    initializeEventListeners() {
+        // Preset buttons
+        document.querySelectorAll('.preset-btn').forEach(btn => {
+            btn.addEventListener('click', (e) => {
+                const minutes = parseInt(e.target.dataset.minutes);
+                this.setTime(minutes);
+                this.updatePresetButtons(e.target);
+            });
+        });
+
+        // Control buttons
+        document.getElementById('startBtn').addEventListener('click', () => this.start());
+        document.getElementById('pauseBtn').addEventListener('click', () => this.pause());
+        document.getElementById('stopBtn').addEventListener('click', () => this.stop());
+
+        // Subject selection
+        const subjectSelect = document.getElementById('subjectSelect');
+        if (subjectSelect) {
+            subjectSelect.addEventListener('change', (e) => {
+                this.selectedSubject = e.target.value;
+            });
+        }
+
+        // Custom time input
+        const customTimeInput = document.getElementById('customTime');
+        if (customTimeInput) {
+            customTimeInput.addEventListener('change', (e) => {
+                const minutes = parseInt(e.target.value);
+                if (minutes > 0 && minutes <= 180) {
+                    this.setTime(minutes);
+                } else {
+                    alert('Please enter a time between 1 and 180 minutes');
+                    e.target.value = '';
+                }
+            });
+        }
+    }
+
+    setTime(minutes) {
+        this.timeLeft = minutes * 60;
+        this.originalTime = minutes * 60;
+        this.updateDisplay();
+        
+        // Update preset buttons
+        document.querySelectorAll('.preset-btn').forEach(btn => {
+            btn.classList.remove('active');
+            if (parseInt(btn.dataset.minutes) === minutes) {
+                btn.classList.add('active');
+            }
+        });
+    }
+
+    updatePresetButtons(activeBtn) {
+        document.querySelectorAll('.preset-btn').forEach(btn => {
+            btn.classList.remove('active');
+        });
+        activeBtn.classList.add('active');
+    }
+
+    start() {
+        if (!this.selectedSubject) {
+            alert('Please select a subject first!');
+            return;
+        }
+
+        if (!this.isRunning) {
+            this.startTime = new Date();
+            
+            // The same id resumes a paused timer; a fresh one starts a new timer.
+            // The server measures the duration, the countdown here is display only.
+            this.timerId = this.timerId || this.queue.generateId();
+            this.postTimer('/api/start_timer', {
+                timer_id: this.timerId,
+                subject_id: this.selectedSubject,
+                duration: Math.round(this.originalTime / 60)
+            }).then(result => {
+                if (result.ok) {
+                    this.heartbeatSeconds = result.data.timer.heartbeat_seconds;
+                }
+            }).catch(error => console.error('Could not register timer:', error));
+            
+            this.runClock();
+        }
+    }
+
+    runClock() {
+        this.isRunning = true;
+        this.interval = setInterval(() => {
+            this.timeLeft--;
+            this.updateDisplay();
+
+            if (this.timeLeft <= 0) {
+                this.completeSession();
+            }
+        }, 1000);
+        this.heartbeat = setInterval(() => this.sendHeartbeat(), this.heartbeatSeconds * 1000);
+
+        document.getElementById('startBtn').style.display = 'none';
+        document.getElementById('pauseBtn').style.display = 'inline-flex';
+        
+        // Visual feedback
+        document.body.style.backgroundColor = '#f0f9ff';
+    }
+
+    stopClock() {
+        this.isRunning = false;
+        clearInterval(this.interval);
+        clearInterval(this.heartbeat);
+    }
+
+    async postTimer(path, body) {
+        const response = await fetch(path, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body)
+        });
+        const data = response.status === 204 ? {} : await response.json();
+        return { ok: response.ok, status: response.status, data };
+    }
+
+    sendHeartbeat() {
+        if (!this.timerId || !navigator.onLine) return;
+        this.postTimer('/api/timer_heartbeat', { timer_id: this.timerId }).catch(() => {});
+    }
+
+    discardTimer() {
+        if (!this.timerId) return;
+        this.postTimer('/api/stop_timer', { timer_id: this.timerId, discard: true }).catch(() => {});
+    }
+
+    async restoreActiveTimer() {
+        let timer;
+        try {
+            const response = await fetch('/api/active_timer');
+            if (!response.ok) return;
+            timer = (await response.json()).timer;
+        } catch (error) {
+            return;
+        }
+        if (!timer || this.isRunning) return;
+
+        this.timerId = timer.timer_id;
+        this.selectedSubject = timer.subject_id;
+        const subjectSelect = document.getElementById('subjectSelect');
+        if (subjectSelect) {
+            subjectSelect.value = timer.subject_id;
+        }
+
+        if (timer.abandoned) {
+            // Only the time up to the last heartbeat counts
+            const minutes = Math.round(timer.elapsed_seconds / 60);
+            if (minutes > 0 && confirm(`You left a timer running. Save the ${minutes} minute(s) studied before it went idle?`)) {
+                this.saveSession(minutes);
+            } else {
+                this.discardTimer();
+            }
+            this.reset();
+            return;
+        }
+
+        this.heartbeatSeconds = timer.heartbeat_seconds;
+        this.setTime(timer.planned_minutes);
+        this.timeLeft = Math.max(this.originalTime - timer.elapsed_seconds, 0);
+        this.updateDisplay();
+        if (timer.running) {
+            this.runClock();
+        }
+    }
+
+    pause() {
+        this.stopClock();
+        if (this.timerId) {
+            this.postTimer('/api/pause_timer', { timer_id: this.timerId })
+                .catch(error => console.error('Could not pause timer:', error));
+        }
+        
+        document.getElementById('startBtn').style.display = 'inline-flex';
+        document.getElementById('pauseBtn').style.display = 'none';
+        
+        // Reset background
+        document.body.style.backgroundColor = '';
+    }
+
+    stop() {
+        this.stopClock();
+        
+        const minutesStudied = Math.round((this.originalTime - this.timeLeft) / 60);
+        let saved = false;
+        
+        if (minutesStudied > 1) { // At least 1 minute studied
+            saved = confirm(`Save ${minutesStudied} minutes of study time for this session?`);
+        } else if (minutesStudied > 0) {
+            saved = confirm(`Save ${minutesStudied} minute of study time?`);
+        }
+        
+        if (saved) {
+            this.saveSession(minutesStudied);
+        } else {
+            this.discardTimer();
+        }
+        this.reset();
+    }
+
+    completeSession() {
+        this.stopClock();
+        
+        const minutesStudied = this.originalTime / 60;
+        this.saveSession(minutesStudied);
+        this.reset();
+        
+        // Show completion alert with confetti effect
+        this.showCompletionAlert();
+    }
+
+    async saveSession(durationMinutes) {
+        // Read before the first await: reset() clears them right after
+        const timerId = this.timerId;
+        const subjectId = this.selectedSubject;
+
+        // The server saves the duration it measured for the timer
+        if (timerId) {
+            try {
+                const result = await this.postTimer('/api/stop_timer', { timer_id: timerId });
+                if (result.ok) {
+                    if (result.data.saved) {
+                        this.showNotification(`Study session saved (${result.data.duration_minutes} min)! 🎉`, 'success');
+                        if (typeof updateDashboardStats === 'function') {
+                            updateDashboardStats();
+                        }
+                    } else {
+                        this.showNotification('Less than a minute studied, nothing to save.', 'info');
+                    }
+                    return;
+                }
+            } catch (error) {
+                console.error('Error stopping timer:', error);
+            }
+        }
+
+        // Unknown to the server or offline: queue the local count under the
+        // timer's id, so a session the server did save is not stored twice
+        const queued = this.queue.enqueue(subjectId, durationMinutes, timerId);
+        console.log('Saving session:', queued);
+
+        try {
+            const result = await this.queue.flush();
+            
+            if (result.accepted.has(queued.client_id)) {
+                console.log('Study session saved successfully');
+                this.showNotification('Study session saved! 🎉', 'success');
+                
+                // Update dashboard stats if on dashboard page
+                if (typeof updateDashboardStats === 'function') {
+                    updateDashboardStats();
+                }
+            } else if (result.rejected.has(queued.client_id)) {
+                console.error('Error saving session: rejected by server');
+                this.showNotification('Error saving session. Please try again.', 'error');
+            } else {
+                this.showNotification('Session saved. It will sync shortly.', 'info');
+            }
+        } catch (error) {
+            console.error('Error:', error);
+            this.showNotification('You are offline. Session saved and will sync automatically.', 'info');
+        }
+    }
+
+    async syncQueue() {
+        if (!this.queue.size || !navigator.onLine) return;
+
+        try {
+            const result = await this.queue.flush();
+            if (result.accepted.size && typeof updateDashboardStats === 'function') {
+                updateDashboardStats();
+            }
+        } catch (error) {
+            console.error('Error syncing queued sessions:', error);
+        }
+    }
+
+    showCompletionAlert() {
+        // Create a beautiful completion modal
+        const modal = document.createElement('div');
+        modal.style.cssText = `
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0,0,0,0.8);
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            z-index: 10000;
+        `;
+        
+        modal.innerHTML = `
+            <div style="background: white; padding: 2rem; border-radius: 12px; text-align: center; max-width: 400px;">
+                <div style="font-size: 4rem; margin-bottom: 1rem;">🎉</div>
+                <h2 style="color: #10B981; margin-bottom: 1rem;">Session Complete!</h2>
+                <p style="margin-bottom: 2rem; color: #6B7280;">Great job! You've completed your study session.</p>
+                <button onclick="this.closest('div').parentElement.remove()" 
+                        style="background: #6366F1; color: white; border: none; padding: 0.75rem 1.5rem; 
+                               border-radius: 8px; cursor: pointer; font-weight: 600;">
+                    Continue Studying
+                </button>
+            </div>
+        `;
+        
+        document.body.appendChild(modal);
+        
+        // Add confetti effect
+        this.createConfetti();
+    }
+
+    createConfetti() {
+        const confettiCount = 100;
+        const colors = ['#6366F1', '#8B5CF6', '#10B981', '#F59E0B', '#EF4444'];
+        
+        for (let i = 0; i < confettiCount; i++) {
+            const confetti = document.createElement('div');
+            confetti.style.cssText = `
+                position: fixed;
+                width: 10px;
+                height: 10px;
+                background: ${colors[Math.floor(Math.random() * colors.length)]};
+                top: -10px;
+                left: ${Math.random() * 100}vw;
+                border-radius: 2px;
+                z-index: 9999;
+                pointer-events: none;
+            `;
+            
+            document.body.appendChild(confetti);
+            
+            // Animate confetti
+            const animation = confetti.animate([
+                { transform: 'translateY(0) rotate(0deg)', opacity: 1 },
+                { transform: `translateY(${window.innerHeight}px) rotate(${360 + Math.random() * 360}deg)`, opacity: 0 }
+            ], {
+                duration: 1000 + Math.random() * 2000,
+                easing: 'cubic-bezier(0.1, 0.8, 0.2, 1)'
+            });
+            
+            animation.onfinish = () => confetti.remove();
+        }
+    }
+
+    showNotification(message, type) {
+        // Use existing flash message system or create a new one
+        const flashContainer = document.querySelector('.flash-messages') || this.createFlashContainer();
+        
+        const flash = document.createElement('div');
+        flash.className = `flash ${type}`;
+        flash.textContent = message;
+        flash.style.animation = 'slideIn 0.3s ease-out';
+        
+        flashContainer.appendChild(flash);
+        
+        setTimeout(() => {
+            flash.style.animation = 'slideOut 0.3s ease-in';
+            setTimeout(() => flash.remove(), 300);
+        }, 3000);
+    }
+
+    createFlashContainer() {
+        const container = document.createElement('div');
+        container.className = 'flash-messages';
+        container.style.cssText = `
+            position: fixed;
+            top: 80px;
+            right: 20px;
+            z-index: 1000;
+        `;
+        document.body.appendChild(container);
+        return container;
+    }
+
+    reset() {
+        this.timeLeft = this.originalTime;
+        this.stopClock();
+        this.startTime = null;
+        this.timerId = null;
+        this.updateDisplay();
+        
+        document.getElementById('startBtn').style.display = 'inline-flex';
+        document.getElementById('pauseBtn').style.display = 'none';
+        
+        // Reset background
+        document.body.style.backgroundColor = '';
+    }
+
+    updateDisplay() {
+        const minutes = Math.floor(this.timeLeft / 60);
+        const seconds = this.timeLeft % 60;
+        
+        const timerDisplay = document.getElementById('timerDisplay');
+        if (timerDisplay) {
+            timerDisplay.textContent = 
+                `${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
+        }
+
+        // Update progress circle if exists
+        const progressCircle = document.querySelector('.progress-circle');
+        if (progressCircle) {
+            const circumference = 2 * Math.PI * 45;
+            const offset = circumference - (this.timeLeft / this.originalTime) * circumference;
+            progressCircle.style.strokeDashoffset = offset;
+        }
+    }
+}
+
+// Add CSS animations
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes slideIn {
+        from { transform: translateX(100%); opacity: 0; }
+        to { transform: translateX(0); opacity: 1; }
+    }
+    
+    @keyframes slideOut {
+        from { transform: translateX(0); opacity: 1; }
+        to { transform: translateX(100%); opacity: 0; }
+    }
+    
+    .timer-active {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        transition: background 0.5s ease;
+    }
+`;
+document.head.appendChild(style);
+
+// Initialize timer when page loads
+document.addEventListener('DOMContentLoaded', function() {
+    if (document.getElementById('timerDisplay')) {
+        window.studyTimer = new StudyTimer();
+    }
 });
\ No newline at end of file
@@ -0,0 +1,314 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.models import ActiveTimer
+
+logger = logging.getLogger(__name__)
+
+class LocalTimerStore:
+    # Active timers in a dict, private to one process. Fine for a single
+    # worker and for tests; same interface as the ActiveTimer model.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+
+    def start(self, timer):
+        with self._lock:
+            self._timers[timer['_id']] = dict(timer)
+        return timer
+
+    def get(self, user_id, now=None):
+        with self._lock:
+            timer = self._live(ObjectId(user_id), now or datetime.utcnow())
+            return dict(timer) if timer else None
+
+    def update(self, user_id, expected, changes):
+        with self._lock:
+            timer = self._timers.get(ObjectId(user_id))
+            if timer is None or any(timer.get(field) != value for field, value in expected.items()):
+                return None
+            timer.update(changes)
+            return dict(timer)
+
+    def touch_many(self, beats, ttl):
+        with self._lock:
+            for (user_id, timer_id), seen_at in beats.items():
+                timer = self._timers.get(ObjectId(user_id))
+                if timer is not None and timer['timer_id'] == timer_id:
+                    timer['last_seen'] = max(timer['last_seen'], seen_at)
+                    timer['expires_at'] = max(timer['expires_at'], seen_at + ttl)
+
+            # Stands in for the TTL index
+            now = datetime.utcnow()
+            for key in [key for key, timer in self._timers.items() if timer['expires_at'] <= now]:
+                del self._timers[key]
+
+    def claim(self, user_id, timer_id=None, now=None):
+        with self._lock:
+            timer = self._live(ObjectId(user_id), now or datetime.utcnow())
+            if timer is None or (timer_id is not None and timer['timer_id'] != timer_id):
+                return None
+            return self._timers.pop(timer['_id'])
+
+    def _live(self, key, now):
+        timer = self._timers.get(key)
+        if timer is not None and timer['expires_at'] <= now:
+            del self._timers[key]
+            return None
+        return timer
+
+class MongoTimerStore:
+    # Shared by every worker through the TTL-indexed active_timers collection
+
+    def __init__(self, mongo):
+        self.mongo = mongo
+
+    def start(self, timer):
+        return ActiveTimer.start(self.mongo.db, timer)
+
+    def get(self, user_id, now=None):
+        return ActiveTimer.get(self.mongo.db, user_id, now)
+
+    def update(self, user_id, expected, changes):
+        return ActiveTimer.update(self.mongo.db, user_id, expected, changes)
+
+    def touch_many(self, beats, ttl):
+        ActiveTimer.touch_many(self.mongo.db, beats, ttl)
+
+    def claim(self, user_id, timer_id=None, now=None):
+        return ActiveTimer.claim(self.mongo.db, user_id, timer_id, now)
+
+class TimerTracker:
+    # Server-side study timers, so a timer can be resumed on another device
+    # and its duration is measured here rather than trusted from the client.
+    #
+    # Clients heartbeat every TIMER_HEARTBEAT_SECONDS while a timer runs.
+    # Heartbeats are buffered in the process and written with one bulk_write
+    # at most every TIMER_HEARTBEAT_FLUSH_SECONDS, and each timer's heartbeat
+    # is persisted at most once per TIMER_HEARTBEAT_WRITE_SECONDS, so a worker
+    # writes about (running timers / write interval) updates per second no
+    # matter how often clients beat. A background thread flushes what is due
+    # every flush interval, so a beat reaches the store for other workers'
+    # reads and stops even if no later heartbeat comes to this process. A
+    # running timer with no heartbeat for
+    # TIMER_IDLE_SECONDS is abandoned: time after its last heartbeat is not
+    # counted.
+
+    def __init__(self):
+        self.store = LocalTimerStore()
+        self.heartbeat_interval = timedelta(seconds=30)
+        self.write_interval = timedelta(seconds=60)
+        self.flush_interval = timedelta(seconds=10)
+        self.idle_after = timedelta(seconds=180)
+        self.ttl = timedelta(hours=12)
+        self._lock = threading.Lock()
+        self._beats = {}
+        self._written = {}
+        self._last_flush = datetime.min
+        self._pid = None
+        self._flusher = None
+        self._metrics = {'heartbeats': 0, 'writes': 0, 'flushes': 0}
+
+    def init_app(self, app, mongo=None):
+        if app.config.get('TIMER_STORE', 'mongo') == 'local':
+            self.store = LocalTimerStore()
+        else:
+            self.store = MongoTimerStore(mongo)
+        self.heartbeat_interval = timedelta(seconds=app.config.get('TIMER_HEARTBEAT_SECONDS', 30))
+        self.write_interval = timedelta(seconds=app.config.get('TIMER_HEARTBEAT_WRITE_SECONDS', 60))
+        self.flush_interval = timedelta(seconds=app.config.get('TIMER_HEARTBEAT_FLUSH_SECONDS', 10))
+        # A stored last_seen may lag the latest heartbeat by one write and one
+        # flush interval; never call a timer idle inside that window
+        self.idle_after = max(timedelta(seconds=app.config.get('TIMER_IDLE_SECONDS', 180)),
+                              self.heartbeat_interval + self.write_interval + self.flush_interval)
+        self.ttl = timedelta(seconds=app.config.get('TIMER_TTL_SECONDS', 12 * 3600))
+        with self._lock:
+            self._beats = {}
+            self._written = {}
+            self._last_flush = datetime.min
+
+    def start(self, user_id, timer_id, subject_id, planned_minutes, now=None):
+        """Start or resume a timer; returns (timer, replaced).
+
+        replaced is another timer of the user that this one displaced (still
+        holding its elapsed time), or None.
+        """
+        now = now or datetime.utcnow()
+        current = self.get(user_id, now)
+        if current is not None and current['timer_id'] == timer_id:
+            return self.resume(user_id, timer_id, now), None
+
+        replaced = self.stop(user_id, now=now)[0] if current is not None else None
+        timer = self.store.start({
+            '_id': ObjectId(user_id),
+            'timer_id': timer_id,
+            'subject_id': ObjectId(subject_id),
+            'planned_minutes': planned_minutes,
+            'started_at': now,
+            'running_since': now,
+            'elapsed_seconds': 0,
+            'last_seen': now,
+            'expires_at': now + self.ttl
+        })
+        self._mark_written(user_id, timer_id, now)
+        return timer, replaced
+
+    def get(self, user_id, now=None):
+        timer = self.store.get(user_id, now)
+        if timer is not None:
+            # Heartbeats taken by this worker and not written yet
+            with self._lock:
+                pending = self._beats.get((str(user_id), timer['timer_id']))
+            if pending is not None and pending > timer['last_seen']:
+                timer['last_seen'] = pending
+        return timer
+
+    def heartbeat(self, user_id, timer_id, now=None):
+        # No read and usually no write: just remember the latest beat
+        now = now or datetime.utcnow()
+        key = (str(user_id), timer_id)
+        with self._lock:
+            self._beats[key] = max(self._beats.get(key, now), now)
+            self._metrics['heartbeats'] += 1
+        self._ensure_flusher()
+        self._flush(now)
+
+    def pause(self, user_id, timer_id, now=None):
+        now = now or datetime.utcnow()
+        timer = self.get(user_id, now)
+        if timer is None or timer['timer_id'] != timer_id:
+            return None
+        if timer['running_since'] is None:
+            return timer
+
+        updated = self.store.update(user_id, {'timer_id': timer_id, 'running_since': timer['running_since']}, {
+            'elapsed_seconds': self.elapsed_seconds(timer, now),
+            'running_since': None,
+            'last_seen': now,
+            'expires_at': now + self.ttl
+        })
+        self._mark_written(user_id, timer_id, now)
+        return updated or self.get(user_id, now)
+
+    def resume(self, user_id, timer_id, now=None):
+        now = now or datetime.utcnow()
+        updated = self.store.update(user_id, {'timer_id': timer_id, 'running_since': None}, {
+            'running_since': now,
+            'last_seen': now,
+            'expires_at': now + self.ttl
+        })
+        self._mark_written(user_id, timer_id, now)
+        return updated or self.get(user_id, now)
+
+    def stop(self, user_id, timer_id=None, now=None):
+        """Remove the timer; returns (timer, elapsed_seconds) or (None, 0)"""
+        now = now or datetime.utcnow()
+        timer = self.store.claim(user_id, timer_id, now)
+        if timer is None:
+            return None, 0
+
+        key = (str(user_id), timer['timer_id'])
+        with self._lock:
+            pending = self._beats.pop(key, None)
+            self._written.pop(key, None)
+        if pending is not None and pending > timer['last_seen']:
+            timer['last_seen'] = pending
+        return timer, self.elapsed_seconds(timer, now)
+
+    def elapsed_seconds(self, timer, now=None):
+        # Paused time never counts, nor running time after the last heartbeat
+        # of an abandoned timer, nor anything past the planned length
+        now = now or datetime.utcnow()
+        seconds = timer['elapsed_seconds']
+        if timer['running_since'] is not None:
+            end = min(now, timer['last_seen'] + self.idle_after)
+            seconds += max((end - timer['running_since']).total_seconds(), 0)
+        if timer.get('planned_minutes'):
+            seconds = min(seconds, timer['planned_minutes'] * 60)
+        return int(seconds)
+
+    def is_abandoned(self, timer, now=None):
+        now = now or datetime.utcnow()
+        return timer['running_since'] is not None and now - timer['last_seen'] > self.idle_after
+
+    def describe(self, timer, now=None):
+        """JSON-ready view of a timer for the client"""
+        now = now or datetime.utcnow()
+        return {
+            'timer_id': timer['timer_id'],
+            'subject_id': str(timer['subject_id']),
+            'planned_minutes': timer['planned_minutes'],
+            'elapsed_seconds': self.elapsed_seconds(timer, now),
+            'running': timer['running_since'] is not None,
+            'abandoned': self.is_abandoned(timer, now),
+            'started_at': timer['started_at'].isoformat() + 'Z',
+            'heartbeat_seconds': int(self.heartbeat_interval.total_seconds())
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._beats),
+                'heartbeats': self._metrics['heartbeats'],
+                'writes': self._metrics['writes'],
+                'flushes': self._metrics['flushes']
+            }
+
+    def _mark_written(self, user_id, timer_id, now):
+        # Starting, pausing or resuming just stored last_seen
+        with self._lock:
+            self._written[(str(user_id), timer_id)] = now
+
+    def _ensure_flusher(self):
+        # Started lazily (and again in a forked child) so every worker
+        # process flushes its own buffer
+        pid = os.getpid()
+        if self._pid == pid and self._flusher and self._flusher.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == pid and self._flusher and self._flusher.is_alive():
+                return
+            self._pid = pid
+            self._flusher = threading.Thread(target=self._run, name='timer-heartbeats', daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval.total_seconds())
+            self._flush(datetime.utcnow())
+
+    def _flush(self, now):
+        # Called from heartbeat() and the flusher thread, at most once per
+        # flush interval per process
+        with self._lock:
+            if now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+            due = {}
+            for key in list(self._beats):
+                if now - self._written.get(key, datetime.min) >= self.write_interval:
+                    due[key] = self._beats.pop(key)
+                    self._written[key] = now
+            # Older write times no longer hold anything back
+            self._written = {key: at for key, at in self._written.items() if now - at < self.write_interval}
+
+        if not due:
+            return
+        try:
+            self.store.touch_many(due, self.ttl)
+        except Exception:
+            logger.exception('Failed to write %d timer heartbeat(s)', len(due))
+            with self._lock:
+                for key, seen_at in due.items():
+                    self._beats[key] = max(self._beats.get(key, seen_at), seen_at)
+                    self._written.pop(key, None)
+            return
+
+        with self._lock:
+            self._metrics['writes'] += len(due)
+            self._metrics['flushes'] += 1
@@ -0,0 +1,90 @@
+import csv
+import hashlib
+import io
+import json
+
+# Study history export/import formats, shared by /api/export and /api/import
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+EXPORT_COLUMNS = ['id', 'start_time', 'date', 'subject_id', 'subject', 'duration_minutes']
+
+def export_rows(cursor, subject_names):
+    """One flat dict per session document, in EXPORT_COLUMNS order"""
+    for doc in cursor:
+        yield {
+            'id': str(doc['_id']),
+            'start_time': doc['start_time'].isoformat() + 'Z',
+            'date': doc['start_time'].strftime('%Y-%m-%d'),
+            'subject_id': str(doc['subject_id']),
+            'subject': subject_names.get(doc['subject_id'], ''),
+            'duration_minutes': doc['duration_minutes']
+        }
+
+def stream_export(rows, fmt, chunk_rows=500):
+    """Serialize rows as CSV or NDJSON, yielding one chunk per chunk_rows rows"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS)
+        writer.writeheader()
+        for n, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if n % chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def detect_format(requested, filename, mimetype):
+    # Explicit ?format= wins, then the file extension, then the content type
+    if requested:
+        return requested if requested in FORMATS else None
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return 'csv' if mimetype in ('text/csv', 'application/csv') else None
+
+def read_rows(stream, fmt):
+    """Yield (line_number, row) from a binary stream, one row at a time.
+
+    row is a dict, or None for an NDJSON line that is not a JSON object.
+    Decoding errors propagate as UnicodeDecodeError / csv.Error.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for n, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield n, row if isinstance(row, dict) else None
+
+def import_key(start_time, subject_id, duration, source_id=None):
+    # Stable client_id for an imported row, so importing a file twice is a
+    # no-op: the exported session id when the row has one, else its content
+    if source_id:
+        return f'import-{source_id}'
+    digest = hashlib.sha1(f'{start_time}|{subject_id}|{duration}'.encode('utf-8')).hexdigest()
+    return f'import-{digest}'
@@ -1,11 +1,130 @@
-import os
-from datetime import timedelta
-
-class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
-    
-    # FIX: Flask-PyMongo requires MONGO_URI, not MONGODB_URI
-    MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/studymate'
-    
-    SESSION_PERMANENT = True
-    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+import os
+from datetime import timedelta
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
+    
+    # FIX: Flask-PyMongo requires MONGO_URI, not MONGODB_URI
+    MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/studymate'
+    
+    # Connection pool per worker process. Requests wait at most
+    # MONGO_WAIT_QUEUE_TIMEOUT_MS for a free connection before failing fast.
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE') or 50)
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE') or 0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS') or 2000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS') or 5000)
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS') or 5000)
+    MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS') or 0)  # 0 = no timeout
+    # Wire compression, e.g. 'zstd,snappy,zlib' (zstd/snappy need extra packages)
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS') or ''
+    MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE') or 'primary'
+    # Progress page, dashboard stats and /api/analytics tolerate replication lag
+    MONGO_ANALYTICS_READ_PREFERENCE = os.environ.get('MONGO_ANALYTICS_READ_PREFERENCE') or 'secondaryPreferred'
+    
+    SESSION_PERMANENT = True
+    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    
+    # Dashboard push updates: 'local' fans out within one process only,
+    # 'mongo' uses a change stream so every worker sees every event
+    EVENT_BROKER = os.environ.get('EVENT_BROKER') or 'local'
+    SSE_KEEPALIVE_SECONDS = 15
+    
+    # Per-user subject cache; set SUBJECT_CACHE_URL (redis://...) to share
+    # it between workers so invalidations are seen everywhere (needs `redis`)
+    SUBJECT_CACHE_ENABLED = True
+    SUBJECT_CACHE_SIZE = 1024
+    SUBJECT_CACHE_TTL = 300
+    SUBJECT_CACHE_URL = os.environ.get('SUBJECT_CACHE_URL')
+    
+    # Study session writes: 'sync' inserts on the request thread, 'batched'
+    # spools to disk and flushes in bulk by size or time window
+    INGEST_MODE = os.environ.get('INGEST_MODE') or 'sync'
+    INGEST_BATCH_SIZE = 500
+    INGEST_FLUSH_INTERVAL = 1.0  # seconds
+    INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR')  # defaults to <instance>/spool
+    INGEST_SPOOL_FSYNC = True
+    
+    # /api/analytics: longest range in buckets, aggregation cursor batch size,
+    # and the per-process cache of closed (past) periods
+    ANALYTICS_MAX_PERIODS = 1000
+    ANALYTICS_BATCH_SIZE = 500
+    ANALYTICS_CACHE_ENABLED = True
+    ANALYTICS_CACHE_SIZE = 256  # user x bucket entries
+    ANALYTICS_CACHE_TTL = 3600
+    
+    # Server-side timers: 'mongo' (active_timers, shared by all workers) or
+    # 'local' (one process). Clients heartbeat every TIMER_HEARTBEAT_SECONDS;
+    # a timer's heartbeat is written at most once per
+    # TIMER_HEARTBEAT_WRITE_SECONDS, batched every TIMER_HEARTBEAT_FLUSH_SECONDS.
+    # Running time after TIMER_IDLE_SECONDS without a heartbeat is not counted,
+    # and timers untouched for TIMER_TTL_SECONDS are deleted.
+    TIMER_STORE = os.environ.get('TIMER_STORE') or 'mongo'
+    TIMER_HEARTBEAT_SECONDS = 30
+    TIMER_HEARTBEAT_WRITE_SECONDS = 60
+    TIMER_HEARTBEAT_FLUSH_SECONDS = 10
+    TIMER_IDLE_SECONDS = 180
+    TIMER_TTL_SECONDS = 12 * 3600
+    
+    # Background jobs (deleted subject cleanup): 'thread' runs them in every
+    # web worker, 'none' only in `python -m app.run_jobs`. Each batch touches
+    # at most JOBS_BATCH_SIZE documents, with a pause between batches; a job
+    # whose worker stops renewing its lease is picked up by another worker.
+    JOBS_WORKER = os.environ.get('JOBS_WORKER') or 'thread'
+    JOBS_BATCH_SIZE = 500
+    JOBS_BATCH_PAUSE_SECONDS = 0.05
+    JOBS_POLL_SECONDS = 5
+    JOBS_LEASE_SECONDS = 60
+    JOBS_MAX_ATTEMPTS = 5
+    # 'delete' removes a deleted subject's sessions and goals; 'archive'
+    # moves them to study_sessions_archive / goals_archive
+    SUBJECT_DELETE_MODE = os.environ.get('SUBJECT_DELETE_MODE') or 'delete'
+    
+    # Static assets: `python -m app.build_assets` bundles, minifies and fingerprints
+    # CSS/JS into app/static/dist with .gz (and, with `brotli`, .br) variants;
+    # templates link them with asset_url(). Set ASSETS_URL to the CDN or
+    # proxy location serving app/static (e.g. nginx gzip_static/brotli_static)
+    # so workers serve no static bytes. By default the app builds at startup
+    # when sources changed and serves the files itself, marked immutable.
+    ASSETS_URL = os.environ.get('ASSETS_URL')  # e.g. https://cdn.example.com/static
+    ASSETS_BUILD_ON_START = True
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+    
+    # Entries shown on the leaderboard page (the API allows up to 100)
+    LEADERBOARD_SIZE = 10
+    
+    # /api/export reads and /api/import writes in batches of this many sessions
+    EXPORT_BATCH_SIZE = 1000
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_BYTES = 50 * 1024 * 1024
+    
+    # Largest number of queued sessions accepted by /api/sessions/bulk
+    BULK_SESSIONS_MAX = 100
+    
+    # Password hashing runs in its own process pool (0 = on the request
+    # thread). Changing BCRYPT_ROUNDS rehashes each password at next login.
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS') or 12)
+    BCRYPT_POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE') or 2)
+    BCRYPT_MAX_PENDING = 16  # queued + running hashes before refusing new ones
+    BCRYPT_TIMEOUT = 10  # seconds
+    LOGIN_MAX_CONCURRENT_PER_IP = 4
+    LOGIN_MAX_CONCURRENT_PER_EMAIL = 1
+    
+    # Opt-in per-request profiling: /metrics (Prometheus), Server-Timing
+    # headers, and a logged command list for requests over the threshold.
+    # Without INSTRUMENTATION_METRICS_TOKEN, /metrics answers only localhost.
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    INSTRUMENTATION_SLOW_REQUEST_MS = int(os.environ.get('INSTRUMENTATION_SLOW_REQUEST_MS') or 500)
+    INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN')
+    
+    # Serving (run.py / gunicorn.conf.py): 'dev' is the Flask debug server,
+    # 'threaded' uses one thread per request, 'gevent' monkey-patches so a
+    # process holds thousands of concurrent requests and dashboard streams
+    SERVER_MODE = os.environ.get('SERVER_MODE') or 'dev'
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 5000)
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 2)  # gunicorn processes
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 8)  # per 'threaded' worker
+    SERVER_GEVENT_CONNECTIONS = int(os.environ.get('SERVER_GEVENT_CONNECTIONS') or 1000)  # per 'gevent' worker
+    # Each open dashboard stream holds a whole thread outside gevent, so by
+    # default only gevent serves them; other modes poll /api/dashboard_stats
+    SSE_ENABLED = (os.environ.get('SSE_ENABLED') or str(SERVER_MODE == 'gevent')).lower() in ('1', 'true', 'yes')
@@ -0,0 +1,28 @@
+# Multi-process production serving: gunicorn -c gunicorn.conf.py
+# SERVER_MODE picks the worker class ('gevent' or threaded 'gthread').
+import os
+
+if os.environ.get('SERVER_MODE') == 'gevent':
+    # The app is preloaded in the master, so patch before it (or anything
+    # else) imports socket, ssl or threading; the worker's own patching
+    # comes too late for that
+    from gevent import monkey
+    monkey.patch_all()
+
+from config import Config
+
+wsgi_app = 'run:app'
+bind = f'{Config.SERVER_HOST}:{Config.SERVER_PORT}'
+workers = Config.SERVER_WORKERS
+
+if Config.SERVER_MODE == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = Config.SERVER_GEVENT_CONNECTIONS
+else:
+    worker_class = 'gthread'
+    threads = Config.SERVER_THREADS
+
+# Load the app once in the master; each worker reconnects to Mongo after fork
+preload_app = True
+# Open dashboard streams are cut on restart; clients reconnect on their own
+graceful_timeout = 10
@@ -1,6 +1,26 @@
-from app import create_app
-
-app = create_app()
-
-if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+from config import Config
+
+if __name__ == '__main__' and Config.SERVER_MODE == 'gevent':
+    # Must happen before anything imports socket, ssl or threading. Under
+    # gunicorn, gunicorn.conf.py does this before the app is preloaded.
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import create_app
+
+app = create_app()
+
+def serve(mode=Config.SERVER_MODE, host=Config.SERVER_HOST, port=Config.SERVER_PORT):
+    if mode == 'gevent':
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        print(f"Serving on http://{host}:{port} (gevent, up to {Config.SERVER_GEVENT_CONNECTIONS} connections)")
+        WSGIServer((host, port), app, spawn=Pool(Config.SERVER_GEVENT_CONNECTIONS)).serve_forever()
+    elif mode == 'threaded':
+        print(f"Serving on http://{host}:{port} (one thread per request)")
+        app.run(host=host, port=port, threaded=True, debug=False, use_reloader=False)
+    else:
+        app.run(debug=True, host=host, port=port)
+
+if __name__ == '__main__':
+    serve()